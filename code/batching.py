@@ -0,0 +1,289 @@
+import abc
+import asyncio
+import json
+import os
+from cache_utils import ResponseCache, request_key
+from llm_utils import LOCAL_BASE_URL, get_client
+from usage_utils import TokenUsage
+from replay import OFFLINE_MODEL_TYPES
+from tracing import annotate, detach
+
+# Limits of a single batch accepted by the OpenAI Batch API.
+MAX_BATCH_REQUESTS = 50000
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_BATCH_STATES = ["completed", "failed", "expired", "cancelled"]
+
+
+class BatchRequestError(RuntimeError):
+    """
+    Raised to the callers of prompts whose batch requests still failed after the last resubmission.
+    """
+
+
+class PromptCollector(abc.ABC):
+    """
+    Async model interface that gathers prompts from concurrently running problems into waves.
+
+    Every coroutine that calls get_output waits on a shared future. Once no new prompt has
+    arrived for `settle_ticks` event-loop iterations and `idle_window` seconds (i.e. every
+    problem is blocked on the model), the pending prompts are dispatched together as one
+    wave. Problems that advance in lock step therefore hit the model one stage at a time:
+    all agent extractions, then all question simplifications, and so on. Subclasses
+    implement dispatch().
+    """
+    def __init__(self, model_name: str, temperature: float = 0.0, model_type: str = "openai", cache: ResponseCache | None = None, idle_window: float = 0.1, settle_ticks: int = 10):
+        self.model_name = model_name
+        self.model_type = model_type
+        self.temperature = temperature
+        self.cache = cache
+        self.idle_window = idle_window
+        self.settle_ticks = settle_ticks
+        self.pending = {}
+        self.stages = {}
+        self.formats = {}
+        self.arrivals = 0
+        self.last_arrival = 0.0
+        self.flusher = None
+        self.wave_sizes = []
+
+    async def get_output(self, prompt: str, retry_count=10, stage: str | None = None, response_format: dict | None = None) -> str:
+        key = None
+        if self.cache is not None and self.temperature == 0:
+            key = request_key(self.model_name, self.model_type, self.temperature, prompt, *([response_format] if response_format else []))
+            cached = self.cache.get(key)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return cached
+        loop = asyncio.get_running_loop()
+        future = self.pending.get(prompt)
+        if future is None:
+            # Identical prompts in the same wave are sent once (a prompt is always sent with the same format).
+            future = loop.create_future()
+            self.pending[prompt] = future
+            self.stages[prompt] = stage
+            self.formats[prompt] = response_format
+        self.arrivals += 1
+        self.last_arrival = loop.time()
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self.flush_loop())
+        output = await asyncio.shield(future)
+        if key is not None and output is not None:
+            self.cache.put(key, output)
+        return output
+
+    async def flush_loop(self) -> None:
+        # The flusher starts inside whichever problem's span first filled a wave, but serves them all.
+        detach()
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            await self.wait_until_settled(loop)
+            wave, self.pending = self.pending, {}
+            wave_stages, self.stages = self.stages, {}
+            wave_formats, self.formats = self.formats, {}
+            prompts = list(wave)
+            self.wave_sizes.append(len(prompts))
+            try:
+                outputs = await self.dispatch(prompts, [wave_stages.get(prompt) for prompt in prompts], [wave_formats.get(prompt) for prompt in prompts])
+            except Exception as e:
+                for future in wave.values():
+                    future.set_exception(e)
+                continue
+            for prompt, output in zip(prompts, outputs):
+                if isinstance(output, Exception):
+                    wave[prompt].set_exception(output)
+                else:
+                    wave[prompt].set_result(output)
+
+    async def wait_until_settled(self, loop) -> None:
+        """
+        Return once no prompt has arrived for `settle_ticks` loop iterations and `idle_window` seconds.
+
+        Problems that were just handed their outputs need a few loop iterations to reach
+        their next model call, so the tick count keeps a wave from being cut short without
+        adding wall-clock delay.
+        """
+        while True:
+            seen = self.arrivals
+            for _ in range(self.settle_ticks):
+                await asyncio.sleep(0)
+            idle = loop.time() - self.last_arrival
+            if self.arrivals != seen:
+                continue
+            if idle >= self.idle_window:
+                return
+            await asyncio.sleep(self.idle_window - idle)
+
+    @abc.abstractmethod
+    async def dispatch(self, prompts: list, stages: list, formats: list) -> list:
+        """
+        Send one wave of prompts.
+
+        :param prompts: Distinct prompts collected in this wave.
+        :param stages: Pipeline stage of each prompt (of its first caller, for duplicates).
+        :param formats: Response format of each prompt, or None.
+        :return: One output per prompt (None, or the raised exception, for prompts that failed).
+        """
+
+    def stats(self) -> dict:
+        return {
+            "waves": len(self.wave_sizes),
+            "requests": sum(self.wave_sizes),
+            "mean_wave_size": (sum(self.wave_sizes) / len(self.wave_sizes)) if self.wave_sizes else 0,
+        }
+
+
+class WavefrontLanguageModel(PromptCollector):
+    """
+    Online backend that sends each wave as one concurrent request set.
+
+    Every problem advances one stage at a time, so the server sees a burst of prompts of the
+    same kind (all agent extractions, then all question simplifications, then sentence i of
+    every story) that share long prefixes. Prompts are sent in sorted order so requests with
+    a common prefix are adjacent, which keeps the batch occupancy and prefix-cache reuse of
+    a local sglang/vLLM server high.
+    """
+    def __init__(self, model, idle_window: float = 0.0, settle_ticks: int = 10):
+        """
+        :param model: AsyncLanguageModel used to send the requests (its cache, semaphore and rate limiter apply).
+        """
+        super().__init__(model.model_name, temperature=model.temperature, model_type=model.model_type, idle_window=idle_window, settle_ticks=settle_ticks)
+        self.model = model
+
+    async def dispatch(self, prompts: list, stages: list, formats: list) -> list:
+        order = sorted(range(len(prompts)), key=lambda i: prompts[i])
+        outputs = await asyncio.gather(*[self.model.get_output(prompts[i], stage=stages[i], response_format=formats[i]) for i in order], return_exceptions=True)
+        results = [None] * len(prompts)
+        for i, output in zip(order, outputs):
+            results[i] = output
+        return results
+
+
+class BatchLanguageModel(PromptCollector):
+    """
+    Offline backend that submits each wave of prompts through the Batch API.
+
+    Each wave is written to a JSONL batch file under `batch_dir`, uploaded, and polled
+    until the batch finishes. Submitted batch ids are recorded in a manifest keyed by the
+    wave contents, so a restarted run re-attaches to batches that are still in progress
+    instead of paying for them twice. Requests that fail inside a batch are resubmitted
+    up to `max_batch_retries` times.
+    """
+    def __init__(self, model_name: str, api_key=None, temperature: float = 0.0, model_type: str = "openai", cache: ResponseCache | None = None,
+                 batch_dir: str = "../results/batches", poll_interval: float = 30.0, completion_window: str = "24h",
+                 base_url: str | None = None, idle_window: float = 0.1, max_batch_retries: int = 2, usage: TokenUsage | None = None):
+        if model_type in OFFLINE_MODEL_TYPES:
+            raise ValueError(f"The Batch API needs an endpoint; use model_type 'local' with stub_server.py instead of '{model_type}'")
+        super().__init__(model_name, temperature=temperature, model_type=model_type, cache=cache, idle_window=idle_window)
+        self.usage = usage if usage is not None else TokenUsage()
+        if api_key == None:
+            api_key = os.getenv("OPENAI_API_KEY") if model_type == "openai" else "token123"
+        if base_url is None and model_type == "local":
+            base_url = LOCAL_BASE_URL
+        self.client = get_client(api_key, base_url=base_url, use_async=True)
+        self.batch_dir = batch_dir
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_batch_retries = max_batch_retries
+        os.makedirs(batch_dir, exist_ok=True)
+        self.manifest_path = os.path.join(batch_dir, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def save_manifest(self) -> None:
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    async def dispatch(self, prompts: list, stages: list, formats: list) -> list:
+        results = {}
+        remaining = list(range(len(prompts)))
+        custom_ids = {}
+        for attempt in range(self.max_batch_retries + 1):
+            if not remaining:
+                break
+            chunks = [remaining[i:i + MAX_BATCH_REQUESTS] for i in range(0, len(remaining), MAX_BATCH_REQUESTS)]
+            custom_ids = {index: str(n) if len(chunks) == 1 else f"{n} (batch {chunk_number + 1})" for chunk_number, chunk in enumerate(chunks) for n, index in enumerate(chunk)}
+            outputs = await asyncio.gather(*[self.run_batch([(i, prompts[i]) for i in chunk], stages, formats) for chunk in chunks])
+            for output in outputs:
+                results.update(output)
+            remaining = [i for i in remaining if i not in results]
+            if remaining:
+                print(f"Batch attempt {attempt + 1}: {len(remaining)} requests failed.")
+        if remaining:
+            # Fail the waiting callers here rather than hand them None to trip over later.
+            failed = ", ".join(custom_ids[i] for i in remaining)
+            error = BatchRequestError(f"{len(remaining)} batch requests failed after {self.max_batch_retries + 1} attempts; custom_id in the last attempt: {failed}")
+            for i in remaining:
+                results[i] = error
+        return [results[i] for i in range(len(prompts))]
+
+    def write_batch_file(self, wave_key: str, items: list, formats: list | None = None) -> str:
+        path = os.path.join(self.batch_dir, f"{wave_key[:16]}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for n, (index, prompt) in enumerate(items):
+                request = {
+                    "custom_id": str(n),
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {
+                        "model": self.model_name,
+                        "messages": [{"role": "system", "content": prompt}],
+                        "temperature": self.temperature,
+                    },
+                }
+                if formats and formats[index]:
+                    request["body"]["response_format"] = formats[index]
+                f.write(json.dumps(request) + "\n")
+        return path
+
+    async def run_batch(self, items: list, stages: list | None = None, formats: list | None = None) -> dict:
+        """
+        Submit (or re-attach to) one batch and collect its successful outputs.
+
+        :param items: (index, prompt) pairs.
+        :param stages: Pipeline stage of each prompt of the wave, by index, for usage attribution.
+        :param formats: Response format of each prompt of the wave, by index, or None.
+        :return: Mapping of index to output for requests that succeeded.
+        """
+        wave_formats = [formats[i] for i, _ in items] if formats and any(formats) else []
+        wave_key = request_key("batch", self.model_name, self.temperature, [prompt for _, prompt in items], *([wave_formats] if wave_formats else []))
+        batch_id = self.manifest.get(wave_key)
+        if batch_id is None:
+            path = self.write_batch_file(wave_key, items, formats)
+            with open(path, "rb") as f:
+                batch_file = await self.client.files.create(file=f, purpose="batch")
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=self.completion_window,
+            )
+            batch_id = batch.id
+            self.manifest[wave_key] = batch_id
+            self.save_manifest()
+
+        batch = await self.client.batches.retrieve(batch_id)
+        while batch.status not in FINAL_BATCH_STATES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch_id)
+
+        outputs = {}
+        if batch.output_file_id:
+            content = await self.client.files.content(batch.output_file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                index = items[int(record["custom_id"])][0]
+                self.usage.record(response["body"].get("usage"), stage=stages[index] if stages else None, model=self.model_name, batch=True)
+                outputs[index] = response["body"]["choices"][0]["message"]["content"]
+        if len(outputs) < len(items):
+            # Forget the batch so the failed requests are resubmitted rather than re-read.
+            self.manifest.pop(wave_key, None)
+            self.save_manifest()
+        return outputs
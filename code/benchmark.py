@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import random
+import threading
+import time
+from llm_utils import LanguageModel, AsyncLanguageModel
+from rate_limit import CHARS_PER_TOKEN
+from batching import WavefrontLanguageModel
+from new_decompose import TheoryOfMindSystem
+from cache_utils import VisibilityCache
+from decision_rules import get_decision_rules, format_decision_rules
+from dataset_utils import HitomDataset, run_bounded, run_bounded_async
+from result_log import write_json_atomic
+
+# Counts compared against a baseline; latencies are reported but too noisy to gate on.
+COMPARED_FIELDS = ["calls", "prompt_tokens", "completion_tokens"]
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    :param values: Samples (need not be sorted).
+    :param q: Percentile between 0 and 100.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+class BenchmarkStats:
+    """
+    Thread-safe per-stage and per-bucket counters of the calls made by TheoryOfMindSystem.
+
+    Token counts are estimated from prompt and response length (CHARS_PER_TOKEN characters per
+    token), so a baseline does not depend on which backend or tokenizer served the run.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = collections.defaultdict(self.new_counter)
+        self.buckets = collections.defaultdict(self.new_counter)
+        self.problem_seconds = collections.defaultdict(list)
+
+    @staticmethod
+    def new_counter() -> dict:
+        return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": []}
+
+    def add(self, bucket: str, record: dict) -> None:
+        """
+        :param bucket: Order/length bucket of the problem that made the call.
+        :param record: Trace record of one call (see TheoryOfMindSystem.trace_call).
+        """
+        prompt_tokens = len(record["prompt"]) // CHARS_PER_TOKEN
+        completion_tokens = len(record["response"] or "") // CHARS_PER_TOKEN
+        with self.lock:
+            for counter in (self.stages[record["stage"]], self.buckets[bucket]):
+                counter["calls"] += 1
+                counter["prompt_tokens"] += prompt_tokens
+                counter["completion_tokens"] += completion_tokens
+                counter["seconds"].append(record["seconds"] or 0.0)
+
+    def add_problem(self, bucket: str, seconds: float) -> None:
+        with self.lock:
+            self.problem_seconds[bucket].append(seconds)
+
+    @staticmethod
+    def summarize(counter: dict) -> dict:
+        return {
+            "calls": counter["calls"],
+            "prompt_tokens": counter["prompt_tokens"],
+            "completion_tokens": counter["completion_tokens"],
+            "p50_ms": percentile(counter["seconds"], 50) * 1000,
+            "p95_ms": percentile(counter["seconds"], 95) * 1000,
+        }
+
+    def summary(self) -> dict:
+        with self.lock:
+            stages = {stage: self.summarize(counter) for stage, counter in sorted(self.stages.items())}
+            buckets = {}
+            for bucket, counter in sorted(self.buckets.items()):
+                problems = self.problem_seconds[bucket]
+                buckets[bucket] = dict(
+                    self.summarize(counter),
+                    problems=len(problems),
+                    calls_per_problem=counter["calls"] / len(problems) if problems else 0,
+                    problem_p50_s=percentile(problems, 50),
+                    problem_p95_s=percentile(problems, 95),
+                )
+            total = self.new_counter()
+            for counter in self.stages.values():
+                for field in COMPARED_FIELDS:
+                    total[field] += counter[field]
+                total["seconds"].extend(counter["seconds"])
+        return {"stages": stages, "buckets": buckets, "total": self.summarize(total)}
+
+
+class StageRecorder:
+    """
+    Trace sink for one problem: forwards every call of its system into the shared stats.
+    """
+    def __init__(self, stats: BenchmarkStats, bucket: str):
+        self.stats = stats
+        self.bucket = bucket
+
+    def write(self, record: dict) -> None:
+        self.stats.add(self.bucket, record)
+
+
+def bucket_name(entry: dict) -> str:
+    descriptor = entry.get("descriptor", {})
+    return f"order={descriptor.get('order')},length={descriptor.get('length')}"
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: Regressions, as messages, where a count grew by more than `tolerance` (a fraction) over the baseline.
+    """
+    regressions = []
+    pairs = [("total", summary["total"], baseline.get("total", {}))]
+    pairs += [(f"stage {stage}", counts, baseline.get("stages", {}).get(stage, {})) for stage, counts in summary["stages"].items()]
+    pairs += [(f"bucket {bucket}", counts, baseline.get("buckets", {}).get(bucket, {})) for bucket, counts in summary["buckets"].items()]
+    for name, current, previous in pairs:
+        for field in COMPARED_FIELDS:
+            before = previous.get(field, 0)
+            if current[field] > before * (1 + tolerance):
+                regressions.append(f"{name}: {field} {before} -> {current[field]}")
+    return regressions
+
+
+def print_summary(summary: dict, wall_seconds: float, num_problems: int) -> None:
+    print(f"\n{num_problems} problems in {wall_seconds:.2f}s ({num_problems / wall_seconds if wall_seconds else 0:.2f} problems/s)")
+    header = f"{'':28} {'calls':>7} {'prompt tok':>11} {'compl tok':>10} {'p50 ms':>9} {'p95 ms':>9}"
+    for title, rows in (("Stage", summary["stages"]), ("Bucket", summary["buckets"]), ("Total", {"all": summary["total"]})):
+        print(f"\n{title}\n{header}")
+        for name, row in rows.items():
+            print(f"{name:28} {row['calls']:>7} {row['prompt_tokens']:>11} {row['completion_tokens']:>10} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f}")
+
+
+def run_benchmark(args) -> dict:
+    dataset = HitomDataset()
+    entries = list(dataset.entries(dataset.sample(args.num_problems, random.Random(args.seed))))
+    stats = BenchmarkStats()
+
+    language_model = LanguageModel(args.model, model_type=args.model_type, temperature=0, base_url=args.base_url, replay_path=args.replay)
+    async_model = None
+    if args.execution in ["async", "wavefront"]:
+        async_model = AsyncLanguageModel(args.model, model_type=args.model_type, temperature=0, max_concurrency=args.max_in_flight, base_url=args.base_url, replay_path=args.replay)
+    if args.execution == "wavefront":
+        async_model = WavefrontLanguageModel(async_model)
+
+    decision_rules = get_decision_rules("hitom") if args.shortcut_decisions else None
+    visibility_cache = VisibilityCache() if args.visibility_cache else None
+
+    def make_system(entry):
+        return TheoryOfMindSystem(mode="hitom", model=args.model, model_type=args.model_type, language_model=language_model, async_model=async_model, parallel_decisions=args.parallel_decisions, rule_based_world=args.rule_based_world, rule_based_questions=args.rule_based_questions, prompt_layout=args.prompt_layout, trace=StageRecorder(stats, bucket_name(entry)), decision_rules=decision_rules, single_pass_filter=args.single_pass_filter, visibility_cache=visibility_cache, context_window=args.context_window, structured_outputs=args.structured_outputs)
+
+    def solve(entry):
+        start = time.perf_counter()
+        make_system(entry).start_task("\n".join(entry.get("story", [])), entry.get("question"), entry.get("choices", []), entry.get("note"))
+        stats.add_problem(bucket_name(entry), time.perf_counter() - start)
+
+    async def solve_async(entry):
+        start = time.perf_counter()
+        await make_system(entry).start_task_async("\n".join(entry.get("story", [])), entry.get("question"), entry.get("choices", []), entry.get("note"))
+        stats.add_problem(bucket_name(entry), time.perf_counter() - start)
+
+    async def solve_all_async():
+        async for task in run_bounded_async(solve_async, entries, len(entries) or 1):
+            task.result()
+
+    start = time.perf_counter()
+    if async_model is not None:
+        asyncio.run(solve_all_async())
+    elif args.execution == "parallel":
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.num_parallel) as executor:
+            for future in run_bounded(executor, solve, entries, 2 * args.num_parallel):
+                future.result()
+    else:
+        for entry in entries:
+            solve(entry)
+    wall_seconds = time.perf_counter() - start
+
+    summary = stats.summary()
+    summary["config"] = {key: value for key, value in vars(args).items() if key not in ["output", "baseline", "tolerance"]}
+    summary["wall_seconds"] = wall_seconds
+    if decision_rules:
+        summary["decision_rules"] = decision_rules.stats()
+    print_summary(summary, wall_seconds, len(entries))
+    if decision_rules:
+        print(f"\n{format_decision_rules(summary['decision_rules'])}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Decompose-ToM pipeline on HiToM: calls, tokens and latency per stage and per order/length bucket.")
+    parser.add_argument("--model", type=str, default="gpt-4o", help="Model name.")
+    parser.add_argument("--model_type", type=str, default="replay", choices=["openai", "gemini", "local", "replay", "mock"], help="Backend; 'replay'/'mock' run offline, 'local' with --base_url targets a stub server.")
+    parser.add_argument("--replay", type=str, default=None, metavar="TRACE", help="Trace recorded with evaluate_hitom.py --trace for the replay/mock backends.")
+    parser.add_argument("--base_url", type=str, default=None, help="Endpoint of an OpenAI-compatible (stub) server.")
+    parser.add_argument("--num_problems", type=int, default=40, help="Number of problems, sampled per (order, length, split) as in evaluate_hitom.py.")
+    parser.add_argument("--seed", type=int, default=7, help="Sampling seed; use the seed of the recorded run when replaying.")
+    parser.add_argument("--execution", type=str, choices=["sequential", "parallel", "async", "wavefront"], default="sequential", help="Execution path to benchmark.")
+    parser.add_argument("--num_parallel", type=int, default=os.cpu_count(), help="Threads for parallel execution.")
+    parser.add_argument("--max_in_flight", type=int, default=64, help="Maximum concurrent requests for async and wavefront execution.")
+    parser.add_argument("--parallel_decisions", action="store_true", help="Decide all sentences of a story concurrently.")
+    parser.add_argument("--rule_based_world", action="store_true", help="Track agent locations with HiToM sentence templates.")
+    parser.add_argument("--rule_based_questions", action="store_true", help="Parse HiToM questions from their template.")
+    parser.add_argument("--shortcut_decisions", action="store_true", help="Resolve knowledge decisions settled by the decision rules without a call.")
+    parser.add_argument("--single_pass_filter", action="store_true", help="Filter nested questions in one pass over the story.")
+    parser.add_argument("--visibility_cache", action="store_true", help="Share per-agent visibility rows across the questions on a story.")
+    parser.add_argument("--context_window", type=int, default=None, metavar="N", help="Statements sent before each knowledge decision (default: all).")
+    parser.add_argument("--structured_outputs", action="store_true", help="Request decisions and answers as JSON (response_format) instead of parsing them with follow-up calls.")
+    parser.add_argument("--prompt_layout", type=str, choices=["default", "prefix_cache"], default="default", help="Decision prompt layout.")
+    parser.add_argument("--output", type=str, default=None, metavar="PATH", help="Write the results as JSON to PATH (use as a later --baseline).")
+    parser.add_argument("--baseline", type=str, default=None, metavar="PATH", help="Fail if calls or tokens exceed this earlier --output by more than --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Allowed relative growth over the baseline (e.g. 0.05 for 5%%).")
+    args = parser.parse_args()
+
+    summary = run_benchmark(args)
+    if args.output:
+        write_json_atomic(args.output, summary, indent=2)
+        print(f"\nResults saved to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            raise SystemExit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def request_key(*parts) -> str:
+    """
+    Build a content-addressed key for a request.
+
+    :param parts: JSON-serialisable values that fully describe the request.
+    :return: Hex SHA-256 digest of the canonical JSON encoding of the parts.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent, thread-safe cache of LLM responses backed by SQLite.
+
+    Entries are keyed by a hash of the full request (see `request_key`) and
+    evicted by age and by count (least recently used first).
+    """
+    def __init__(self, path: str, max_entries: int | None = None, max_age: float | None = None):
+        """
+        :param path: Path to the SQLite database file (created if missing).
+        :param max_entries: Maximum number of stored responses, or None for no limit.
+        :param max_age: Maximum age of a stored response in seconds, or None for no limit.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> str | None:
+        """
+        Look up a cached response, counting the hit or miss.
+
+        :param key: Request key.
+        :return: The cached response, or None if absent or expired.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Store a response, evicting old entries if the cache is over its size limit.
+
+        :param key: Request key.
+        :param response: Response text to store.
+        """
+        if response is None:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self.conn.commit()
+            if self.max_entries is not None:
+                self._evict_overflow()
+
+    def evict(self) -> None:
+        """
+        Remove expired entries and trim the cache down to `max_entries`.
+        """
+        with self.lock:
+            if self.max_age is not None:
+                self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self._evict_overflow()
+            self.conn.commit()
+
+    def _evict_overflow(self) -> None:
+        count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        """
+        :return: Hit/miss counters and the number of stored entries.
+        """
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total * 100) if total > 0 else 0,
+                "entries": size,
+            }
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+class PerspectiveCache:
+    """
+    Memo of filtered stories keyed by (story, agent chain, mode, model, pipeline config).
+
+    One instance is meant to be shared by every TheoryOfMindSystem in a run, so a
+    2nd-order question reuses the 1st-order filtered story another question already
+    produced. Concurrent requests for the same key compute it only once.
+    """
+    def __init__(self, path: str | None = None):
+        """
+        :param path: Optional SQLite file to persist filtered stories across runs.
+        """
+        self.store = ResponseCache(path) if path else None
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.async_key_locks = {}
+
+    def key(self, story: str, chain, mode: str, model: str, note=None, config: dict | None = None) -> str:
+        """
+        :param story: The original (unfiltered) story.
+        :param chain: Agents filtered so far, outermost first, e.g. ("oliver", "aria").
+        :param mode: TheoryOfMindSystem mode.
+        :param model: Model name.
+        :param note: Rules passed to the decision prompts (only relevant for the generic mode).
+        :param config: Settings that change the knowledge decisions (see TheoryOfMindSystem.decision_config),
+                       so a persisted entry is never reused by a run with different ones.
+        """
+        return request_key("perspective", mode, model, story, note, list(chain), config)
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            value = self.memory.get(key)
+        if value is None and self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                with self.lock:
+                    self.memory[key] = value
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        with self.lock:
+            self.memory[key] = value
+        if self.store is not None:
+            self.store.put(key, value)
+
+    def get_or_compute(self, key: str, compute) -> str:
+        """
+        Return the cached value for key, calling compute() at most once across threads.
+        """
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                value = self.get(key)
+                if value is None:
+                    value = compute()
+                    self.put(key, value)
+            finally:
+                # Later requests read the stored value (or retry after a failure), so the lock is no longer needed.
+                with self.lock:
+                    self.key_locks.pop(key, None)
+        return value
+
+    async def get_or_compute_async(self, key: str, compute) -> str:
+        """
+        Coroutine counterpart of get_or_compute; compute is a zero-argument coroutine function.
+        """
+        key_lock = self.async_key_locks.setdefault(key, asyncio.Lock())
+        async with key_lock:
+            try:
+                value = self.get(key)
+                if value is None:
+                    value = await compute()
+                    self.put(key, value)
+            finally:
+                self.async_key_locks.pop(key, None)
+        return value
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total * 100) if total > 0 else 0,
+                "entries": len(self.memory),
+            }
+
+
+class VisibilityCache(PerspectiveCache):
+    """
+    Memo of which sentences of a story each agent knows, keyed by (story, agent, mode, model, pipeline config).
+
+    The rows of a story form an (agents x sentences) visibility matrix. Each row is an int bitmask
+    (bit i is set if the agent knows sentence i) and is stored in hex. The story filtered for a chain
+    of agents is the AND of their rows. So once every agent of a story has a row, any question on
+    that story, about any agent chain, filters the story without a knowledge decision.
+    The world state before each sentence, which every row of a story needs, is kept here too.
+    """
+    def __init__(self, path: str | None = None):
+        super().__init__(path)
+        # Kept apart from the rows so hit counts and entries stay per agent row; persisted to the same file.
+        self.trajectories = PerspectiveCache()
+        self.trajectories.store = self.store
+
+    def row_key(self, story: str, agent: str, mode: str, model: str, note=None, config: dict | None = None) -> str:
+        """
+        :param story: The story the row indexes (split into sentences by the caller).
+        :param agent: Normalized agent name.
+        :param config: Settings that change the knowledge decisions, as for key().
+        """
+        return request_key("visibility", mode, model, story, note, agent, config)
+
+    def get_or_compute_row(self, key: str, compute) -> int:
+        """
+        :param compute: Zero-argument function returning the row bitmask.
+        """
+        return int(self.get_or_compute(key, lambda: format(compute(), "x")), 16)
+
+    async def get_or_compute_row_async(self, key: str, compute) -> int:
+        """
+        :param compute: Zero-argument coroutine function returning the row bitmask.
+        """
+        async def encoded():
+            return format(await compute(), "x")
+        return int(await self.get_or_compute_async(key, encoded), 16)
+
+    def worlds_key(self, story: str, mode: str, model: str, note=None, config: dict | None = None) -> str:
+        """
+        :param story: The story whose world trajectory is stored.
+        :param config: Settings that change the trajectory (see TheoryOfMindSystem.world_config).
+        """
+        return request_key("worlds", mode, model, story, note, config)
+
+    def get_or_compute_worlds(self, key: str, compute) -> list:
+        """
+        :param compute: Zero-argument function returning the world state before each sentence (e.g. a WorldTrajectory).
+        :return: The rendered world state before each sentence.
+        """
+        return json.loads(self.trajectories.get_or_compute(key, lambda: encode_worlds(compute())))
+
+    async def get_or_compute_worlds_async(self, key: str, compute) -> list:
+        """
+        :param compute: Zero-argument coroutine function returning the world state before each sentence.
+        """
+        async def encoded():
+            return encode_worlds(await compute())
+        return json.loads(await self.trajectories.get_or_compute_async(key, encoded))
+
+
+def encode_worlds(worlds) -> str:
+    return json.dumps([worlds[i] for i in range(len(worlds))])
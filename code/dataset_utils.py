@@ -0,0 +1,220 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
+import mmap
+import os
+import random
+from array import array
+
+HITOM_SPLITS = {
+    "tell": "../data/hitom_tell.jsonl",
+    "no_tell": "../data/hitom_no_tell.jsonl",
+}
+
+
+def iter_jsonl(file_path, split=None):
+    """
+    Stream the entries of a JSONL file one at a time.
+
+    :param file_path: Path to the JSONL file.
+    :param split: Optional split name stored in each entry under "split".
+    :return: Generator of dictionaries, each with its 1-based line number as "id".
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            try:
+                data = json.loads(line.strip())
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON on line {line_number}: {e}")
+                continue
+            data["id"] = line_number  # Add a unique question ID
+            if split is not None:
+                data["split"] = split
+            yield data
+
+
+def parse_hitom(file_path, split=None):
+    """
+    Parses HiToM data.
+
+    :param file_path: Path to the JSONL file.
+    :param split: Optional split name ('tell' / 'no_tell') stored in each entry under "split".
+    :return: List of dictionaries representing each line in the file.
+    """
+    try:
+        return list(iter_jsonl(file_path, split))
+    except FileNotFoundError:
+        print(f"File not found: {file_path}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    return []
+
+
+class JsonlIndex:
+    """
+    Random access to the lines of a JSONL file through a memory map.
+
+    Only the byte offset of each line is held in memory (8 bytes per line), so a multi-GB
+    file can be sampled and read entry by entry with flat memory use. Entries get the
+    same 1-based line-number "id" as iter_jsonl.
+    """
+    def __init__(self, file_path: str, split: str | None = None):
+        self.file_path = file_path
+        self.split = split
+        self.file = open(file_path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        # Offsets are found with a buffered sequential read rather than through the map,
+        # so building the index does not pull the whole file into the process.
+        self.offsets = array("Q")
+        position = 0
+        for line in self.file:
+            self.offsets.append(position)
+            position += len(line)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def line(self, i: int) -> bytes:
+        start = self.offsets[i]
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.size
+        return self.map[start:end]
+
+    def __getitem__(self, i: int) -> dict:
+        """
+        :param i: 0-based line index.
+        :raises json.JSONDecodeError: If the line is not valid JSON.
+        """
+        data = json.loads(self.line(i))
+        data["id"] = i + 1
+        if self.split is not None:
+            data["split"] = self.split
+        return data
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+def stratified_sample(partitions: dict, num_problems: int, rng=random) -> list:
+    """
+    Sample the same number of entries from every partition.
+
+    :param partitions: Mapping of partition key to its list of entries (or entry keys).
+    :param num_problems: Total number of problems wanted; each partition contributes
+                         num_problems // len(partitions) (or all its entries if it has fewer).
+                         0 or less selects everything.
+    :param rng: Random number generator (the `random` module or a random.Random instance).
+    :return: Selected entries, grouped by partition in partition order.
+    """
+    if num_problems <= 0:
+        return [entry for entries in partitions.values() for entry in entries]
+    problems_per_partition = num_problems // len(partitions)
+    selected = []
+    for entries in partitions.values():
+        selected.extend(rng.sample(entries, min(problems_per_partition, len(entries))))
+    return selected
+
+
+class HitomDataset:
+    """
+    HiToM splits indexed in one streaming pass.
+
+    Only the (split, id) key of each entry is kept, grouped in `partitions` by
+    (order, length, split) with order 0 excluded; ids are line numbers and repeat across
+    splits. Entries themselves are read back from a memory-mapped JsonlIndex on demand.
+    """
+    def __init__(self, splits: dict | None = None):
+        """
+        :param splits: Mapping of split name to JSONL path (default: HITOM_SPLITS).
+        """
+        self.indexes = {}
+        self.partitions = collections.defaultdict(list)
+        for split, path in (splits or HITOM_SPLITS).items():
+            try:
+                index = JsonlIndex(path, split)
+            except FileNotFoundError:
+                print(f"File not found: {path}")
+                continue
+            self.indexes[split] = index
+            for i in range(len(index)):
+                try:
+                    entry = index[i]
+                except json.JSONDecodeError as e:
+                    print(f"Error decoding JSON on line {i + 1} of {path}: {e}")
+                    continue
+                descriptor = entry.get("descriptor", {})
+                order = descriptor.get("order", 0)
+                if order == 0:
+                    continue  # Exclude order 0
+                self.partitions[(order, descriptor.get("length", 0), split)].append(self.key(entry))
+
+    @staticmethod
+    def key(entry: dict) -> tuple:
+        return entry["split"], entry["id"]
+
+    def get(self, key: tuple) -> dict | None:
+        """
+        :param key: (split, id) of an entry.
+        :return: The entry, or None if there is no such line.
+        """
+        split, entry_id = key
+        index = self.indexes.get(split)
+        if index is None or not 1 <= entry_id <= len(index):
+            return None
+        return index[entry_id - 1]
+
+    def entries(self, keys):
+        """
+        Lazily load the entries for a sequence of keys.
+        """
+        for key in keys:
+            yield self.get(key)
+
+    def sample(self, num_problems: int, rng=random) -> list:
+        """
+        Stratified sample over (order, length, split); see stratified_sample.
+
+        :return: Keys of the selected entries.
+        """
+        return stratified_sample(self.partitions, num_problems, rng)
+
+
+# ---------------------- Bounded Feeding ----------------------
+
+def run_bounded(executor: concurrent.futures.Executor, fn, items, max_pending: int):
+    """
+    Submit fn(item) for each item, pulling items lazily so at most max_pending are queued or running.
+
+    :return: Generator of completed futures, in completion order.
+    """
+    pending = set()
+    for item in items:
+        if len(pending) >= max_pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            yield from done
+        pending.add(executor.submit(fn, item))
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        yield from done
+
+
+async def run_bounded_async(coro_fn, items, max_pending: int):
+    """
+    asyncio counterpart of run_bounded: at most max_pending coro_fn(item) tasks exist at once.
+
+    :return: Async generator of completed tasks, in completion order.
+    """
+    pending = set()
+    for item in items:
+        if len(pending) >= max_pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task
+        pending.add(asyncio.ensure_future(coro_fn(item)))
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task
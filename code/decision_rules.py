@@ -0,0 +1,146 @@
+import abc
+import collections
+import re
+import threading
+from world_tracker import NAME, PREFIX, SUFFIX
+
+AGENT_LIST = rf"{NAME}(?:, {NAME})*(?: and {NAME})?"
+
+# HiToM templates whose knowledge decision follows from the rules of PROMPT_DECIDE_KNOWLEDGE_HITOM alone.
+HITOM_ENTER = re.compile(PREFIX + rf"(?P<agents>{AGENT_LIST}) entered the [\w]+" + SUFFIX)
+HITOM_EXIT = re.compile(PREFIX + rf"(?P<agent>{NAME}) exited the [\w]+" + SUFFIX)
+HITOM_PRIVATE = re.compile(PREFIX + rf"(?P<speaker>{NAME}) privately told (?P<listener>{NAME}) that .+" + SUFFIX)
+HITOM_PUBLIC = re.compile(PREFIX + rf"{NAME} publicly claimed that .+" + SUFFIX)
+# Any other statement whose subject is a capitalized word, e.g. "Mia moved the onion to the red_box";
+# only an own action if that word is one of the story's agents (see HitomDecisionRules.story_agents).
+HITOM_SUBJECT = re.compile(PREFIX + rf"(?P<agent>{NAME}) ")
+
+# FanToM dialogues are "Speaker: utterance".
+FANTOM_SPEAKER = re.compile(r"^(?P<speaker>[^:]+):")
+
+
+class DecisionRules(abc.ABC):
+    """
+    Pre-classifier run before each knowledge decision.
+
+    classify resolves statements whose answer the decision prompt's own rules already fix (an agent
+    knows their own actions, for example) and returns None for those that need the model. One
+    instance is meant to be shared by all systems of a run: it keeps thread-safe counts of the
+    decisions it resolved, per rule, and of those it passed on to the model.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rules = collections.Counter()
+        self.delegated = 0
+
+    @abc.abstractmethod
+    def classify(self, part: str, agent: str, agents: set | None = None) -> tuple[bool, str] | None:
+        """
+        :param part: The statement (or dialogue) to decide.
+        :param agent: Normalized (lowercase) agent name.
+        :param agents: Normalized names of the story's agents (see story_agents), or None if unknown.
+        :return: (whether the agent knows the statement, name of the rule that decided it), or None.
+        """
+
+    def story_agents(self, parts: list) -> set | None:
+        """
+        :param parts: Statements of the original story.
+        :return: Normalized names of the agents in the story, or None if the rules do not need them.
+        """
+        return None
+
+    def decide(self, part: str, agent: str, agents: set | None = None) -> tuple[bool, str] | None:
+        """
+        classify, counting the outcome.
+        """
+        decision = self.classify(part.strip(), agent, agents)
+        with self.lock:
+            if decision is None:
+                self.delegated += 1
+            else:
+                self.rules[decision[1]] += 1
+        return decision
+
+    def stats(self) -> dict:
+        with self.lock:
+            resolved = sum(self.rules.values())
+            total = resolved + self.delegated
+            return {
+                "resolved": resolved,
+                "delegated": self.delegated,
+                "resolved_rate": (resolved / total * 100) if total > 0 else 0,
+                # Each resolved decision saves its decision call (and any yes/no follow-up calls).
+                "calls_avoided": resolved,
+                "rules": dict(self.rules.most_common()),
+            }
+
+
+class HitomDecisionRules(DecisionRules):
+    """
+    Rules for the HiToM sentence templates: own actions, exits and public claims are known;
+    a private communication is known only to the two agents involved.
+    """
+    def story_agents(self, parts: list) -> set:
+        """
+        Every HiToM agent enters a room before acting, so the story's agents are those of its enter statements.
+        """
+        agents = set()
+        for part in parts:
+            match = HITOM_ENTER.match(part.strip())
+            if match:
+                agents.update(name.lower() for name in re.split(r", | and ", match.group("agents")))
+        return agents
+
+    def classify(self, part: str, agent: str, agents: set | None = None) -> tuple[bool, str] | None:
+        match = HITOM_ENTER.match(part)
+        if match:
+            if agent in [name.lower() for name in re.split(r", | and ", match.group("agents"))]:
+                return True, "own_action"
+            return None
+        match = HITOM_EXIT.match(part)
+        if match:
+            return True, "own_action" if match.group("agent").lower() == agent else "exit"
+        match = HITOM_PRIVATE.match(part)
+        if match:
+            return agent in [match.group("speaker").lower(), match.group("listener").lower()], "private_communication"
+        if HITOM_PUBLIC.match(part):
+            return True, "public_communication"
+        match = HITOM_SUBJECT.match(part)
+        # Without the story's agents, a sentence opener such as "The" cannot be told from a name.
+        if match and agents is not None and match.group("agent").lower() == agent and agent in agents:
+            return True, "own_action"
+        return None
+
+
+class FantomDecisionRules(DecisionRules):
+    """
+    Rules for FanToM conversations: an agent knows every dialogue they say themselves.
+    """
+    def classify(self, part: str, agent: str, agents: set | None = None) -> tuple[bool, str] | None:
+        match = FANTOM_SPEAKER.match(part)
+        if match and match.group("speaker").strip().lower() == agent:
+            return True, "own_dialogue"
+        return None
+
+
+DECISION_RULES = {
+    "hitom": HitomDecisionRules,
+    "fantom": FantomDecisionRules,
+}
+
+
+def get_decision_rules(mode: str | None) -> DecisionRules | None:
+    """
+    :param mode: Operation mode of the systems that will share the rules.
+    :return: A new pre-classifier for the mode, or None if the mode has no rules.
+    """
+    rules = DECISION_RULES.get(mode)
+    return rules() if rules is not None else None
+
+
+def format_decision_rules(stats: dict) -> str:
+    """
+    Render DecisionRules.stats() as a line of the end-of-run report.
+    """
+    rules = ", ".join(f"{rule} {count}" for rule, count in stats["rules"].items())
+    return f"Knowledge decisions resolved by rules: {stats['resolved']} of {stats['resolved'] + stats['delegated']} ({stats['resolved_rate']:.2f}%, {stats['calls_avoided']} calls avoided){': ' + rules if rules else ''}"
@@ -4,26 +4,22 @@ import argparse
 import collections
 import json
 import concurrent.futures
+import asyncio
 import threading
 import os
 from datetime import datetime
 from llm_utils import *
+from cache_utils import ResponseCache, PerspectiveCache, VisibilityCache
+from rate_limit import RateLimiter
+from usage_utils import TokenUsage, format_usage
+from decision_rules import get_decision_rules, format_decision_rules
+from replay import OFFLINE_MODEL_TYPES
+from result_log import ResultWriter, read_records
+from tracing import Tracer
+from batching import PromptCollector, WavefrontLanguageModel, BatchLanguageModel
 from simtom.simtom_fantom import *
 from new_decompose import TheoryOfMindSystem
-
-def parse_dataset(file_path):
-    """
-    Parses the dataset JSONL file.
-    :param file_path: Path to the dataset file.
-    :return: Parsed list of entries.
-    """
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line_number, line in enumerate(f, 1):
-            entry = json.loads(line.strip())
-            entry['id'] = line_number  # Add a unique question ID
-            data.append(entry)
-    return data
+from dataset_utils import JsonlIndex, run_bounded, run_bounded_async
 
 def generate_choices(correct_answer, wrong_answer):
     """
@@ -59,7 +55,7 @@ def start_task(llm, story, question, choices, note):
 
     Answer: 
     '''
-    return llm.get_output(prompt).strip().strip(".")
+    return llm.get_output(prompt, stage="baseline").strip().strip(".")
 
 def start_task_cot(llm, story, question, choices, note):
     """
@@ -75,29 +71,30 @@ def start_task_cot(llm, story, question, choices, note):
 
     Provide the relevant label alongside the answer when providing your answer
     '''
-    cot = llm.get_output(prompt)
+    cot = llm.get_output(prompt, stage="cot")
     answer = llm.get_output(f'''This is the provided explanation for a question: {cot}
     Provide the answer selected in the above solution. Answer with ONLY the correct choice. The answer should contain only a single word.
     Format: (option_letter)
-    Answer: ''').strip().strip(".")
+    Answer: ''', stage="cot_extract").strip().strip(".")
     return answer
 
-def evaluate_dataset(file_path, method, num_problems, context, parallel_execution, num_parallel, model, model_type):
+def evaluate_dataset(file_path, method, num_problems, context, parallel_execution, num_parallel, model, model_type, *, cache=None, async_execution=False, max_in_flight=64, parallel_decisions=False, decision_workers=8, perspective_cache=None, max_connections=None, rate_limiter=None, batch_model=None, wavefront=False, prompt_layout="default", usage=None, resume=None, trace=None, max_pending_problems=1024, base_url=None, replay_path=None, spans=None, shortcut_decisions=False, single_pass_filter=False, visibility_cache=None, context_window=None, structured_outputs=False):
     """
     Evaluate a dataset based on specified methods and parameters.
     """
-    data = parse_dataset(file_path)
+    # Only line offsets are held in memory; entries are parsed as problems are started
+    data = JsonlIndex(file_path)
 
     # Prepare results directory
     results_dir = "../results"
     os.makedirs(results_dir, exist_ok=True)
-    log_filename = os.path.join(results_dir, f"fantom_{method}_{num_problems}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    log_filename = resume or os.path.join(results_dir, f"fantom_{method}_{num_problems}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
 
-    # Sampling logic
+    # Sampling logic (ids are 1-based line numbers)
     if num_problems > 0:
-        sampled_data = data[:min(num_problems, len(data))]
+        sampled_ids = list(range(1, min(num_problems, len(data)) + 1))
     else:
-        sampled_data = data
+        sampled_ids = list(range(1, len(data) + 1))
 
     # Progress logging
     correct_count = 0
@@ -105,29 +102,61 @@ def evaluate_dataset(file_path, method, num_problems, context, parallel_executio
     detailed_logs = []
     lock = threading.Lock()
 
+    # Rebuild the counts from an interrupted run and skip the problems it already logged
+    if resume:
+        completed = set()
+        for record in read_records(log_filename):
+            if "id" not in record:
+                continue  # Usage summary of an earlier run
+            completed.add(record["id"])
+            correct_count += record["is_correct"]
+            total_count += 1
+        sampled_ids = [entry_id for entry_id in sampled_ids if entry_id not in completed]
+        print(f"Resuming {log_filename}: {len(completed)} problems already evaluated, {len(sampled_ids)} remaining")
+    sampled_data = (data[entry_id - 1] for entry_id in sampled_ids)
+
     # Model initialization
-    language_model = LanguageModel(model, temperature=0, model_type=model_type)
+    # One client per process: every system and worker shares these models and their connection pools.
+    rate_limiter = rate_limiter or RateLimiter()
+    usage = usage or TokenUsage()
+    language_model = LanguageModel(model, temperature=0, model_type=model_type, cache=cache, max_connections=max_connections, rate_limiter=rate_limiter, usage=usage, base_url=base_url, replay_path=replay_path)
+    async_model = batch_model or (AsyncLanguageModel(model, temperature=0, model_type=model_type, cache=cache, max_concurrency=max_in_flight, max_connections=max_connections, rate_limiter=rate_limiter, usage=usage, base_url=base_url, replay_path=replay_path) if async_execution or wavefront else None)
+    if wavefront and batch_model is None:
+        async_model = WavefrontLanguageModel(async_model)
+    # Offline runs answer the simtom parser from the same trace instead of calling the API.
+    parser_type = model_type if model_type in OFFLINE_MODEL_TYPES else "openai"
+    parser_model = LanguageModel("gpt-4o-mini", model_type=parser_type, cache=cache, max_connections=max_connections, rate_limiter=rate_limiter, usage=usage, replay_path=replay_path) if method == "simtom" else None
 
-    def process_entry(entry):
-        nonlocal correct_count, total_count
+    # A single writer thread owns each output file; workers only enqueue records.
+    result_writer = ResultWriter(log_filename)
+    trace_writer = ResultWriter(trace) if trace else None
+    span_writer = ResultWriter(spans) if spans else None
+    decision_rules = get_decision_rules("fantom") if shortcut_decisions else None
+    tracer = Tracer(span_writer) if span_writer else None
+
+    def make_system():
+        return TheoryOfMindSystem(mode = "fantom", model = model, model_type = model_type, cache = cache, language_model = language_model, async_model = async_model, parallel_decisions = parallel_decisions, decision_workers = decision_workers, perspective_cache = perspective_cache, prompt_layout = prompt_layout, trace = trace_writer, tracer = tracer, decision_rules = decision_rules, single_pass_filter = single_pass_filter, visibility_cache = visibility_cache, context_window = context_window, structured_outputs = structured_outputs)
+
+    def solve_entry(entry, choices_text):
         story = entry[context+"_context"]
         question = entry["question"]
-        correct_answer = entry["correct_answer"]
-        wrong_answer = entry["wrong_answer"]
         note = entry.get("note", "")
-
-        # Generate randomized choices
-        choices_text, correct_index, option_letters = generate_choices(correct_answer, wrong_answer)
-        system = TheoryOfMindSystem(mode = "fantom", model = model, model_type = model_type)
+        system = make_system()
         # Select method
         if method == "baseline":
             returned_answer = start_task(language_model, story, question, choices_text, note)
         elif method == "cot":
             returned_answer = start_task_cot(language_model, story, question, choices_text, note)
         elif method == "simtom":
-            returned_answer,_ = evalQuestion(language_model, story, questionPrompt.format(question = question, choices = choices_text),  simModel=None)
+            returned_answer,_ = evalQuestion(language_model, story, questionPrompt.format(question = question, choices = choices_text),  simModel=None, parserModel=parser_model)
         elif method == "decompose":
             returned_answer = system.start_task(story, question, choices_text, "").lower()
+        return returned_answer
+
+    def record_result(entry, choices_text, correct_index, option_letters, returned_answer):
+        nonlocal correct_count, total_count
+        question = entry["question"]
+        correct_answer = entry["correct_answer"]
         # Check correctness
         if "Answer:" in returned_answer:
             returned_answer=returned_answer.split("Answer:")[1]
@@ -137,9 +166,10 @@ def evaluate_dataset(file_path, method, num_problems, context, parallel_executio
         label = "("+option_letters[correct_index].lower()+")"
         answer =  option_letters[correct_index]
         is_correct = response.startswith("(" + answer + ")") or response.startswith(answer + ")") or response.startswith(answer + ".") or response.startswith(answer + ":") or response.startswith(answer + ",") or "({})".format(answer) in response or answer == response
-        if is_correct:
-            correct_count += 1
-        total_count += 1
+        with lock:
+            if is_correct:
+                correct_count += 1
+            total_count += 1
 
         # Save log entry
         log_entry = {
@@ -150,37 +180,150 @@ def evaluate_dataset(file_path, method, num_problems, context, parallel_executio
             "returned_answer": returned_answer,
             "is_correct": is_correct
         }
-        with lock:
-            with open(log_filename, "a") as log_file:
-                json.dump(log_entry, log_file)
-                log_file.write("\n")
+        result_writer.write(log_entry)
+
+    def process_entry(entry):
+        # Generate randomized choices
+        choices_text, correct_index, option_letters = generate_choices(entry["correct_answer"], entry["wrong_answer"])
+        returned_answer = solve_entry(entry, choices_text)
+        record_result(entry, choices_text, correct_index, option_letters, returned_answer)
+
+    async def process_entry_async(entry):
+        choices_text, correct_index, option_letters = generate_choices(entry["correct_answer"], entry["wrong_answer"])
+        if method == "decompose":
+            system = make_system()
+            returned_answer = (await system.start_task_async(entry[context+"_context"], entry["question"], choices_text, "")).lower()
+        else:
+            # The other methods only have a blocking implementation.
+            returned_answer = await asyncio.to_thread(solve_entry, entry, choices_text)
+        record_result(entry, choices_text, correct_index, option_letters, returned_answer)
+
+    async def process_all_async():
+        progress = tqdm.tqdm(total=len(sampled_ids), desc="Evaluating (Async)")
+        async for task in run_bounded_async(process_entry_async, sampled_data, max_pending_problems):
+            task.result()
+            progress.update()
+        progress.close()
 
-    # Parallel or sequential execution
-    if parallel_execution:
+    # Async (also used for batch submission), parallel or sequential execution
+    if async_model is not None:
+        asyncio.run(process_all_async())
+    elif parallel_execution:
         with concurrent.futures.ThreadPoolExecutor(max_workers=num_parallel) as executor:
-            list(tqdm.tqdm(executor.map(process_entry, sampled_data), total=len(sampled_data), desc="Evaluating"))
+            for future in tqdm.tqdm(run_bounded(executor, process_entry, sampled_data, 2 * num_parallel), total=len(sampled_ids), desc="Evaluating"):
+                future.result()
     else:
-        for entry in tqdm.tqdm(sampled_data, desc="Evaluating"):
+        for entry in tqdm.tqdm(sampled_data, total=len(sampled_ids), desc="Evaluating"):
             process_entry(entry)
+    # The run's usage goes last in the log; readers of the log skip it as it has no problem id.
+    summary = {"usage": usage.stats()}
+    if decision_rules:
+        summary["decision_rules"] = decision_rules.stats()
+    result_writer.write(summary)
+    result_writer.close()
+    if trace_writer:
+        trace_writer.close()
+    if span_writer:
+        span_writer.close()
+    data.close()
 
 
     accuracy = (correct_count / total_count) * 100 if total_count > 0 else 0
     print(f"Evaluation complete! Results saved to {log_filename}")
     print(f"Accuracy: {accuracy:.2f}% ({correct_count}/{total_count} correct)")
+    stats = usage.stats()
+    if stats['requests']:
+        print(format_usage(stats))
+    if decision_rules:
+        print(format_decision_rules(decision_rules.stats()))
+    if rate_limiter.throttled:
+        print(f"Rate limiter delayed {rate_limiter.throttled} requests")
+    if model_type in OFFLINE_MODEL_TYPES:
+        stats = language_model.model.stats()
+        print(f"Replay: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate) from {stats['entries']} recorded responses")
+    if isinstance(async_model, PromptCollector):
+        stats = async_model.stats()
+        print(f"Stage-wise scheduling: {stats['requests']} requests in {stats['waves']} waves ({stats['mean_wave_size']:.1f} per wave)")
+    if perspective_cache:
+        stats = perspective_cache.stats()
+        print(f"Perspective cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate)")
+    if visibility_cache:
+        stats = visibility_cache.stats()
+        print(f"Visibility cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate), {stats['entries']} agent rows")
+    if cache:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate), {stats['entries']} entries")
 
 def main():
     parser = argparse.ArgumentParser(description="Evaluate a dataset with specified context and methods.")
     parser.add_argument("--file", type=str, default="../data/fantomtom.jsonl", help="Path to the dataset JSONL file.")
     parser.add_argument("--model", type=str, default="gpt-4o", help="Name of intended model to conduct analysis")
-    parser.add_argument("--model_type", type=str, default="openai",choices=["openai", "gemini","local"],help="Select a model type.")
+    parser.add_argument("--model_type", type=str, default="openai",choices=["openai", "gemini","local","replay","mock"],help="Select a model type ('replay' and 'mock' answer offline, see --replay).")
+    parser.add_argument("--base_url", type=str, default=None, help="Endpoint of an OpenAI-compatible server (default for 'local': http://localhost:30000/v1).")
+    parser.add_argument("--replay", type=str, default=None, metavar="TRACE", help="Trace recorded with --trace that answers 'replay' (required) and 'mock' (optional) model types.")
     parser.add_argument("--method", type=str, choices=["baseline", "cot","simtom","decompose"], required=True, help="Evaluation method.")
     parser.add_argument("--num_problems", type=int, default=0, help="Number of problems to evaluate (0 for all).")
     parser.add_argument("--context", type=str, choices=["short", "full"], required=False, default = "short", help="Context type to use.")
     parser.add_argument('--parallel_execution', action='store_true', help="Enable or disable parallel execution.")
     parser.add_argument("--num_parallel", type=int, default=os.cpu_count(), help="Number of threads for parallel execution.")
+    parser.add_argument("--async_execution", action="store_true", help="Run all problems concurrently on a single asyncio event loop.")
+    parser.add_argument("--max_in_flight", type=int, default=64, help="Maximum number of concurrent LLM requests in async execution.")
+    parser.add_argument("--max_pending_problems", type=int, default=1024, help="Maximum number of problems loaded and in progress at once in async execution.")
+    parser.add_argument("--shortcut_decisions", action="store_true", help="Decompose: resolve knowledge decisions on dialogues an agent says themselves without calling the LLM.")
+    parser.add_argument("--single_pass_filter", action="store_true", help="Decompose: filter the conversation for all agents of a nested question in one pass instead of once per level.")
+    parser.add_argument("--parallel_decisions", action="store_true", help="Decompose: decide all dialogues of a conversation concurrently against a precomputed world trajectory.")
+    parser.add_argument("--decision_workers", type=int, default=8, help="Threads per problem for concurrent dialogue decisions.")
+    parser.add_argument("--context_window", type=int, default=None, metavar="N", help="Decompose: send each knowledge decision only the N dialogues before it (default layout; the world state covers the rest).")
+    parser.add_argument("--structured_outputs", action="store_true", help="Decompose: request knowledge decisions and answers as JSON constrained to yes/no or the choice letters (response_format), so they need no follow-up parsing calls.")
+    parser.add_argument("--prompt_layout", type=str, choices=["default", "prefix_cache"], default="default", help="Decompose: 'prefix_cache' puts the rules and the full conversation before the per-dialogue fields of decision prompts, so prompt caches can reuse them.")
+    parser.add_argument("--visibility_cache", nargs="?", const="", default=None, metavar="PATH", help="Decompose: decide each agent's knowledge of every dialogue of a conversation once and filter all questions on the conversation from these rows, optionally persisted to PATH.")
+    parser.add_argument("--perspective_cache", nargs="?", const="", default=None, metavar="PATH", help="Decompose: share filtered conversations across questions with the same conversation and agent chain, optionally persisted to PATH.")
+    parser.add_argument("--max_connections", type=int, default=None, help="Size of the shared HTTP keep-alive connection pool.")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests per minute allowed by the provider (otherwise sized from rate-limit response headers).")
+    parser.add_argument("--tpm", type=float, default=None, help="Tokens per minute allowed by the provider (otherwise sized from rate-limit response headers).")
+    parser.add_argument("--wavefront", action="store_true", help="Decompose: advance all problems one stage at a time and send each stage's prompts as one concurrent wave.")
+    parser.add_argument("--batch_api", action="store_true", help="Decompose: submit each stage's prompts across problems through the Batch API instead of the chat endpoint.")
+    parser.add_argument("--batch_dir", type=str, default="../results/batches", help="Directory for batch input files and the manifest of submitted batches.")
+    parser.add_argument("--batch_poll_interval", type=float, default=30.0, help="Seconds between batch status checks.")
+    parser.add_argument("--resume", type=str, default=None, metavar="LOG", help="Continue an interrupted run: skip the problems already in LOG and append the rest to it.")
+    parser.add_argument("--trace", type=str, default=None, metavar="PATH", help="Decompose: write every prompt and response to PATH as JSON lines (gzip/zstd compressed for .gz/.zst paths).")
+    parser.add_argument("--spans", type=str, default=None, metavar="PATH", help="Decompose: write a tracing span per step (start_task, task, data, decide, get_response, ...) to PATH as JSON lines; profile with tracing.py.")
+    parser.add_argument("--cache_path", type=str, default=None, help="Path to an SQLite response cache for temperature 0 requests.")
+    parser.add_argument("--cache_max_entries", type=int, default=None, help="Maximum number of cached responses.")
+    parser.add_argument("--cache_max_age", type=float, default=None, help="Maximum age of a cached response in seconds.")
     args = parser.parse_args()
 
-    evaluate_dataset(args.file, args.method, args.num_problems, args.context, args.parallel_execution, args.num_parallel, args.model, args.model_type)
+    cache = ResponseCache(args.cache_path, max_entries=args.cache_max_entries, max_age=args.cache_max_age) if args.cache_path else None
+    perspective_cache = PerspectiveCache(args.perspective_cache or None) if args.perspective_cache is not None else None
+    visibility_cache = VisibilityCache(args.visibility_cache or None) if args.visibility_cache is not None else None
+    usage = TokenUsage()
+    batch_model = BatchLanguageModel(args.model, model_type=args.model_type, temperature=0, cache=cache, batch_dir=args.batch_dir, poll_interval=args.batch_poll_interval, base_url=args.base_url, usage=usage) if args.batch_api else None
+    evaluate_dataset(
+        args.file, args.method, args.num_problems, args.context, args.parallel_execution, args.num_parallel, args.model, args.model_type,
+        cache=cache,
+        async_execution=args.async_execution,
+        max_in_flight=args.max_in_flight,
+        parallel_decisions=args.parallel_decisions,
+        decision_workers=args.decision_workers,
+        perspective_cache=perspective_cache,
+        max_connections=args.max_connections,
+        rate_limiter=RateLimiter(args.rpm, args.tpm),
+        batch_model=batch_model,
+        wavefront=args.wavefront,
+        prompt_layout=args.prompt_layout,
+        usage=usage,
+        resume=args.resume,
+        trace=args.trace,
+        max_pending_problems=args.max_pending_problems,
+        base_url=args.base_url,
+        replay_path=args.replay,
+        spans=args.spans,
+        shortcut_decisions=args.shortcut_decisions,
+        single_pass_filter=args.single_pass_filter,
+        visibility_cache=visibility_cache,
+        context_window=args.context_window,
+        structured_outputs=args.structured_outputs,
+    )
 
 if __name__ == "__main__":
     main()
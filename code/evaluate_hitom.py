@@ -2,44 +2,23 @@ import random
 import tqdm
 import argparse
 from simtom.simtom_hitom import *
-import collections
 import json
 import concurrent.futures
+import asyncio
 import threading
 import os
 from datetime import datetime
 from llm_utils import *
+from cache_utils import ResponseCache, PerspectiveCache, VisibilityCache
+from rate_limit import RateLimiter
+from usage_utils import TokenUsage, format_usage
+from decision_rules import get_decision_rules, format_decision_rules
+from replay import OFFLINE_MODEL_TYPES
+from result_log import ResultWriter, read_records, write_json_atomic
+from tracing import Tracer
+from batching import PromptCollector, WavefrontLanguageModel, BatchLanguageModel
 from new_decompose import TheoryOfMindSystem
-
-DATA_DIR_TELL = '../data/hitom_tell.jsonl'
-DATA_DIR_NO_TELL = '../data/hitom_no_tell.jsonl'
-
-# random.seed(0)
-def parse_hitom(file_path):
-    """
-    Parses HiToM data.
-
-    :param file_path: Path to the JSONL file.
-    :return: List of dictionaries representing each line in the file.
-    """
-    parsed_data = []
-
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line_number, line in enumerate(file, 1):
-                try:
-                    # Parse the line as JSON
-                    data = json.loads(line.strip())
-                    data["id"] = line_number  # Add a unique question ID
-                    parsed_data.append(data)
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON on line {line_number}: {e}")
-    except FileNotFoundError:
-        print(f"File not found: {file_path}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-    return parsed_data
+from dataset_utils import HitomDataset, run_bounded, run_bounded_async
 
 def start_task(llm,story, question, choices,note):
     story = "\n".join(story) if isinstance(story, list) else story
@@ -61,7 +40,7 @@ def start_task(llm,story, question, choices,note):
     Answer: 
 '''
     print(prompt)
-    answer = llm.get_output(prompt).strip().strip(".")
+    answer = llm.get_output(prompt, stage="baseline").strip().strip(".")
     return answer
 
 def start_task_cot(llm,story, question, choices,note):
@@ -79,45 +58,46 @@ def start_task_cot(llm,story, question, choices,note):
 
     Provide the relevant label alongside the answer when providing your answer (<option_label>: <answer>).
     '''
-    cot = llm.get_output(prompt)
+    cot = llm.get_output(prompt, stage="cot")
     answer = llm.get_output(f'''This is the provided explanation for a question: {cot}
     Provide the answer selected in the above solution. Answer with ONLY the correct choice. The answer should contain only a single word.
     Format: <option_letter>: <answer> 
-    Answer: ''').strip().strip(".")
+    Answer: ''', stage="cot_extract").strip().strip(".")
     return answer
 
 def evaluate_hitom():
-    tell_data = parse_hitom(DATA_DIR_TELL)
-    no_tell_data = parse_hitom(DATA_DIR_NO_TELL)
-    language_model = LanguageModel(model_name = args.model, model_type = args.model_type)
+    # One streaming pass indexes every entry by (order, length, split); entries are read back lazily
+    dataset = HitomDataset()
     # Create results directory if not exists
     results_dir = "../results"
     os.makedirs(results_dir, exist_ok=True)
 
-    # Create a unique log file name based on datetime
-    log_filename = os.path.join(results_dir, f"hitom_{args.method}_{args.num_problems}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-
-    # Group data into partitions, excluding order 0
-    partitions = collections.defaultdict(list)
-    for entry in tell_data + no_tell_data:
-        descriptor = entry.get("descriptor", {})
-        order = descriptor.get("order", 0)
-        length = descriptor.get("length", 0)
-        if order == 0:
-            continue  # Exclude order 0
-        type_ = "tell" if entry in tell_data else "no_tell"
-        partitions[(order, length, type_)].append(entry)
-
-    # Determine the number of problems to sample from each partition
-    if args.num_problems > 0:
-        total_partitions = len(partitions)
-        problems_per_partition = args.num_problems // total_partitions
-        selected_data = []
-
-        for partition, entries in partitions.items():
-            selected_data.extend(random.sample(entries, min(problems_per_partition, len(entries))))
+    # Create a unique log file name based on datetime, or continue the given one
+    if args.resume:
+        log_filename = args.resume
     else:
-        selected_data = [entry for partition in partitions.values() for entry in partition]
+        log_filename = os.path.join(results_dir, f"hitom_{args.method}_{args.num_problems}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    # The seed is stored next to the log so a resumed run samples the same problems.
+    meta_filename = os.path.splitext(log_filename)[0] + ".meta.json"
+    seed = args.seed
+    num_problems = args.num_problems
+    if args.resume and os.path.exists(meta_filename):
+        with open(meta_filename, "r", encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        seed, num_problems = meta["seed"], meta["num_problems"]
+        if meta.get("method") != args.method or meta.get("model") != args.model:
+            print(f"Warning: {log_filename} was produced with method={meta.get('method')}, model={meta.get('model')}")
+    elif args.resume:
+        print(f"Warning: no {meta_filename}; a sampled selection may differ from the original run")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    random.seed(seed)
+    # Only sampled runs can be resumed; a --random_example run leaves no sidecar behind.
+    if not args.random_example:
+        write_json_atomic(meta_filename, {"seed": seed, "num_problems": num_problems, "method": args.method, "model": args.model})
+
+    # Sample the same number of problems from each (order, length, split) partition
+    selected_keys = dataset.sample(num_problems)
 
     categories = {
         "order": {},
@@ -126,38 +106,41 @@ def evaluate_hitom():
     }
 
     lock = threading.Lock()
-    language_model = LanguageModel(model_name = args.model, model_type = args.model_type, temperature=0)
+    cache = ResponseCache(args.cache_path, max_entries=args.cache_max_entries, max_age=args.cache_max_age) if args.cache_path else None
+    perspective_cache = PerspectiveCache(args.perspective_cache or None) if args.perspective_cache is not None else None
+    visibility_cache = VisibilityCache(args.visibility_cache or None) if args.visibility_cache is not None else None
+    # One client per process: every system and worker shares these models and their connection pools.
+    rate_limiter = RateLimiter(args.rpm, args.tpm)
+    usage = TokenUsage()
+    language_model = LanguageModel(model_name = args.model, model_type = args.model_type, temperature=0, cache=cache, max_connections=args.max_connections, rate_limiter=rate_limiter, usage=usage, base_url=args.base_url, replay_path=args.replay)
+    async_model = AsyncLanguageModel(model_name = args.model, model_type = args.model_type, temperature=0, cache=cache, max_concurrency=args.max_in_flight, max_connections=args.max_connections, rate_limiter=rate_limiter, usage=usage, base_url=args.base_url, replay_path=args.replay) if args.async_execution or args.wavefront else None
+    if args.wavefront:
+        async_model = WavefrontLanguageModel(async_model)
+    if args.batch_api:
+        async_model = BatchLanguageModel(args.model, model_type=args.model_type, temperature=0, cache=cache, batch_dir=args.batch_dir, poll_interval=args.batch_poll_interval, base_url=args.base_url, usage=usage)
+    # Offline runs answer the simtom parser from the same trace instead of calling the API.
+    parser_type = args.model_type if args.model_type in OFFLINE_MODEL_TYPES else "openai"
+    parser_model = LanguageModel("gpt-4o-mini", model_type=parser_type, cache=cache, max_connections=args.max_connections, rate_limiter=rate_limiter, usage=usage, replay_path=args.replay) if args.method == "simtom" else None
 
     detailed_logs = []  # List to store detailed logs
+    trace_writer = ResultWriter(args.trace) if args.trace else None
+    span_writer = ResultWriter(args.spans) if args.spans else None
+    decision_rules = get_decision_rules("hitom") if args.shortcut_decisions else None
+    tracer = Tracer(span_writer) if span_writer else None
 
-    def process_entry(language_model, entry, category_name, categories, questionPrompt):
+    def make_system():
+        return TheoryOfMindSystem(mode = "hitom", model = args.model, model_type = args.model_type, cache = cache, language_model = language_model, async_model = async_model, parallel_decisions = args.parallel_decisions, decision_workers = args.decision_workers, rule_based_world = args.rule_based_world, rule_based_questions = args.rule_based_questions, perspective_cache = perspective_cache, prompt_layout = args.prompt_layout, trace = trace_writer, tracer = tracer, decision_rules = decision_rules, single_pass_filter = args.single_pass_filter, visibility_cache = visibility_cache, context_window = args.context_window, structured_outputs = args.structured_outputs)
+
+    def solve_entry(language_model, entry, questionPrompt):
         question = entry.get("question")
         options = {choice.split(". ")[1]: choice.split(". ")[0] for choice in entry.get("choices", [])}
-        correct_answer = entry.get("answer").split()[1].strip()
-        descriptor = entry.get("descriptor", {})
-
-        order = descriptor.get("order")
-        length = descriptor.get("length")
-        answer_label = options[correct_answer].strip(".").strip().lower()
-        if len(answer_label.split(" ")) > 1:
-            answer_label = 'a'
-
-        if order == 0:
-            return
-
         questionP = questionPrompt.format(question=question, choices=options)
-        if not args.random_example:
-            with lock:
-                if order not in categories["order"]:
-                    categories["order"][order] = {"correct": 0, "total": 0}
-                if length not in categories["length"]:
-                    categories["length"][length] = {"correct": 0, "total": 0}
-        system = TheoryOfMindSystem(mode = "hitom", model = args.model, model_type = args.model_type)
+        system = make_system()
         if args.method == "decompose":
             story = "\n".join(entry.get("story", []))
             result = system.start_task(story, question, entry.get("choices", []), entry.get("note")).lower()
         elif args.method == "simtom":
-            result, perspective = evalQuestion(language_model, entry, questionP, simModel=None)
+            result, perspective = evalQuestion(language_model, entry, questionP, simModel=None, parserModel=parser_model)
             result = result.lower()
         elif args.method == "baseline":
             disamb = system.disambiguate_story(entry.get("story", []))
@@ -167,48 +150,147 @@ def evaluate_hitom():
             disamb = system.disambiguate_story(entry.get("story", []))
             story = disamb + entry.get("story", [])
             result = start_task_cot(language_model, story, question, entry.get("choices", []), entry.get("note")).lower()
+        return result
+
+    def score_result(entry, result):
+        options = {choice.split(". ")[1]: choice.split(". ")[0] for choice in entry.get("choices", [])}
+        correct_answer = entry.get("answer").split()[1].strip()
+        answer_label = options[correct_answer].strip(".").strip().lower()
+        if len(answer_label.split(" ")) > 1:
+            answer_label = 'a'
+        is_correct = (correct_answer in result) or (result.strip()[0] == answer_label)
+        return f"{answer_label}: {correct_answer}", is_correct
+
+    def tally(categories, order, length, category_name, is_correct):
+        with lock:
+            if order not in categories["order"]:
+                categories["order"][order] = {"correct": 0, "total": 0}
+            if length not in categories["length"]:
+                categories["length"][length] = {"correct": 0, "total": 0}
+            if is_correct:
+                categories["order"][order]["correct"] += 1
+                categories["length"][length]["correct"] += 1
+                categories["tell_no_tell"][category_name]["correct"] += 1
+            categories["order"][order]["total"] += 1
+            categories["length"][length]["total"] += 1
+            categories["tell_no_tell"][category_name]["total"] += 1
+
+    def record_result(entry, category_name, categories, result):
+        descriptor = entry.get("descriptor", {})
+        order = descriptor.get("order")
+        length = descriptor.get("length")
+        correct_answer, is_correct = score_result(entry, result)
+
+        log_entry = {
+            "id": entry["id"],
+            "split": category_name,
+            "order": order,
+            "length": length,
+            "question": entry.get("question"),
+            "correct_answer": correct_answer,
+            "returned_answer": result,
+            "is_correct": is_correct
+        }
+        result_writer.write(log_entry)
+        tally(categories, order, length, category_name, is_correct)
+
+    def restore_results(categories):
+        """
+        Rebuild the tallies from the log being resumed.
+
+        :return: (split, id) of every problem already in the log.
+        """
+        completed = set()
+        for record in read_records(log_filename):
+            if "id" not in record:
+                continue  # Usage summary of an earlier run
+            if "split" in record:
+                tally(categories, record["order"], record["length"], record["split"], record["is_correct"])
+                completed.add((record["split"], record["id"]))
+                continue
+            # Logs written before resumption support do not record the split; match on the question.
+            matches = [(split, record["id"]) for split in ("tell", "no_tell")
+                       if (dataset.get((split, record["id"])) or {}).get("question") == record["question"]]
+            if len(matches) != 1:
+                print(f"Cannot match logged problem {record['id']} to the dataset; it will be evaluated again")
+                continue
+            entry = dataset.get(matches[0])
+            descriptor = entry.get("descriptor", {})
+            tally(categories, descriptor.get("order"), descriptor.get("length"), matches[0][0], score_result(entry, record["returned_answer"])[1])
+            completed.add(matches[0])
+        return completed
+
+    def process_entry(language_model, entry, category_name, categories, questionPrompt):
+        if entry.get("descriptor", {}).get("order") == 0:
+            return
+        result = solve_entry(language_model, entry, questionPrompt)
         if args.random_example:
             return result
+        record_result(entry, category_name, categories, result)
+
+    async def process_entry_async(language_model, entry, category_name, categories, questionPrompt):
+        if entry.get("descriptor", {}).get("order") == 0:
+            return
+        if args.method == "decompose":
+            system = make_system()
+            story = "\n".join(entry.get("story", []))
+            result = (await system.start_task_async(story, entry.get("question"), entry.get("choices", []), entry.get("note"))).lower()
         else:
-            log_entry = {
-                "id": entry["id"],
-                "question": question,
-                "correct_answer": f"{answer_label}: {correct_answer}",
-                "returned_answer": result
-            }
-            with lock:
-                with open(log_filename, "a") as log_file:
-                    json.dump(log_entry, log_file)
-                    log_file.write("\n")
-
-
-            with lock:
-                if (correct_answer in result) or (result.strip()[0] == answer_label):
-                    categories["order"][order]["correct"] += 1
-                    categories["length"][length]["correct"] += 1
-                    categories["tell_no_tell"][category_name]["correct"] += 1
-                categories["order"][order]["total"] += 1
-                categories["length"][length]["total"] += 1
-                categories["tell_no_tell"][category_name]["total"] += 1
+            # The other methods only have a blocking implementation.
+            result = await asyncio.to_thread(solve_entry, language_model, entry, questionPrompt)
+        record_result(entry, category_name, categories, result)
+
+    async def process_all_async():
+        # Entries are loaded as problems are started, with at most max_pending_problems in flight.
+        progress = tqdm.tqdm(total=len(selected_keys), desc="Processing Selected Data (Async)")
+        process = lambda entry: process_entry_async(language_model, entry, entry["split"], categories, questionPrompt)
+        async for task in run_bounded_async(process, dataset.entries(selected_keys), args.max_pending_problems):
+            task.result()
+            progress.update()
+        progress.close()
+
+    if args.resume and not args.random_example:
+        completed = restore_results(categories)
+        selected_keys = [key for key in selected_keys if key not in completed]
+        print(f"Resuming {log_filename}: {len(completed)} problems already evaluated, {len(selected_keys)} remaining")
+
     if args.random_example:
-        random_entry = random.choice(selected_data)
+        random_entry = dataset.get(random.choice(selected_keys))
         result = process_entry(language_model,random_entry,"","",questionPrompt)
+        if trace_writer:
+            trace_writer.close()
+        if span_writer:
+            span_writer.close()
         story_text = "\n".join(random_entry.get("story", []))
         choices_text = "\n".join(random_entry.get("choices", []))
         correct_answer = random_entry.get("answer")
         print(f"Question: {story_text} \nChoices: {choices_text} \n{correct_answer}\nGiven Result: {result}")
         return
+    # A single writer thread owns the log; workers only enqueue their results.
+    result_writer = ResultWriter(log_filename)
+    if async_model is not None:
+        asyncio.run(process_all_async())
     elif args.parallel_execution:
         with concurrent.futures.ThreadPoolExecutor(max_workers=args.num_parallel) as executor:
-            futures = []
-            for entry in tqdm.tqdm(selected_data, desc="Processing Selected Data (Parallel)"):
-                category_name = "tell" if entry in tell_data else "no_tell"
-                futures.append(executor.submit(process_entry, language_model, entry, category_name, categories, questionPrompt))
-            concurrent.futures.wait(futures)
+            # Keep the executor's queue short instead of loading and submitting every entry up front.
+            process = lambda entry: process_entry(language_model, entry, entry["split"], categories, questionPrompt)
+            completed_futures = run_bounded(executor, process, dataset.entries(selected_keys), 2 * args.num_parallel)
+            for future in tqdm.tqdm(completed_futures, total=len(selected_keys), desc="Processing Selected Data (Parallel)"):
+                future.result()
     else:
-        for entry in tqdm.tqdm(selected_data, desc="Processing Selected Data (Sequential)"):
-            category_name = "tell" if entry in tell_data else "no_tell"
+        for entry in tqdm.tqdm(dataset.entries(selected_keys), total=len(selected_keys), desc="Processing Selected Data (Sequential)"):
+            category_name = entry["split"]
             process_entry(language_model, entry, category_name, categories, questionPrompt)
+    # The run's usage goes last in the log; readers of the log skip it as it has no problem id.
+    summary = {"usage": usage.stats()}
+    if decision_rules:
+        summary["decision_rules"] = decision_rules.stats()
+    result_writer.write(summary)
+    result_writer.close()
+    if trace_writer:
+        trace_writer.close()
+    if span_writer:
+        span_writer.close()
 
     for category, stats in categories.items():
         if category == "tell_no_tell":
@@ -239,17 +321,69 @@ def evaluate_hitom():
     for category, stats in categories["tell_no_tell"].items():
         print(f"  {category.capitalize()}: {stats['accuracy']:.2f}%")
     print("------------------------\n")
+    stats = usage.stats()
+    if stats['requests']:
+        print(format_usage(stats))
+    if decision_rules:
+        print(format_decision_rules(decision_rules.stats()))
+    if rate_limiter.throttled:
+        print(f"Rate limiter delayed {rate_limiter.throttled} requests")
+    if args.model_type in OFFLINE_MODEL_TYPES:
+        stats = language_model.model.stats()
+        print(f"Replay: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate) from {stats['entries']} recorded responses")
+    if isinstance(async_model, PromptCollector):
+        stats = async_model.stats()
+        print(f"Stage-wise scheduling: {stats['requests']} requests in {stats['waves']} waves ({stats['mean_wave_size']:.1f} per wave)")
+    if perspective_cache:
+        stats = perspective_cache.stats()
+        print(f"Perspective cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate)")
+    if visibility_cache:
+        stats = visibility_cache.stats()
+        print(f"Visibility cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate), {stats['entries']} agent rows")
+    if cache:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2f}% hit rate), {stats['entries']} entries")
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--category', type=str, default='all')
     parser.add_argument("--model", type=str, default="gpt-4o", help="Name of intended model to conduct analysis")
-    parser.add_argument("--model_type", type=str, default="openai",choices=["openai", "gemini","local"],help="Select a model type.")
+    parser.add_argument("--model_type", type=str, default="openai",choices=["openai", "gemini","local","replay","mock"],help="Select a model type ('replay' and 'mock' answer offline, see --replay).")
+    parser.add_argument('--base_url', type=str, default=None, help="Endpoint of an OpenAI-compatible server (default for 'local': http://localhost:30000/v1).")
+    parser.add_argument('--replay', type=str, default=None, metavar="TRACE", help="Trace recorded with --trace that answers 'replay' (required) and 'mock' (optional) model types.")
     parser.add_argument('--parallel_execution', action='store_true', help="Enable or disable parallel execution.")
     parser.add_argument('--random_example', action='store_true', help="Evaluate a single random example from the dataset.")
     parser.add_argument('--method', type=str, choices=['cot', 'baseline', 'simtom','decompose'], default='baseline', help="Method to use for evaluation.")
     parser.add_argument('--num_problems', type=int, default=0, help="Number of problems to evaluate.")
     parser.add_argument('--num_parallel', type=int, default=os.cpu_count(), help="Number of threads for parallel execution.")
+    parser.add_argument('--async_execution', action='store_true', help="Run all problems concurrently on a single asyncio event loop.")
+    parser.add_argument('--max_in_flight', type=int, default=64, help="Maximum number of concurrent LLM requests in async execution.")
+    parser.add_argument('--max_pending_problems', type=int, default=1024, help="Maximum number of problems loaded and in progress at once in async execution.")
+    parser.add_argument('--shortcut_decisions', action='store_true', help="Decompose: resolve knowledge decisions that the decision rules settle (own actions, exits, public and private communication) without calling the LLM.")
+    parser.add_argument('--single_pass_filter', action='store_true', help="Decompose: filter the story for all agents of a nested question in one pass over the original story instead of once per level.")
+    parser.add_argument('--parallel_decisions', action='store_true', help="Decompose: decide all sentences of a story concurrently against a precomputed world trajectory.")
+    parser.add_argument('--decision_workers', type=int, default=8, help="Threads per problem for concurrent sentence decisions.")
+    parser.add_argument('--rule_based_world', action='store_true', help="Decompose: track agent locations with HiToM sentence templates instead of LLM world updates.")
+    parser.add_argument('--rule_based_questions', action='store_true', help="Decompose: parse the nested agents of HiToM questions from their template instead of asking the LLM.")
+    parser.add_argument('--context_window', type=int, default=None, metavar="N", help="Decompose: send each knowledge decision only the N statements before it (default layout; the world state covers the rest).")
+    parser.add_argument('--structured_outputs', action='store_true', help="Decompose: request knowledge decisions and answers as JSON constrained to yes/no or the choices (response_format), so they need no follow-up parsing calls.")
+    parser.add_argument('--prompt_layout', type=str, choices=['default', 'prefix_cache'], default='default', help="Decompose: 'prefix_cache' puts the rules and the full story before the per-statement fields of decision prompts, so prompt caches can reuse them.")
+    parser.add_argument('--visibility_cache', nargs='?', const="", default=None, metavar="PATH", help="Decompose: decide each agent's knowledge of every sentence of a story once and filter all questions on the story from these rows, optionally persisted to PATH.")
+    parser.add_argument('--perspective_cache', nargs='?', const="", default=None, metavar="PATH", help="Decompose: share filtered stories across questions with the same story and agent chain, optionally persisted to PATH.")
+    parser.add_argument('--max_connections', type=int, default=None, help="Size of the shared HTTP keep-alive connection pool.")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests per minute allowed by the provider (otherwise sized from rate-limit response headers).")
+    parser.add_argument('--tpm', type=float, default=None, help="Tokens per minute allowed by the provider (otherwise sized from rate-limit response headers).")
+    parser.add_argument('--wavefront', action='store_true', help="Decompose: advance all problems one stage at a time and send each stage's prompts as one concurrent wave.")
+    parser.add_argument('--batch_api', action='store_true', help="Decompose: submit each stage's prompts across problems through the Batch API instead of the chat endpoint.")
+    parser.add_argument('--batch_dir', type=str, default='../results/batches', help="Directory for batch input files and the manifest of submitted batches.")
+    parser.add_argument('--batch_poll_interval', type=float, default=30.0, help="Seconds between batch status checks.")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed for problem sampling (stored next to the log).")
+    parser.add_argument('--resume', type=str, default=None, metavar="LOG", help="Continue an interrupted run: skip the problems already in LOG and append the rest to it.")
+    parser.add_argument('--trace', type=str, default=None, metavar="PATH", help="Decompose: write every prompt and response to PATH as JSON lines (gzip/zstd compressed for .gz/.zst paths).")
+    parser.add_argument('--spans', type=str, default=None, metavar="PATH", help="Decompose: write a tracing span per step (start_task, task, data, decide, get_response, ...) to PATH as JSON lines; profile with tracing.py.")
+    parser.add_argument('--cache_path', type=str, default=None, help="Path to an SQLite response cache for temperature 0 requests.")
+    parser.add_argument('--cache_max_entries', type=int, default=None, help="Maximum number of cached responses.")
+    parser.add_argument('--cache_max_age', type=float, default=None, help="Maximum age of a cached response in seconds.")
 
 
     global args
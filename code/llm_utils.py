@@ -1,17 +1,69 @@
 import os
+import asyncio
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import time
+import threading
+import httpx
 from typing import *
 import google.genai as genai
 from google.genai.types import HarmCategory, HarmBlockThreshold
+from cache_utils import ResponseCache, request_key
+from rate_limit import RateLimiter, estimate_tokens, retry_delay
+from usage_utils import TokenUsage
+from tracing import annotate
+from replay import OFFLINE_MODEL_TYPES, get_offline_client
+
+LOCAL_BASE_URL = "http://localhost:30000/v1"
+# Backends that do not bill their requests, so they are left out of the estimated cost.
+UNBILLED_MODEL_TYPES = ["local"] + OFFLINE_MODEL_TYPES
+DEFAULT_MAX_CONNECTIONS = 100
+KEEPALIVE_EXPIRY = 60.0
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx responses.
+RETRYABLE_ERRORS = (ValueError, openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# Process-wide registry of OpenAI clients, so every LanguageModel pointing at the same
+# endpoint shares one HTTP connection pool instead of opening its own.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key: str, base_url: str | None = None, max_connections: int | None = None, use_async: bool = False):
+    """
+    Return a shared OpenAI client for an endpoint, creating it on first use.
+
+    :param api_key: API key for the endpoint.
+    :param base_url: Endpoint URL, or None for the OpenAI API.
+    :param max_connections: Size of the keep-alive connection pool (default: DEFAULT_MAX_CONNECTIONS).
+    :param use_async: Return an AsyncOpenAI client instead of a blocking one.
+    """
+    max_connections = max_connections or DEFAULT_MAX_CONNECTIONS
+    key = (api_key, base_url, max_connections, use_async)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            )
+            # The SDK's own retries would bypass the rate limiter and multiply our retry loop's attempts.
+            if use_async:
+                client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=openai.DefaultAsyncHttpxClient(limits=limits))
+            else:
+                client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=openai.DefaultHttpxClient(limits=limits))
+            _clients[key] = client
+        return client
 
 class LanguageModel:
-    def __init__(self, model_name, api_key=None, temperature=0.0, model_type="openai"):
+    def __init__(self, model_name, api_key=None, temperature=0.0, model_type="openai", cache: ResponseCache | None = None, max_connections: int | None = None, rate_limiter: RateLimiter | None = None, usage: TokenUsage | None = None, base_url: str | None = None, replay_path: str | None = None):
         self.model_name = model_name
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.usage = usage if usage is not None else TokenUsage()
         self.model_type = model_type
-        if self.model_type not in ["openai", "gemini", "local"]:
-            print("Error: Model type can only be openai, gemini, local. Using openai.")
+        if self.model_type not in ["openai", "gemini", "local"] + OFFLINE_MODEL_TYPES:
+            print("Error: Model type can only be openai, gemini, local, replay, mock. Using openai.")
         self.temperature = temperature
         self.model=None
         if api_key == None:
@@ -21,46 +73,83 @@ class LanguageModel:
                 api_key = os.getenv("GEMINI_API_KEY")
             else:
                 api_key = "token123"
-        if self.model_type=="openai":
-            openai_client = OpenAI(api_key=api_key)
-            self.model = openai_client
+        if self.model_type in OFFLINE_MODEL_TYPES:
+            self.model = get_offline_client(self.model_type, replay_path)
+        elif self.model_type=="openai":
+            self.model = get_client(api_key, base_url=base_url, max_connections=max_connections)
         elif self.model_type=="gemini":
             genai.configure(api_key=api_key)
             generation_config = genai.GenerationConfig(temperature=0)
             self.model = genai.GenerativeModel(model_name = self.model_name, generation_config = generation_config)
         else:
-            openai_client = OpenAI(
-                base_url="http://localhost:30000/v1",
-                api_key=api_key,
-            )
-            self.model = openai_client
-    def get_output(self, prompt:str, retry_count=10) -> str:
+            self.model = get_client(api_key, base_url=base_url or LOCAL_BASE_URL, max_connections=max_connections)
+    def get_output(self, prompt:str, retry_count=10, stage: str | None = None, response_format: dict | None = None) -> str:
+        """
+        :param stage: Pipeline stage issuing the prompt, used to attribute its token usage and latency.
+        :param response_format: Optional JSON schema `response_format` (see structured_outputs) the output
+                                must follow. Ignored by Gemini models.
+        """
+        # Only deterministic (temperature 0) requests are served from the cache.
+        key = None
+        if self.cache is not None and self.temperature == 0:
+            key = request_key(self.model_name, self.model_type, self.temperature, prompt, *([response_format] if response_format else []))
+            cached = self.cache.get(key)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return cached
+        output = self.generate(prompt, retry_count, stage, response_format)
+        if key is not None and output is not None:
+            self.cache.put(key, output)
+        return output
+
+    def generate(self, prompt:str, retry_count=10, stage: str | None = None, response_format: dict | None = None) -> str:
+        if self.model_type in OFFLINE_MODEL_TYPES:
+            start = time.perf_counter()
+            output = self.model.respond(prompt, response_format)
+            self.usage.record(self.model.usage(prompt, output), stage=stage, seconds=time.perf_counter() - start, model=self.model_name, billed=False)
+            return output
+
         if self.model_type =="openai" or self.model_type=="local":
             messages = [
                 {"role": "system", "content": f"{prompt}"},
             ]
+            extra = {"response_format": response_format} if response_format else {}
 
+            attempt = 0
             while retry_count > 0:
+                estimated = estimate_tokens(prompt)
+                if self.rate_limiter:
+                    self.rate_limiter.acquire(estimated)
                 try:
-                    res = self.model.chat.completions.create(
+                    start = time.perf_counter()
+                    raw = self.model.chat.completions.with_raw_response.create(
                         model=self.model_name,
                         # reasoning_effort="high",
                         messages=messages,
-                        temperature = self.temperature
+                        temperature = self.temperature,
+                        **extra
                     )
+                    res = raw.parse()
+                    self.usage.record(res.usage, stage=stage, seconds=time.perf_counter() - start, model=self.model_name, billed=self.model_type not in UNBILLED_MODEL_TYPES)
+                    if self.rate_limiter:
+                        self.rate_limiter.update_from_headers(raw.headers)
+                        self.rate_limiter.settle(estimated, res.usage.total_tokens if res.usage else None)
                     output = res.choices[0].message.content
-                    
+                    annotate(retries=attempt)
                     return output
-                except ValueError as e:
+                except RETRYABLE_ERRORS as e:
                     print(f"Attempt failed with error: {e}")
                     retry_count -= 1
+                    attempt += 1
                     if retry_count > 0:
-                        print("Retrying...")
-                        time.sleep(10)
+                        delay = retry_delay(e, attempt)
+                        print(f"Retrying in {delay:.1f}s...")
+                        time.sleep(delay)
                     else:
                         print("All attempts failed.")
 
         if self.model_type == "gemini":
+            attempt = 0
             while retry_count > 0:
                 try:
                     ans = model.generate_content(prompt, safety_settings={
@@ -73,9 +162,101 @@ class LanguageModel:
                 except Exception as e:
                     print(f"Attempt failed with error: {e}")
                     retry_count -= 1
+                    attempt += 1
                     if retry_count > 0:
-                        print("Retrying...")
-                        time.sleep(10)
+                        delay = retry_delay(e, attempt)
+                        print(f"Retrying in {delay:.1f}s...")
+                        time.sleep(delay)
                     else:
                         print("All attempts failed.")
 
+
+
+class AsyncLanguageModel:
+    """
+    asyncio counterpart of LanguageModel built on the async OpenAI client.
+
+    A semaphore bounds the number of requests in flight, so a single event loop
+    can drive many problems concurrently without one OS thread per request.
+    """
+    def __init__(self, model_name, api_key=None, temperature=0.0, model_type="openai", cache: ResponseCache | None = None, max_concurrency: int = 64, max_connections: int | None = None, rate_limiter: RateLimiter | None = None, usage: TokenUsage | None = None, base_url: str | None = None, replay_path: str | None = None):
+        self.model_name = model_name
+        self.model_type = model_type
+        self.temperature = temperature
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.usage = usage if usage is not None else TokenUsage()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        if self.model_type == "gemini":
+            # There is no async Gemini path; run the blocking client in worker threads instead.
+            self.model = LanguageModel(model_name, api_key=api_key, temperature=temperature, model_type=model_type, rate_limiter=rate_limiter, usage=self.usage)
+            return
+        if self.model_type in OFFLINE_MODEL_TYPES:
+            self.model = get_offline_client(self.model_type, replay_path)
+            return
+        if self.model_type not in ["openai", "local"]:
+            print("Error: Model type can only be openai, gemini, local, replay, mock. Using openai.")
+        if api_key == None:
+            api_key = os.getenv("OPENAI_API_KEY") if self.model_type == "openai" else "token123"
+        if base_url is None and self.model_type == "local":
+            base_url = LOCAL_BASE_URL
+        self.model = get_client(api_key, base_url=base_url, max_connections=max_connections or max_concurrency, use_async=True)
+
+    async def get_output(self, prompt:str, retry_count=10, stage: str | None = None, response_format: dict | None = None) -> str:
+        key = None
+        if self.cache is not None and self.temperature == 0:
+            key = request_key(self.model_name, self.model_type, self.temperature, prompt, *([response_format] if response_format else []))
+            cached = self.cache.get(key)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return cached
+        async with self.semaphore:
+            output = await self.generate(prompt, retry_count, stage, response_format)
+        if key is not None and output is not None:
+            self.cache.put(key, output)
+        return output
+
+    async def generate(self, prompt:str, retry_count=10, stage: str | None = None, response_format: dict | None = None) -> str:
+        if self.model_type == "gemini":
+            return await asyncio.to_thread(self.model.generate, prompt, retry_count, stage)
+        if self.model_type in OFFLINE_MODEL_TYPES:
+            # Yield to the event loop as a real request would, so scheduling stays representative.
+            start = time.perf_counter()
+            await asyncio.sleep(0)
+            output = self.model.respond(prompt, response_format)
+            self.usage.record(self.model.usage(prompt, output), stage=stage, seconds=time.perf_counter() - start, model=self.model_name, billed=False)
+            return output
+        messages = [
+            {"role": "system", "content": f"{prompt}"},
+        ]
+        extra = {"response_format": response_format} if response_format else {}
+        attempt = 0
+        while retry_count > 0:
+            estimated = estimate_tokens(prompt)
+            if self.rate_limiter:
+                await self.rate_limiter.acquire_async(estimated)
+            try:
+                start = time.perf_counter()
+                raw = await self.model.chat.completions.with_raw_response.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature = self.temperature,
+                    **extra
+                )
+                res = raw.parse()
+                self.usage.record(res.usage, stage=stage, seconds=time.perf_counter() - start, model=self.model_name, billed=self.model_type not in UNBILLED_MODEL_TYPES)
+                if self.rate_limiter:
+                    self.rate_limiter.update_from_headers(raw.headers)
+                    self.rate_limiter.settle(estimated, res.usage.total_tokens if res.usage else None)
+                annotate(retries=attempt)
+                return res.choices[0].message.content
+            except RETRYABLE_ERRORS as e:
+                print(f"Attempt failed with error: {e}")
+                retry_count -= 1
+                attempt += 1
+                if retry_count > 0:
+                    delay = retry_delay(e, attempt)
+                    print(f"Retrying in {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+                else:
+                    print("All attempts failed.")
@@ -1,18 +1,62 @@
 from openai import OpenAI
 import copy
+import contextlib
 import re
 import time
-from llm_utils import LanguageModel
+import asyncio
+import concurrent.futures
+from llm_utils import LanguageModel, AsyncLanguageModel
+from cache_utils import ResponseCache, PerspectiveCache, VisibilityCache
+from world_tracker import ConversationState, HitomWorldTracker, WorldState, WorldTrajectory
+from decision_rules import DecisionRules
+from result_log import ResultWriter
+from tracing import Tracer, annotate, in_current_context, prompt_hash
+from story_view import StoryView
+from structured_outputs import DECISION_FORMAT, choice_format, parse_field
+from perspective import PerspectiveChain, parse_hitom_question, NARRATOR, MAX_CHAIN_DEPTH
 from prompts.decompose_fantom_prompts import *
 from prompts.decompose_hitom_prompts import *
 from prompts.decompose_generic_prompts import *
 
 class TheoryOfMindSystem:
-    def __init__(self, mode: str | None = None, delimiter: str | None = None, model: str = "gpt-4o", model_type: str = "openai"):
+    def __init__(self, mode: str | None = None, delimiter: str | None = None, model: str = "gpt-4o", model_type: str = "openai", cache: ResponseCache | None = None, language_model: LanguageModel | None = None, async_model: AsyncLanguageModel | None = None, parallel_decisions: bool = False, decision_workers: int = 8, rule_based_world: bool = False, rule_based_questions: bool = False, perspective_cache: PerspectiveCache | None = None, prompt_layout: str = "default", trace: ResultWriter | None = None, tracer: Tracer | None = None, decision_rules: DecisionRules | None = None, single_pass_filter: bool = False, visibility_cache: VisibilityCache | None = None, context_window: int | None = None, structured_outputs: bool = False):
         """
         Initialize the TheoryOfMindSystem.
 
         :param mode: Operation mode - 'hitom','fantom' or None
+        :param cache: Optional response cache shared with other systems.
+        :param language_model: Optional LanguageModel to use instead of constructing one, so systems
+                               can share a client (model, model_type and cache are then ignored).
+        :param async_model: Optional AsyncLanguageModel used by the *_async methods. Share one
+                            instance across systems so its semaphore bounds all requests in flight.
+        :param parallel_decisions: Compute the world-state trajectory first, then issue all per-sentence
+                                   knowledge decisions concurrently instead of one sentence at a time.
+        :param decision_workers: Number of threads used for concurrent decisions in the blocking path.
+        :param rule_based_world: In 'hitom' mode, track agent locations with HitomWorldTracker and only
+                                 ask the LLM about sentences that match no known template.
+        :param rule_based_questions: In 'hitom' mode, decompose templated questions into their perspective
+                                     chain with parse_hitom_question instead of get_agent/sim_question calls.
+        :param perspective_cache: Optional memo of filtered stories shared across systems and questions.
+        :param prompt_layout: 'default' sends each decision the story up to its statement; 'prefix_cache'
+                              sends the rules and the full numbered story first, so all decisions on a
+                              story share one prompt prefix that provider/server prompt caches can reuse.
+        :param trace: Optional ResultWriter (or any object with a write(record) method) that receives every
+                      prompt and response of the system with its stage and latency.
+        :param tracer: Optional Tracer that records nested spans (start_task > task > data > decide >
+                       get_response) with prompt hashes, token counts, latency and retries.
+        :param decision_rules: Optional pre-classifier (see decision_rules.py) that resolves statements the
+                               decision rules already settle, such as an agent's own actions, without a call.
+        :param single_pass_filter: Filter the story for all agents of a nested question in one pass over the
+                                   original story (see data_chain) instead of re-filtering it once per level.
+        :param visibility_cache: Optional memo of per-agent visibility rows shared across systems and questions.
+                                 Stories are then filtered for an agent chain by combining the rows of its
+                                 agents (see filter_visible), and each row is decided once per story.
+        :param context_window: In the 'default' layout, send each knowledge decision only the last context_window
+                               statements before it (the world state covers the rest); None sends all of them.
+        :param structured_outputs: Request knowledge decisions and answers as JSON with a constrained yes/no or
+                                   choice field (see structured_outputs.py), so they parse without the
+                                   decide_yes_no/decide_ambiguous/extract_choice follow-up calls. Outputs that
+                                   still do not parse (e.g. from backends that ignore the format) fall back to them.
         """
         self.memory = {}
         self.agent = None
@@ -25,7 +69,23 @@ class TheoryOfMindSystem:
         self.delimiter= "."
         self.mode=""
         self.counter = None
-        self.model = LanguageModel(model_name=model, model_type=model_type)
+        self.perspective = None
+        self.model = language_model if language_model is not None else LanguageModel(model_name=model, model_type=model_type, cache=cache)
+        self.async_model = async_model
+        self.parallel_decisions = parallel_decisions
+        self.decision_workers = decision_workers
+        self.rule_based_world = rule_based_world
+        self.rule_based_questions = rule_based_questions
+        self.perspective_cache = perspective_cache
+        self.prompt_layout = prompt_layout
+        self.trace = trace
+        self.tracer = tracer
+        self.decision_rules = decision_rules
+        self.single_pass_filter = single_pass_filter
+        self.visibility_cache = visibility_cache
+        self.context_window = context_window
+        self.structured_outputs = structured_outputs
+        self.story_agents = None
         if mode:
             self.mode=mode
         else:
@@ -37,27 +97,44 @@ class TheoryOfMindSystem:
 
     # ---------------------- Setup World ----------------------
 
-    def setup_world(self, story: str) -> str:
+    def setup_world_prompt(self, story: str) -> str:
+        if self.mode == 'fantom':
+            return f"Return a comma separated list of agents who are participating in the given conversation at the start (before anyone else enters the conversation) \nConversation: {story}"
+        return PROMPT_SETUP_WORLD_STORY.format(story=story)
+
+    def build_world(self, state: str) -> str:
+        raw = [name.strip() for name in state.strip().strip(".").split(",")]
+        names = [WorldState.clean_name(name) for name in raw]
+        if names != raw:
+            # e.g. "Locations: kitchen"; a separator left in a name would corrupt every later update.
+            annotate(world_repaired=True)
+        names = [name for name in names if name]
         if self.mode == 'fantom':
-            chars = self.get_response(f"Return a comma separated list of agents who are participating in the given conversation at the start (before anyone else enters the conversation) \nConversation: {story}")
-            world = f"in_conversation: [{chars}], out_of_conversation: [insert agents]"
-            return world
+            world = ConversationState(["in_conversation", "out_of_conversation"], {agent: "in_conversation" for agent in names})
         else:
-            state = self.get_response(PROMPT_SETUP_WORLD_STORY.format(story=story))
             self.locations = state
-            states = state.strip().strip(".").split(",")
-            world = ""
-            for loc in states:
-                world += f"{loc.strip()}: [insert agents], "
-            world += "Unknown: [insert agents]"
-            return world
+            world = WorldState(names)
+        return world.render()
+
+    def parse_world(self, world: str) -> WorldState:
+        return (ConversationState if self.mode == 'fantom' else WorldState).parse(world)
+
+    def setup_world(self, story: str) -> str:
+        with self.span("setup_world"):
+            return self.build_world(self.get_response(self.setup_world_prompt(story), stage="setup_world"))
+
+    async def setup_world_async(self, story: str) -> str:
+        with self.span("setup_world"):
+            return self.build_world(await self.get_response_async(self.setup_world_prompt(story), stage="setup_world"))
 
     # ---------------------- Disambiguate Story (Only for 'hitom') ----------------------
 
-    def disambiguate_story(self, story: str) -> list:
+    @staticmethod
+    def disambiguate_story(story: str) -> list:
         """
         Analyzes the story to find ambiguous location references and adds sentences
-        to disambiguate them at the beginning of the story.
+        to disambiguate them at the beginning of the story. Purely rule based, so callers
+        outside the system (e.g. SimToM) need no model to use it.
 
         :param story: List of sentences representing the story.
         :return: Updated story with disambiguating sentences at the beginning.
@@ -92,164 +169,624 @@ class TheoryOfMindSystem:
 
     # ---------------------- Get Agent ----------------------
 
-    def get_agent(self, question: str) -> str:
-        prompt = PROMPT_GET_AGENT.format(question=question)
-        char = self.get_response(prompt).strip()
-        if len(char.split(" ")) > 1:
-            char = self.get_response(PROMPT_HANDLE_MULTIWORD_AGENT.format(response=char))
+    def normalize_agent(self, char: str) -> str:
         if char.lower() in ["you", "i", "we"]:
             char = "Narrator"
         return char.strip().strip(".").lower()
 
+    def get_agent(self, question: str) -> str:
+        prompt = PROMPT_GET_AGENT.format(question=question)
+        char = self.get_response(prompt, stage="get_agent").strip()
+        if len(char.split(" ")) > 1:
+            char = self.get_response(PROMPT_HANDLE_MULTIWORD_AGENT.format(response=char), stage="get_agent_multiword")
+        return self.normalize_agent(char)
+
+    async def get_agent_async(self, question: str) -> str:
+        prompt = PROMPT_GET_AGENT.format(question=question)
+        char = (await self.get_response_async(prompt, stage="get_agent")).strip()
+        if len(char.split(" ")) > 1:
+            char = await self.get_response_async(PROMPT_HANDLE_MULTIWORD_AGENT.format(response=char), stage="get_agent_multiword")
+        return self.normalize_agent(char)
+
     # ---------------------- Simulate Question ----------------------
 
     def sim_question(self, question: str, agent_name: str) -> str:
         prompt = PROMPT_SIM_QUESTION.format(agent_name=agent_name, question=question)
-        qn = self.get_response(prompt)
+        qn = self.get_response(prompt, stage="sim_question")
         return qn
 
+    async def sim_question_async(self, question: str, agent_name: str) -> str:
+        prompt = PROMPT_SIM_QUESTION.format(agent_name=agent_name, question=question)
+        return await self.get_response_async(prompt, stage="sim_question")
+
     # ---------------------- Decide Knowledge ----------------------
 
-    def decide(self, story: str, part: str, agent: str, glob_world_model: str, note: str):
+    def decide_prompt(self, story: str, part: str, agent: str, glob_world_model: str, note: str, index: int | None = None) -> str:
+        if self.prompt_layout == 'prefix_cache':
+            return self.cached_decide_prompt(story, part, agent, glob_world_model, note, index)
         if self.mode == 'hitom':
-            prompt = PROMPT_DECIDE_KNOWLEDGE_HITOM.format(
+            return PROMPT_DECIDE_KNOWLEDGE_HITOM.format(
                 disamb=self.disamb,
                 story=story,
                 part=part,
                 agent=agent,
                 glob_world_model=glob_world_model
             )
-            decision = self.get_response(prompt)
         elif self.mode == 'fantom':
-            prompt = PROMPT_DECIDE_KNOWLEDGE_FANTOM.format(
+            return PROMPT_DECIDE_KNOWLEDGE_FANTOM.format(
                 story=story,
                 part=part,
                 agent=agent,
                 glob_world_model=glob_world_model
             )
-            decision = self.get_response(prompt)
         else:
-            prompt = PROMPT_DECIDE_KNOWLEDGE_GENERIC.format(
+            return PROMPT_DECIDE_KNOWLEDGE_GENERIC.format(
+                disamb=self.disamb or "",
                 story=story,
                 note=note,
                 part=part,
                 agent=agent,
                 glob_world_model=glob_world_model
             )
-        ans = "yes"  # Default answer
+
+    def cached_decide_prompt(self, story: str, part: str, agent: str, glob_world_model: str, note: str, index: int) -> str:
+        """
+        Decision prompt with the static rules and full story first and the per-statement fields last.
+
+        :param story: The full numbered story (see decision_stories).
+        :param index: 1-based number of the statement in the story.
+        """
+        if self.mode == 'hitom':
+            template = PROMPT_DECIDE_KNOWLEDGE_HITOM_CACHED
+        elif self.mode == 'fantom':
+            template = PROMPT_DECIDE_KNOWLEDGE_FANTOM_CACHED
+        else:
+            template = PROMPT_DECIDE_KNOWLEDGE_GENERIC_CACHED
+        return template.format(
+            disamb=self.disamb or "",
+            story=story,
+            note=note,
+            index=index,
+            part=part,
+            agent=agent,
+            glob_world_model=glob_world_model
+        )
+
+    def decision_format(self) -> dict | None:
+        return DECISION_FORMAT if self.structured_outputs else None
+
+    def parse_decision(self, decision: str) -> str | None:
+        """
+        Extract the yes/no answer from a decision, or None if it needs a follow-up call.
+        """
+        if self.structured_outputs:
+            ans = parse_field(decision, "answer", ["yes", "no"])
+            annotate(structured_fallback=ans is None)
+            if ans is not None:
+                return ans
         match = re.search(r'Answer: (\w+)', decision)
         if match:
-            ans = match.group(1).strip(".").lower()
+            return match.group(1).strip(".").lower()
+        return None
+
+    def world_check_prompt(self, part: str) -> str:
+        if self.mode == 'fantom':
+            return f"Does the given dialogue involve the speaker leaving the conversation?\n Dialogue: {part}. \nAnswer in only yes/no with no other text\n Answer: : "
+        return f"Does the given statement involve an agent (or multiple agents) entering or exiting a location?\n Statement: {part}. \nAnswer in only yes/no with no other text\n Answer: : "
+
+    def world_update_prompt(self, glob_world_model: str, part: str) -> str:
+        if self.mode == 'hitom':
+            template = PROMPT_UPDATE_WORLD_HITOM
+        elif self.mode == 'fantom':
+            template = PROMPT_UPDATE_WORLD_FANTOM
         else:
-            dec = self.get_response(PROMPT_YES_NO_DECISION.format(decision=decision))
-            ans = dec.strip().strip(".").lower()
+            template = PROMPT_UPDATE_WORLD_GENERIC
+        return template.format(glob_world_model=glob_world_model, part=part)
+
+    def rule_decision(self, part: str, agent: str) -> bool | None:
+        """
+        :return: Whether the agent knows the statement if the decision rules settle it, otherwise None.
+        """
+        if self.decision_rules is None:
+            return None
+        decision = self.decision_rules.decide(part, agent, self.story_agents)
+        if decision is None:
+            return None
+        known, rule = decision
+        annotate(rule=rule, known=known)
+        return known
+
+    def decide_knowledge(self, story: str, part: str, agent: str, glob_world_model: str, note: str, index: int | None = None) -> bool:
+        with self.span("decide", statement=index):
+            known = self.rule_decision(part, agent)
+            if known is not None:
+                return known
+            decision = self.get_response(self.decide_prompt(story, part, agent, glob_world_model, note, index), stage="decide", response_format=self.decision_format())
+            ans = self.parse_decision(decision)
+            if ans is None:
+                dec = self.get_response(PROMPT_YES_NO_DECISION.format(decision=decision), stage="decide_yes_no")
+                ans = dec.strip().strip(".").lower()
+
+            if ans not in ["yes", "no"]:
+                ans = self.get_response(PROMPT_AMBIGUOUS_DECISION.format(decision=decision), stage="decide_ambiguous")
+                ans = ans.strip().strip(".").lower()
+                if ans not in ["yes", "no"]:
+                    ans = "yes"
+
+            return ans == "yes"
+
+    async def decide_knowledge_async(self, story: str, part: str, agent: str, glob_world_model: str, note: str, index: int | None = None) -> bool:
+        with self.span("decide", statement=index):
+            known = self.rule_decision(part, agent)
+            if known is not None:
+                return known
+            decision = await self.get_response_async(self.decide_prompt(story, part, agent, glob_world_model, note, index), stage="decide", response_format=self.decision_format())
+            ans = self.parse_decision(decision)
+            if ans is None:
+                dec = await self.get_response_async(PROMPT_YES_NO_DECISION.format(decision=decision), stage="decide_yes_no")
+                ans = dec.strip().strip(".").lower()
 
-        if ans not in ["yes", "no"]:
-            ans = self.get_response(PROMPT_AMBIGUOUS_DECISION.format(decision=decision))
-            ans = ans.strip().strip(".").lower()
             if ans not in ["yes", "no"]:
-                ans = "yes"
+                ans = await self.get_response_async(PROMPT_AMBIGUOUS_DECISION.format(decision=decision), stage="decide_ambiguous")
+                ans = ans.strip().strip(".").lower()
+                if ans not in ["yes", "no"]:
+                    ans = "yes"
+
+            return ans == "yes"
+
+    def needs_world_update(self, if_update_decision: str) -> bool:
+        return if_update_decision.strip().strip(".").lower() != "no"
+
+    def next_world(self, state: WorldState, output: str) -> WorldState:
+        """
+        :param state: World state before the statement.
+        :param output: The LLM's updated world state, validated and repaired against `state`.
+        """
+        world, repaired = state.repaired(output)
+        if repaired:
+            annotate(world_repaired=True)
+        return world
+
+    def update_world(self, part: str, glob_world_model: str) -> str:
+        with self.span("update_world"):
+            if_update_decision = self.get_response(self.world_check_prompt(part), stage="world_check")
+            if self.needs_world_update(if_update_decision):
+                output = self.get_response(self.world_update_prompt(glob_world_model, part), stage="world_update")
+                glob_world_model = self.next_world(self.parse_world(glob_world_model), output).render()
+            return glob_world_model
+
+    async def update_world_async(self, part: str, glob_world_model: str) -> str:
+        with self.span("update_world"):
+            if_update_decision = await self.get_response_async(self.world_check_prompt(part), stage="world_check")
+            if self.needs_world_update(if_update_decision):
+                output = await self.get_response_async(self.world_update_prompt(glob_world_model, part), stage="world_update")
+                glob_world_model = self.next_world(self.parse_world(glob_world_model), output).render()
+            return glob_world_model
 
-        ret = ans == "yes"
+    # ---------------------- World Trajectory ----------------------
 
+    def world_trajectory(self, story_parts: list, glob_world_model: str) -> WorldTrajectory:
+        """
+        Compute the world state seen by each statement before any knowledge decision is made.
+
+        The enter/exit checks are independent of each other and run concurrently; only the
+        updates for statements that pass the check are applied in order.
+
+        :param story_parts: Statements of the story.
+        :param glob_world_model: Initial world state.
+        :return: World state before each statement (same length as story_parts), stored as diffs.
+        """
+        with self.span("world_trajectory", statements=len(story_parts)):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.decision_workers) as executor:
+                checks = list(executor.map(in_current_context(lambda part: self.get_response(self.world_check_prompt(part), stage="world_check")), story_parts))
+            state = self.parse_world(glob_world_model)
+            worlds = WorldTrajectory()
+            for part, check in zip(story_parts, checks):
+                worlds.record(state)
+                if self.needs_world_update(check):
+                    state = self.next_world(state, self.get_response(self.world_update_prompt(state.render(), part), stage="world_update"))
+            annotate(world_changes=worlds.changes())
+            return worlds
+
+    async def world_trajectory_async(self, story_parts: list, glob_world_model: str) -> WorldTrajectory:
+        with self.span("world_trajectory", statements=len(story_parts)):
+            checks = await asyncio.gather(*[self.get_response_async(self.world_check_prompt(part), stage="world_check") for part in story_parts])
+            state = self.parse_world(glob_world_model)
+            worlds = WorldTrajectory()
+            for part, check in zip(story_parts, checks):
+                worlds.record(state)
+                if self.needs_world_update(check):
+                    state = self.next_world(state, await self.get_response_async(self.world_update_prompt(state.render(), part), stage="world_update"))
+            annotate(world_changes=worlds.changes())
+            return worlds
+
+    def decide(self, story: str, part: str, agent: str, glob_world_model: str, note: str, index: int | None = None):
+        ret = self.decide_knowledge(story, part, agent, glob_world_model, note, index)
         # Update World Model if necessary
-        if_update = False
-        if self.mode == 'hitom':
-            prompt_check = f"Does the given statement involve an agent (or multiple agents) entering or exiting a location?\n Statement: {part}. \nAnswer in only yes/no with no other text\n Answer: : "
-            if_update_decision = self.get_response(prompt_check)
-            if if_update_decision.strip().strip(".").lower() != "no":
-                prompt_update = PROMPT_UPDATE_WORLD_HITOM.format(
-                    glob_world_model=glob_world_model,
-                    part=part
-                )
-                glob_world_model = self.get_response(prompt_update)
-        elif self.mode == 'fantom':
-            prompt_check = f"Does the given dialogue involve the speaker leaving the conversation?\n Dialogue: {part}. \nAnswer in only yes/no with no other text\n Answer: : "
-            if_update_decision = self.get_response(prompt_check)
-            if if_update_decision.strip().strip(".").lower() != "no":
-                prompt_update = PROMPT_UPDATE_WORLD_FANTOM.format(
-                    glob_world_model=glob_world_model,
-                    part=part
-                )
-                glob_world_model = self.get_response(prompt_update)
-        else:
-            prompt_check = f"Does the given statement involve an agent (or multiple agents) entering or exiting a location?\n Statement: {part}. \nAnswer in only yes/no with no other text\n Answer: : "
-            if_update_decision = self.get_response(prompt_check)
-            if if_update_decision.strip().strip(".").lower() != "no":
-                prompt_update = PROMPT_UPDATE_WORLD_GENERIC.format(
-                    glob_world_model=glob_world_model,
-                    part=part
-                )
-                glob_world_model = self.get_response(prompt_update)
+        glob_world_model = self.update_world(part, glob_world_model)
+        return ret, glob_world_model
 
+    async def decide_async(self, story: str, part: str, agent: str, glob_world_model: str, note: str, index: int | None = None):
+        ret = await self.decide_knowledge_async(story, part, agent, glob_world_model, note, index)
+        glob_world_model = await self.update_world_async(part, glob_world_model)
         return ret, glob_world_model
 
+    # ---------------------- Rule-Based World (Only for 'hitom') ----------------------
+
+    def uses_rule_world(self) -> bool:
+        return self.rule_based_world and self.mode == 'hitom'
+
+    def rule_world_trajectory(self, story_parts: list) -> WorldTrajectory:
+        """
+        World state before each statement, tracked with HitomWorldTracker.
+
+        Statements outside the known templates go through the usual LLM check and update,
+        applied to the rendered tracker state and parsed back into it.
+
+        :param story_parts: Statements of the story.
+        :return: World state before each statement (same length as story_parts), stored as diffs.
+        """
+        with self.span("world_trajectory", statements=len(story_parts), rule_based=True):
+            tracker = HitomWorldTracker()
+            worlds = WorldTrajectory()
+            for part in story_parts:
+                worlds.record(tracker)
+                if not tracker.apply(part):
+                    tracker.load(self.update_world(part, tracker.render()))
+            self.locations = ", ".join(tracker.rooms)
+            annotate(world_changes=worlds.changes())
+            return worlds
+
+    async def rule_world_trajectory_async(self, story_parts: list) -> WorldTrajectory:
+        with self.span("world_trajectory", statements=len(story_parts), rule_based=True):
+            tracker = HitomWorldTracker()
+            worlds = WorldTrajectory()
+            for part in story_parts:
+                worlds.record(tracker)
+                if not tracker.apply(part):
+                    tracker.load(await self.update_world_async(part, tracker.render()))
+            self.locations = ", ".join(tracker.rooms)
+            annotate(world_changes=worlds.changes())
+            return worlds
+
     # ---------------------- Data Processing ----------------------
 
-    def data(self, story: str, agent_name: str, note: str) -> str:
+    def split_story(self, story: str) -> tuple[list, str, str]:
+        """
+        Split a story into its statements (or dialogues) based on the mode.
+
+        :param story: The story or conversation.
+        :return: Non-empty stripped parts, the separator used when joining parts back together,
+                 and the terminator appended to a joined story.
+        """
+        if self.mode == 'hitom':
+            split_on, joiner = ".", ". "
+        elif self.mode == 'fantom':
+            split_on, joiner = "\n", "\n"
+        else:
+            split_on, joiner = self.delimiter, self.delimiter
+        parts = [part.strip() for part in story.split(split_on)]
+        return [part for part in parts if part], joiner, split_on
+
+    def set_story_agents(self, story: str) -> None:
+        """
+        Record the agents of the original story for the decision rules, before any level filters it.
+        """
+        if self.decision_rules is not None:
+            self.story_agents = self.decision_rules.story_agents(self.split_story(story)[0])
+
+    def set_disamb(self, story: str) -> None:
         if self.mode == 'hitom':
-            story_parts = story.split(".")
-            updated_story = []
-            glob_world_model = self.setup_world(story)
-            storyx = ""
             self.disamb = "\n ".join(self.disambiguate_story(story))
-            for part in story_parts:
-                part = part.strip()
-                if not part:
-                    continue
-                decision, glob_world_model = self.decide(
-                    storyx, part, agent_name, glob_world_model, note
-                )
-                storyx += ". " + part
-                if decision:
-                    updated_story.append(part)
 
-            ans = ". ".join(updated_story) + "."
-            return ans
+    def prepare_story(self, story: str):
+        parts, joiner, terminator = self.split_story(story)
+        self.set_disamb(story)
+        return parts, joiner, terminator
 
-        elif self.mode == 'fantom':
-            story_parts = story.split("\n")
-            updated_story = []
-            glob_world_model = self.setup_world(story)
-            storyx = ""
+    def decision_stories(self, story_parts: list, joiner: str):
+        """
+        :return: The story text sent with each statement's knowledge decision, indexed by statement: the
+                 preceding statements (up to context_window of them) as slices of one StoryView, or the full
+                 numbered story (the same string for every statement) in the 'prefix_cache' layout.
+        """
+        if self.prompt_layout == 'prefix_cache':
+            numbered = "\n".join(f"[{i}] {part}" for i, part in enumerate(story_parts, 1))
+            return [numbered] * len(story_parts)
+        return StoryView(story_parts, joiner, self.context_window)
 
-            for part in story_parts:
-                part = part.strip()
-                if not part:
-                    continue
-                decision, glob_world_model, = self.decide(
-                    storyx, part, agent_name, glob_world_model, note
-                )
-                storyx += "\n" + part
-                if decision:
-                    updated_story.append(part)
+    def data(self, story: str, agent_name: str, note: str) -> str:
+        if self.parallel_decisions:
+            return self.data_parallel(story, agent_name, note)
+        story_parts, joiner, terminator = self.prepare_story(story)
+        if self.uses_rule_world():
+            worlds = self.rule_world_trajectory(story_parts)
+            prefixes = self.decision_stories(story_parts, joiner)
+            updated_story = [
+                part for i, part in enumerate(story_parts)
+                if self.decide_knowledge(prefixes[i], part, agent_name, worlds[i], note, i + 1)
+            ]
+            return joiner.join(updated_story) + terminator
+        updated_story = []
+        glob_world_model = self.setup_world(story)
+        prefixes = self.decision_stories(story_parts, joiner)
+        for i, part in enumerate(story_parts):
+            decision, glob_world_model = self.decide(
+                prefixes[i], part, agent_name, glob_world_model, note, i + 1
+            )
+            if decision:
+                updated_story.append(part)
 
-            ans = "\n".join(updated_story) + "\n"
-            return ans
+        return joiner.join(updated_story) + terminator
+
+    def data_parallel(self, story: str, agent_name: str, note: str) -> str:
+        """
+        Variant of data that decides every statement concurrently against a precomputed world trajectory.
+        """
+        story_parts, joiner, terminator = self.prepare_story(story)
+        if self.uses_rule_world():
+            worlds = self.rule_world_trajectory(story_parts)
         else:
-            story_parts = story.split(self.delimiter)
+            worlds = self.world_trajectory(story_parts, self.setup_world(story))
+        prefixes = self.decision_stories(story_parts, joiner)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.decision_workers) as executor:
+            decisions = list(executor.map(
+                in_current_context(lambda i: self.decide_knowledge(prefixes[i], story_parts[i], agent_name, worlds[i], note, i + 1)),
+                range(len(story_parts))
+            ))
+        updated_story = [part for part, decision in zip(story_parts, decisions) if decision]
+        return joiner.join(updated_story) + terminator
+
+    async def data_parallel_async(self, story: str, agent_name: str, note: str) -> str:
+        story_parts, joiner, terminator = self.prepare_story(story)
+        if self.uses_rule_world():
+            worlds = await self.rule_world_trajectory_async(story_parts)
+        else:
+            worlds = await self.world_trajectory_async(story_parts, await self.setup_world_async(story))
+        prefixes = self.decision_stories(story_parts, joiner)
+        decisions = await asyncio.gather(*[
+            self.decide_knowledge_async(prefixes[i], story_parts[i], agent_name, worlds[i], note, i + 1)
+            for i in range(len(story_parts))
+        ])
+        updated_story = [part for part, decision in zip(story_parts, decisions) if decision]
+        return joiner.join(updated_story) + terminator
+
+    async def data_async(self, story: str, agent_name: str, note: str) -> str:
+        if self.parallel_decisions:
+            return await self.data_parallel_async(story, agent_name, note)
+        story_parts, joiner, terminator = self.prepare_story(story)
+        if self.uses_rule_world():
+            worlds = await self.rule_world_trajectory_async(story_parts)
+            prefixes = self.decision_stories(story_parts, joiner)
             updated_story = []
-            glob_world_model = self.setup_world(story)
-            storyx = ""
-            for part in story_parts:
-                part = part.strip()
-                if not part:
-                    continue
-                decision, glob_world_model = self.decide(
-                    storyx, part, agent_name, glob_world_model, note
-                )
-                storyx += self.delimiter + part
-                if decision:
+            for i, part in enumerate(story_parts):
+                if await self.decide_knowledge_async(prefixes[i], part, agent_name, worlds[i], note, i + 1):
                     updated_story.append(part)
+            return joiner.join(updated_story) + terminator
+        updated_story = []
+        glob_world_model = await self.setup_world_async(story)
+        prefixes = self.decision_stories(story_parts, joiner)
+        for i, part in enumerate(story_parts):
+            decision, glob_world_model = await self.decide_async(
+                prefixes[i], part, agent_name, glob_world_model, note, i + 1
+            )
+            if decision:
+                updated_story.append(part)
+
+        return joiner.join(updated_story) + terminator
+
+    # ---------------------- Single-Pass Chain Filtering ----------------------
+
+    def data_chain(self, story: str, agents: tuple, note: str) -> str:
+        """
+        Filter the story through a chain of agents in one pass over the story.
+
+        The story is split, its world trajectory computed and its decision prompts built once for the whole
+        chain, and every decision sees the original story. A statement survives level k if each of the first
+        k agents knows it, so an agent is only asked about the statements all outer agents know, and a
+        higher-order question costs about as much as a first-order one.
+
+        :param agents: Agents of the chain, outermost first.
+        :return: The story as known to the innermost agent.
+        """
+        story_parts, joiner, terminator = self.prepare_story(story)
+        if self.uses_rule_world():
+            worlds = self.rule_world_trajectory(story_parts)
+        else:
+            worlds = self.world_trajectory(story_parts, self.setup_world(story))
+        prefixes = self.decision_stories(story_parts, joiner)
+        visible = list(range(len(story_parts)))
+        for level, agent in enumerate(agents, 1):
+            with self.span("task", level=level, agent=agent):
+                decide = lambda i: self.decide_knowledge(prefixes[i], story_parts[i], agent, worlds[i], note, i + 1)
+                if self.parallel_decisions:
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=self.decision_workers) as executor:
+                        decisions = list(executor.map(in_current_context(decide), visible))
+                else:
+                    decisions = [decide(i) for i in visible]
+                visible = [i for i, known in zip(visible, decisions) if known]
+        return joiner.join(story_parts[i] for i in visible) + terminator
+
+    async def data_chain_async(self, story: str, agents: tuple, note: str) -> str:
+        story_parts, joiner, terminator = self.prepare_story(story)
+        if self.uses_rule_world():
+            worlds = await self.rule_world_trajectory_async(story_parts)
+        else:
+            worlds = await self.world_trajectory_async(story_parts, await self.setup_world_async(story))
+        prefixes = self.decision_stories(story_parts, joiner)
+        visible = list(range(len(story_parts)))
+        for level, agent in enumerate(agents, 1):
+            with self.span("task", level=level, agent=agent):
+                decide = lambda i: self.decide_knowledge_async(prefixes[i], story_parts[i], agent, worlds[i], note, i + 1)
+                if self.parallel_decisions:
+                    decisions = await asyncio.gather(*[decide(i) for i in visible])
+                else:
+                    decisions = [await decide(i) for i in visible]
+                visible = [i for i, known in zip(visible, decisions) if known]
+        return joiner.join(story_parts[i] for i in visible) + terminator
+
+    # ---------------------- Visibility Matrix ----------------------
+
+    def story_worlds(self, story: str, story_parts: list) -> list:
+        """
+        World state before each statement of the story, computed once per story for all systems sharing
+        the visibility cache (and across runs, if it is persisted).
+        """
+        def compute():
+            if self.uses_rule_world():
+                return self.rule_world_trajectory(story_parts)
+            return self.world_trajectory(story_parts, self.setup_world(story))
+        return self.visibility_cache.get_or_compute_worlds(self.worlds_key(story), compute)
+
+    async def story_worlds_async(self, story: str, story_parts: list) -> list:
+        async def compute():
+            if self.uses_rule_world():
+                return await self.rule_world_trajectory_async(story_parts)
+            return await self.world_trajectory_async(story_parts, await self.setup_world_async(story))
+        return await self.visibility_cache.get_or_compute_worlds_async(self.worlds_key(story), compute)
+
+    def worlds_key(self, story: str) -> str:
+        return self.visibility_cache.worlds_key(story, self.mode, self.model.model_name, None, self.world_config())
+
+    def visibility_row(self, story: str, agent: str, note: str) -> int:
+        """
+        Decide every statement of the story for one agent.
+
+        :return: Bitmask with bit i set if the agent knows statement i.
+        """
+        story_parts, joiner, _ = self.split_story(story)
+        worlds = self.story_worlds(story, story_parts)
+        prefixes = self.decision_stories(story_parts, joiner)
+        decide = lambda i: self.decide_knowledge(prefixes[i], story_parts[i], agent, worlds[i], note, i + 1)
+        if self.parallel_decisions:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.decision_workers) as executor:
+                decisions = list(executor.map(in_current_context(decide), range(len(story_parts))))
+        else:
+            decisions = [decide(i) for i in range(len(story_parts))]
+        return sum(1 << i for i, known in enumerate(decisions) if known)
+
+    async def visibility_row_async(self, story: str, agent: str, note: str) -> int:
+        story_parts, joiner, _ = self.split_story(story)
+        worlds = await self.story_worlds_async(story, story_parts)
+        prefixes = self.decision_stories(story_parts, joiner)
+        decide = lambda i: self.decide_knowledge_async(prefixes[i], story_parts[i], agent, worlds[i], note, i + 1)
+        if self.parallel_decisions:
+            decisions = await asyncio.gather(*[decide(i) for i in range(len(story_parts))])
+        else:
+            decisions = [await decide(i) for i in range(len(story_parts))]
+        return sum(1 << i for i, known in enumerate(decisions) if known)
+
+    def visibility_key(self, story: str, agent: str, note: str) -> str:
+        return self.visibility_cache.row_key(story, agent, self.mode, self.model.model_name, note if not self.mode else None, self.decision_config())
+
+    def filter_visible(self, story: str, agents: tuple, note: str, chain: tuple) -> str:
+        """
+        Filter the story for a chain of agents by ANDing their visibility rows, deciding only rows not yet cached.
+
+        :param agents: Agents to filter for, outermost first.
+        :param chain: Agents filtered so far including agents, outermost first.
+        """
+        with self.span("data", agent=agents[-1], chain=" > ".join(chain), visibility=True):
+            story_parts, joiner, terminator = self.prepare_story(story)
+            mask = (1 << len(story_parts)) - 1
+            for level, agent in enumerate(agents, 1):
+                with self.span("task", level=level, agent=agent):
+                    mask &= self.visibility_cache.get_or_compute_row(self.visibility_key(story, agent, note), lambda: self.visibility_row(story, agent, note))
+            return joiner.join(part for i, part in enumerate(story_parts) if mask >> i & 1) + terminator
+
+    async def filter_visible_async(self, story: str, agents: tuple, note: str, chain: tuple) -> str:
+        with self.span("data", agent=agents[-1], chain=" > ".join(chain), visibility=True):
+            story_parts, joiner, terminator = self.prepare_story(story)
+            mask = (1 << len(story_parts)) - 1
+            for level, agent in enumerate(agents, 1):
+                with self.span("task", level=level, agent=agent):
+                    mask &= await self.visibility_cache.get_or_compute_row_async(self.visibility_key(story, agent, note), lambda: self.visibility_row_async(story, agent, note))
+            return joiner.join(part for i, part in enumerate(story_parts) if mask >> i & 1) + terminator
+
+    # ---------------------- Perspective Memo ----------------------
+
+    def decision_config(self) -> dict:
+        """
+        Settings that change which statements an agent is decided to know, part of every perspective
+        and visibility cache key so persisted entries are only reused under the same settings.
+        """
+        return {
+            "prompt_layout": self.prompt_layout,
+            "context_window": self.context_window,
+            "rule_based_world": self.uses_rule_world(),
+            "decision_rules": type(self.decision_rules).__name__ if self.decision_rules is not None else None,
+            "structured_outputs": self.structured_outputs,
+            "temperature": getattr(self.model, "temperature", None),
+        }
+
+    def world_config(self) -> dict:
+        """
+        Settings that change the world trajectory of a story, part of its visibility cache key. The world
+        check and update prompts do not depend on the prompt layout, context window or decision settings.
+        """
+        return {
+            "rule_based_world": self.uses_rule_world(),
+            "temperature": getattr(self.model, "temperature", None),
+        }
+
+    def perspective_key(self, story: str, chain: tuple, note: str) -> str:
+        root = self.story if self.story is not None else story
+        return self.perspective_cache.key(root, chain, self.mode, self.model.model_name, note if not self.mode else None, self.decision_config())
+
+    def chain_key(self, story: str, chain: tuple, note: str) -> str:
+        # Single-pass results decide every level against the original story, so they are kept apart from nested ones.
+        root = self.story if self.story is not None else story
+        return self.perspective_cache.key(root, chain, f"{self.mode}/single_pass", self.model.model_name, note if not self.mode else None, self.decision_config())
+
+    def filter_story(self, story: str, agent_name: str, note: str, chain: tuple) -> str:
+        """
+        Filter the story for an agent, reusing the result for the same root story and agent chain.
+
+        :param chain: Agents filtered so far including agent_name, outermost first.
+        """
+        with self.span("data", agent=agent_name, chain=" > ".join(chain)):
+            if self.perspective_cache is None:
+                return self.data(story, agent_name, note)
+            # data() sets disamb as a side effect; keep it consistent when the result is memoised.
+            self.set_disamb(story)
+            key = self.perspective_key(story, chain, note)
+            return self.perspective_cache.get_or_compute(key, lambda: self.data(story, agent_name, note))
+
+    async def filter_story_async(self, story: str, agent_name: str, note: str, chain: tuple) -> str:
+        with self.span("data", agent=agent_name, chain=" > ".join(chain)):
+            if self.perspective_cache is None:
+                return await self.data_async(story, agent_name, note)
+            self.set_disamb(story)
+            key = self.perspective_key(story, chain, note)
+            return await self.perspective_cache.get_or_compute_async(key, lambda: self.data_async(story, agent_name, note))
+
+    def filter_chain(self, story: str, agents: tuple, note: str, chain: tuple) -> str:
+        """
+        Filter the story for a chain of agents with data_chain, reusing the result for the same root story and chain.
+
+        :param agents: Agents to filter for, outermost first.
+        :param chain: Agents filtered so far including agents, outermost first.
+        """
+        with self.span("data", agent=agents[-1], chain=" > ".join(chain), single_pass=True):
+            if self.perspective_cache is None:
+                return self.data_chain(story, agents, note)
+            self.set_disamb(story)
+            key = self.chain_key(story, chain, note)
+            return self.perspective_cache.get_or_compute(key, lambda: self.data_chain(story, agents, note))
 
-            ans = self.delimiter.join(updated_story) + self.delimiter
-            return ans
+    async def filter_chain_async(self, story: str, agents: tuple, note: str, chain: tuple) -> str:
+        with self.span("data", agent=agents[-1], chain=" > ".join(chain), single_pass=True):
+            if self.perspective_cache is None:
+                return await self.data_chain_async(story, agents, note)
+            self.set_disamb(story)
+            key = self.chain_key(story, chain, note)
+            return await self.perspective_cache.get_or_compute_async(key, lambda: self.data_chain_async(story, agents, note))
 
     # ---------------------- Answering Questions ----------------------
 
-    def answer(self, story: str, agent: str, answer_context: str, question: str, choices: str, note: str) -> str:
+    def answer_prompt(self, story: str, agent: str, answer_context: str, question: str, choices: str, note: str) -> str:
         if self.mode == 'hitom':
-            prompt = PROMPT_ANSWER_HITOM.format(
+            return PROMPT_ANSWER_HITOM.format(
                 disamb=self.disamb,
                 story=story,
                 agent=agent,
@@ -258,7 +795,7 @@ class TheoryOfMindSystem:
                 choices=choices
             )
         elif self.mode == 'fantom':
-            prompt = PROMPT_ANSWER_FANTOM.format(
+            return PROMPT_ANSWER_FANTOM.format(
                 agent=agent,
                 agents=answer_context,
                 story=story,
@@ -266,7 +803,7 @@ class TheoryOfMindSystem:
                 choices=choices
             )
         else:
-            prompt = PROMPT_ANSWER_GENERIC.format(
+            return PROMPT_ANSWER_GENERIC.format(
                 agent=agent,
                 story=story,
                 note=note,
@@ -274,17 +811,109 @@ class TheoryOfMindSystem:
                 choices=choices
             )
 
-        ans = self.get_response(prompt)
-
+    def choice_prompt(self, ans: str) -> str:
         if self.mode == 'hitom':
-            choice_prompt = PROMPT_EXTRACT_HITOM_SELECTION.format(ans=ans)
+            return PROMPT_EXTRACT_HITOM_SELECTION.format(ans=ans)
         elif self.mode == 'fantom':
-            choice_prompt = PROMPT_EXTRACT_FANTOM_SELECTION.format(ans=ans)
+            return PROMPT_EXTRACT_FANTOM_SELECTION.format(ans=ans)
         else:
-            choice_prompt = PROMPT_EXTRACT_GENERIC_SELECTION.format(ans=ans)
+            return PROMPT_EXTRACT_GENERIC_SELECTION.format(ans=ans)
+
+    def choice_labels(self, choices) -> list | None:
+        """
+        The options a structured answer picks from, in the form the choice extraction would return them.
+
+        :param choices: HiToM choices ("A. red_box" items, the first prefixed with "Choices: ") or
+                        FanToM choice text ("(a) ..." lines).
+        :return: "A: red_box" for list items, the bare letters for lettered lines, or None if the
+                 choices have neither form (the answer is then extracted with a follow-up call).
+        """
+        if isinstance(choices, list):
+            matches = [re.match(r"(?:Choices: )?(\w+)\. (.+)", choice.strip()) for choice in choices]
+            return [f"{match.group(1)}: {match.group(2)}" for match in matches] if matches and all(matches) else None
+        return re.findall(r"^\((\w)\)", choices or "", re.MULTILINE) or None
+
+    def structured_choice(self, ans: str, labels: list | None) -> str | None:
+        """
+        :return: The choice of a structured answer, or None if it needs the extract_choice call.
+        """
+        if labels is None:
+            return None
+        choice = parse_field(ans, "choice", labels)
+        annotate(structured_fallback=choice is None)
+        return choice.lower() if choice is not None else None
+
+    def answer(self, story: str, agent: str, answer_context: str, question: str, choices: str, note: str) -> str:
+        with self.span("answer", agent=agent):
+            labels = self.choice_labels(choices) if self.structured_outputs else None
+            ans = self.get_response(self.answer_prompt(story, agent, answer_context, question, choices, note), stage="answer", response_format=choice_format(labels) if labels else None)
+            answer = self.structured_choice(ans, labels)
+            if answer is None:
+                answer = self.get_response(self.choice_prompt(ans), stage="extract_choice").strip().strip(".").lower()
+            return answer
+
+    async def answer_async(self, story: str, agent: str, answer_context: str, question: str, choices: str, note: str) -> str:
+        with self.span("answer", agent=agent):
+            labels = self.choice_labels(choices) if self.structured_outputs else None
+            ans = await self.get_response_async(self.answer_prompt(story, agent, answer_context, question, choices, note), stage="answer", response_format=choice_format(labels) if labels else None)
+            answer = self.structured_choice(ans, labels)
+            if answer is None:
+                answer = (await self.get_response_async(self.choice_prompt(ans), stage="extract_choice")).strip().strip(".").lower()
+            return answer
+
+    # ---------------------- Perspective Chain ----------------------
 
-        answer = self.get_response(choice_prompt).strip().strip(".").lower()
-        return answer
+    def perspective_chain(self, question: str) -> PerspectiveChain:
+        """
+        Decompose a question into its chain of nested perspectives, once per question.
+
+        With rule_based_questions in 'hitom' mode, templated questions are parsed without the LLM;
+        otherwise (and for questions the parser does not recognise) get_agent and sim_question are
+        asked once per level.
+
+        :param question: The original question.
+        :return: The perspective chain, outermost agent first.
+        """
+        with self.span("perspective_chain"):
+            if self.uses_rule_questions():
+                chain = parse_hitom_question(question)
+                if chain is not None:
+                    return chain
+            agents, questions = [], [question]
+            agent = self.get_agent(question)
+            while agent != NARRATOR and len(agents) < MAX_CHAIN_DEPTH:
+                agents.append(agent)
+                questions.append(self.sim_question(questions[-1], agent))
+                agent = self.get_agent(questions[-1])
+            return PerspectiveChain(agents, questions)
+
+    async def perspective_chain_async(self, question: str) -> PerspectiveChain:
+        """
+        asyncio variant of perspective_chain.
+        """
+        with self.span("perspective_chain"):
+            if self.uses_rule_questions():
+                chain = parse_hitom_question(question)
+                if chain is not None:
+                    return chain
+            agents, questions = [], [question]
+            agent = await self.get_agent_async(question)
+            while agent != NARRATOR and len(agents) < MAX_CHAIN_DEPTH:
+                agents.append(agent)
+                questions.append(await self.sim_question_async(questions[-1], agent))
+                agent = await self.get_agent_async(questions[-1])
+            return PerspectiveChain(agents, questions)
+
+    def uses_rule_questions(self) -> bool:
+        return self.rule_based_questions and self.mode == 'hitom'
+
+    def chain_levels(self, perspective: PerspectiveChain) -> int:
+        """
+        :return: Number of perspectives to take, capped by the max_recursion of the current task.
+        """
+        if self.counter:
+            return min(self.counter, perspective.depth)
+        return perspective.depth
 
     # ---------------------- Start Task ----------------------
 
@@ -299,51 +928,151 @@ class TheoryOfMindSystem:
         :param max_recursion: optionally set a maximum recursion level for the algorithm.
         :return: The selected answer.
         """
-        self.agent = self.get_agent(question)
-        self.qn = question
-        self.story = story
-        self.choices = choices
-        self.note = note
-        if max_recursion:
-            self.counter=max_recursion
-        return self.task(story, self.qn, self.agent, "", self.choices, note)
+        with self.span("start_task", question=question, mode=self.mode):
+            self.qn = question
+            self.story = story
+            self.set_story_agents(story)
+            self.choices = choices
+            self.note = note
+            self.counter = max_recursion
+            self.perspective = self.perspective_chain(question)
+            self.agent = self.perspective.first_agent
+            annotate(depth=self.perspective.depth)
+            return self.follow_chain(story, self.perspective, self.agent, "", self.choices, note)
+
+    async def start_task_async(self, story: str, question: str, choices: str, note: str, max_recursion: int | None = None) -> str:
+        """
+        asyncio variant of start_task; all LLM calls go through the shared async model.
+        """
+        with self.span("start_task", question=question, mode=self.mode):
+            self.qn = question
+            self.story = story
+            self.set_story_agents(story)
+            self.choices = choices
+            self.note = note
+            self.counter = max_recursion
+            self.perspective = await self.perspective_chain_async(question)
+            self.agent = self.perspective.first_agent
+            annotate(depth=self.perspective.depth)
+            return await self.follow_chain_async(story, self.perspective, self.agent, "", self.choices, note)
 
     # ---------------------- Task Recursion ----------------------
 
-    def task(self, story: str, question: str, last_agent: str, answer_context: str, choices: str, note: str) -> str:
+    def follow_chain(self, story: str, perspective: PerspectiveChain, last_agent: str, answer_context: str, choices: str, note: str, chain: tuple = ()) -> str:
         """
-        Recursive task processing based on mode.
+        Filter the story through each perspective of the chain in turn, then answer the innermost question.
 
         :param story: The current story or conversation.
-        :param question: The current question.
+        :param perspective: The precomputed perspective chain of the question.
         :param last_agent: The last agent processed.
         :param answer_context: Provide relevant extra context for the answer stage.
         :param choices: Multiple-choice options.
         :param note: Additional rules or notes.
+        :param chain: Agents whose perspective has already been taken, outermost first.
         :return: The selected answer.
         """
-        agent = self.get_agent(question)
-        if agent.lower() == "narrator":
-            return self.answer(story, last_agent, answer_context, question, choices, note)
+        levels = self.chain_levels(perspective)
+        if (self.single_pass_filter or self.visibility_cache is not None) and levels:
+            agents = perspective.agents[:levels]
+            chain = chain + agents
+            if self.visibility_cache is not None:
+                story = self.filter_visible(story, agents, note, chain)
+            else:
+                story = self.filter_chain(story, agents, note, chain)
+            if self.mode == 'fantom':
+                answer_context += "".join(f"{agent} believes: " for agent in agents)
+            last_agent = agents[-1]
+            return self.answer(story, last_agent, answer_context, perspective.questions[levels], choices, note)
+        for level, agent in enumerate(perspective.agents[:levels], 1):
+            chain = chain + (agent,)
+            with self.span("task", level=level, agent=agent):
+                story = self.filter_story(story, agent, note, chain)
+            if self.mode == 'fantom':
+                answer_context += f"{agent} believes: "
+            last_agent = agent
+        return self.answer(story, last_agent, answer_context, perspective.questions[levels], choices, note)
 
-        qn = self.sim_question(question, agent)
-        updated_story = self.data(story, agent, note)
-        if self.counter:
-            if self.counter == 0:
-                return self.answer(story, last_agent, answer_context, question, choices, note)
-            self.counter -= 1
-        if self.mode == 'fantom':
-            answer_context += f"{agent} believes: "
-        return self.task(updated_story, qn, agent, answer_context, choices, note)
+    async def follow_chain_async(self, story: str, perspective: PerspectiveChain, last_agent: str, answer_context: str, choices: str, note: str, chain: tuple = ()) -> str:
+        """
+        asyncio variant of follow_chain.
+        """
+        levels = self.chain_levels(perspective)
+        if (self.single_pass_filter or self.visibility_cache is not None) and levels:
+            agents = perspective.agents[:levels]
+            chain = chain + agents
+            if self.visibility_cache is not None:
+                story = await self.filter_visible_async(story, agents, note, chain)
+            else:
+                story = await self.filter_chain_async(story, agents, note, chain)
+            if self.mode == 'fantom':
+                answer_context += "".join(f"{agent} believes: " for agent in agents)
+            last_agent = agents[-1]
+            return await self.answer_async(story, last_agent, answer_context, perspective.questions[levels], choices, note)
+        for level, agent in enumerate(perspective.agents[:levels], 1):
+            chain = chain + (agent,)
+            with self.span("task", level=level, agent=agent):
+                story = await self.filter_story_async(story, agent, note, chain)
+            if self.mode == 'fantom':
+                answer_context += f"{agent} believes: "
+            last_agent = agent
+        return await self.answer_async(story, last_agent, answer_context, perspective.questions[levels], choices, note)
+
+    def task(self, story: str, question: str, last_agent: str, answer_context: str, choices: str, note: str, chain: tuple = ()) -> str:
+        """
+        Process a (possibly nested) question from an intermediate state; see follow_chain.
+
+        :param question: The current question, decomposed with perspective_chain.
+        """
+        return self.follow_chain(story, self.perspective_chain(question), last_agent, answer_context, choices, note, chain)
+
+    async def task_async(self, story: str, question: str, last_agent: str, answer_context: str, choices: str, note: str, chain: tuple = ()) -> str:
+        """
+        asyncio variant of task.
+        """
+        return await self.follow_chain_async(story, await self.perspective_chain_async(question), last_agent, answer_context, choices, note, chain)
 
     # ---------------------- Get Response Method ----------------------
 
-    def get_response(self, prompt: str) -> str:
+    def get_response(self, prompt: str, stage: str = "other", response_format: dict | None = None) -> str:
         """
         Get response based on the current mode.
 
         :param prompt: The prompt to send.
+        :param stage: Pipeline stage issuing the prompt (e.g. "decide", "answer"), recorded in the trace.
+        :param response_format: Optional JSON schema the response must follow (see structured_outputs.py).
+        :return: The generated response.
+        """
+        with self.span("get_response", stage=stage, prompt_hash=prompt_hash(prompt), prompt_chars=len(prompt)):
+            start = time.perf_counter()
+            output = self.model.get_output(prompt, stage=stage, response_format=response_format)
+            self.trace_call(prompt, output, stage, time.perf_counter() - start)
+            return output
+
+    async def get_response_async(self, prompt: str, stage: str = "other", response_format: dict | None = None) -> str:
+        """
+        Get response through the async model.
+
+        :param prompt: The prompt to send.
+        :param stage: Pipeline stage issuing the prompt, recorded in the trace.
+        :param response_format: Optional JSON schema the response must follow (see structured_outputs.py).
         :return: The generated response.
         """
-        return self.model.get_output(prompt)
+        if self.async_model is None:
+            self.async_model = AsyncLanguageModel(model_name=self.model.model_name, model_type=self.model.model_type, cache=self.model.cache)
+        with self.span("get_response", stage=stage, prompt_hash=prompt_hash(prompt), prompt_chars=len(prompt)):
+            start = time.perf_counter()
+            output = await self.async_model.get_output(prompt, stage=stage, response_format=response_format)
+            self.trace_call(prompt, output, stage, time.perf_counter() - start)
+            return output
+
+    def span(self, name: str, **attributes):
+        """
+        Open a tracing span for a step of the system (a no-op without a tracer).
+        """
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(name, **attributes)
 
+    def trace_call(self, prompt: str, output: str, stage: str = "other", seconds: float | None = None) -> None:
+        if self.trace is not None:
+            self.trace.write({"question": self.qn, "stage": stage, "prompt": prompt, "response": output, "seconds": seconds})
@@ -0,0 +1,70 @@
+import re
+
+NARRATOR = "narrator"
+# Guard against an LLM that keeps producing nested questions.
+MAX_CHAIN_DEPTH = 10
+
+NAME = r"[A-Z][\w]*"
+# "Where does A think B thinks C thinks the X is?" and "Where does A really think the X is?"
+HITOM_BELIEF_QUESTION = re.compile(
+    rf"^(?:Question: )?Where does (?P<first>{NAME}) (?:really )?think (?P<rest>(?:{NAME} thinks )*)(?P<object>the [\w]+) is\?$"
+)
+# "Where is the X really?"
+HITOM_REALITY_QUESTION = re.compile(r"^(?:Question: )?Where is (?P<object>the [\w]+) really\?$")
+
+
+class PerspectiveChain:
+    """
+    The agents whose beliefs a question nests, outermost first, with the question asked at each level.
+
+    questions[i] is the question asked before taking agents[i]'s perspective, so questions[0]
+    is the original question and questions[-1] is the direct question answered at the end.
+    E.g. "Where does Alex think Raj thinks the jam is?" has agents ("alex", "raj") and
+    questions (original, "Where does Raj think the jam is?", "Where is the jam?").
+    """
+    __slots__ = ("agents", "questions")
+
+    def __init__(self, agents, questions):
+        if len(questions) != len(agents) + 1:
+            raise ValueError("A perspective chain needs one question per agent plus the final question")
+        self.agents = tuple(agents)
+        self.questions = tuple(questions)
+
+    @property
+    def depth(self) -> int:
+        return len(self.agents)
+
+    @property
+    def first_agent(self) -> str:
+        """
+        :return: The outermost agent, or "narrator" for a question about the real world state.
+        """
+        return self.agents[0] if self.agents else NARRATOR
+
+    def __repr__(self):
+        return f"PerspectiveChain(agents={self.agents!r}, questions={self.questions!r})"
+
+
+def parse_hitom_question(question: str) -> PerspectiveChain | None:
+    """
+    Deterministically decompose a HiToM question.
+
+    :param question: E.g. "Question: Where does Oliver think Aria thinks the plum is?".
+    :return: The perspective chain (agent names lower-cased), or None if the question does not
+             follow the HiToM templates.
+    """
+    question = question.strip()
+    match = HITOM_REALITY_QUESTION.match(question)
+    if match:
+        return PerspectiveChain((), (question,))
+    match = HITOM_BELIEF_QUESTION.match(question)
+    if not match:
+        return None
+    names = [match.group("first")] + match.group("rest").split(" thinks ")[:-1]
+    obj = match.group("object")
+    questions = [question]
+    for level in range(1, len(names)):
+        nested = "".join(f"{name} thinks " for name in names[level + 1:])
+        questions.append(f"Where does {names[level]} think {nested}{obj} is?")
+    questions.append(f"Where is {obj}?")
+    return PerspectiveChain([name.lower() for name in names], questions)
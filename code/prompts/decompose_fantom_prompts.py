@@ -18,6 +18,29 @@ Give a single word yes/no answer
 Answer: 
 '''
 
+# Rules and conversation first, dialogue and world state last, so the prompt prefix is shared by every call on a conversation.
+PROMPT_DECIDE_KNOWLEDGE_FANTOM_CACHED = '''
+Your task is to indicate whether an agent knows about a dialogue in a conversation, using the following rules:
+
+Rules:
+The agent knows a dialogue if they are in the same location or conversation.
+The agent knows all dialogues they say themselves.
+If the agent's location is unclear or not provided, assume they know of the dialogue.
+
+Use the provided world state to check the location of the agent and other agents that may be involved to determine knowledge of the dialogue. It is formatted as Location 1: [Agents in location], Location 2:[] ...
+
+This is a given conversation. The conversation is sequential with each numbered dialogue happening after the previous one:
+{story}
+
+Only the dialogues before dialogue [{index}] have happened so far.
+Agent: {agent}
+Dialogue [{index}]: {part}
+World State: {glob_world_model}
+
+Give a single word yes/no answer about whether {agent} knows dialogue [{index}]
+Answer: 
+'''
+
 
 PROMPT_UPDATE_WORLD_FANTOM = '''
 This is the current world state, that holds the current world location of all the agents:
@@ -68,6 +68,31 @@ Reason briefly using the rules, and indicate your answer about whether {agent} k
 Answer: 
 '''
 
+# Rules and story first, statement and world state last (see PROMPT_DECIDE_KNOWLEDGE_HITOM_CACHED).
+PROMPT_DECIDE_KNOWLEDGE_GENERIC_CACHED = '''
+Your task is to indicate whether an agent knows about a statement in a story happening, using the following rules:
+
+Rules:
+{note}
+
+If a statement can be interpreted ambiguously, then say yes.
+
+Use the provided world state to check the location of the agent and other agents that may be involved to determine knowledge of the given statement. It is formatted as Location 1: [Agents in location], Location 2:[] ...
+
+This is a given story. The story is sequential with each numbered statement happening after the previous one (if the statement is an event):
+{disamb}
+{story}
+
+Only the statements before statement [{index}] have happened so far.
+Agent: {agent}
+Statement [{index}]: {part}
+World State: {glob_world_model}
+
+Reason briefly using the rules, and indicate your answer about whether {agent} knows statement [{index}] in the format: Answer: <decision> (where decision is yes/no)
+Answer: 
+'''
+
+
 PROMPT_UPDATE_WORLD_GENERIC = '''
 This is the current world state, that holds the current world location of all the agents:
 World State: {glob_world_model}. Please update it relevantly (if needed) after the given statement: {part}.
@@ -25,6 +25,36 @@ Reason briefly using the rules, and indicate your answer about whether {agent} k
 Answer: 
 '''
 
+# Prefix-cache friendly layout: the fixed rules and the full story come first and are identical
+# for every statement (and every agent) of a story; only the tail changes between calls.
+PROMPT_DECIDE_KNOWLEDGE_HITOM_CACHED = '''
+Your task is to indicate whether an agent knows about a statement in a story happening, using the following rules:
+
+Rules:
+The agent knows of any statement that mentions their own actions.
+The agent knows of a statement if the statement happens in the same location as them.
+The agent knows of statements that indicate another agent leaving a location.
+The agent does NOT know of a statement if they have left the location where the event occurs or are not in the same location as the agent involved in the statement.
+The agent only knows of a 'private communication' if they are involved in it : someone says something to someone else.
+The agent is aware of all 'public communications' : when someone declares something to everyone.
+
+If a statement can be interpreted ambiguously, then say yes.
+
+Use the provided world state to check the location of the agent and other agents that may be involved to determine knowledge of the given statement. It is formatted as Location 1: [Agents in location], Location 2:[] ...
+
+This is a given story. The story is sequential with each numbered statement happening after the previous one (if the statement is an event):
+{disamb}
+{story}
+
+Only the statements before statement [{index}] have happened so far.
+Agent: {agent}
+Statement [{index}]: {part}
+World State: {glob_world_model}
+
+Reason briefly using the rules, and indicate your answer about whether {agent} knows statement [{index}] in the format: Answer: <decision> (where decision is yes/no)
+Answer: 
+'''
+
 # Prompts for Updating World State
 PROMPT_UPDATE_WORLD_HITOM = '''
 This is the current world state, that holds the current world location of all the agents:
@@ -0,0 +1,145 @@
+import asyncio
+import random
+import threading
+import time
+
+# Rough characters-per-token ratio used to estimate prompt size before a request is sent.
+CHARS_PER_TOKEN = 4
+# Completion budget reserved per request until the real usage is known.
+EXPECTED_COMPLETION_TOKENS = 256
+
+
+def estimate_tokens(prompt: str) -> int:
+    return len(prompt) // CHARS_PER_TOKEN + EXPECTED_COMPLETION_TOKENS
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with full jitter.
+
+    :param attempt: Number of failed attempts so far (starting at 1).
+    :return: Seconds to sleep, uniformly drawn from [0, min(cap, base * 2 ** attempt)].
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(error: Exception) -> float | None:
+    """
+    Read the server-requested delay from an API error, if it carries one.
+
+    :return: Seconds to wait, or None if the error has no Retry-After header.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    :return: The server's Retry-After if present, otherwise a jittered exponential backoff.
+    """
+    delay = retry_after(error)
+    return delay if delay is not None else backoff_delay(attempt)
+
+
+class TokenBucket:
+    """
+    Token bucket that refills continuously at `capacity` per minute.
+
+    Callers reserve what they need up front and the balance may go negative; the
+    returned wait is how long the caller must sleep for its reservation to be covered.
+    This keeps waiting threads in FIFO order without polling.
+    """
+    def __init__(self, per_minute: float | None):
+        self.capacity = per_minute
+        self.tokens = per_minute or 0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.capacity:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self.refill(now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens * 60 / self.capacity)
+
+    def resize(self, per_minute: float) -> None:
+        if per_minute and per_minute != self.capacity:
+            if self.capacity is None:
+                self.tokens = per_minute
+            self.capacity = per_minute
+
+
+class RateLimiter:
+    """
+    Requests/min and tokens/min limiter shared by every thread and coroutine in a run.
+
+    Limits come from the constructor and are updated from the x-ratelimit-* response
+    headers, so an unconfigured limiter sizes itself after the first response.
+    """
+    def __init__(self, requests_per_minute: float | None = None, tokens_per_minute: float | None = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.lock = threading.Lock()
+        self.throttled = 0
+
+    def reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self.lock:
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            if wait > 0:
+                self.throttled += 1
+            return wait
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Block until a request of the given estimated size may be sent.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: int | None) -> None:
+        """
+        Correct a reservation once the real token usage of the request is known.
+        """
+        if actual is None:
+            return
+        with self.lock:
+            self.tokens.tokens += estimated - actual
+
+    def update_from_headers(self, headers) -> None:
+        """
+        Resize the buckets from x-ratelimit-* response headers and clamp them to what the server reports as remaining.
+        """
+        if not headers:
+            return
+        with self.lock:
+            for bucket, name in ((self.requests, "requests"), (self.tokens, "tokens")):
+                try:
+                    limit = headers.get(f"x-ratelimit-limit-{name}")
+                    remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                    if limit:
+                        bucket.resize(float(limit))
+                    if remaining is not None and bucket.capacity:
+                        bucket.tokens = min(bucket.tokens, float(remaining))
+                except ValueError:
+                    continue
@@ -0,0 +1,94 @@
+import threading
+from result_log import iter_records
+from rate_limit import CHARS_PER_TOKEN
+from structured_outputs import mock_response
+
+# Model types answered in-process, without any network access.
+OFFLINE_MODEL_TYPES = ["replay", "mock"]
+MOCK_RESPONSE = "Answer: yes"
+
+
+class ReplayMiss(KeyError):
+    """
+    Raised in replay mode for a prompt that is not in the recorded trace.
+    """
+
+
+class ReplayClient:
+    """
+    Serves chat responses from a trace recorded with --trace instead of calling a model.
+
+    The trace is a JSON-lines file (optionally .gz/.zst) of {"prompt", "response"} records;
+    if a prompt was recorded several times the last response wins. In 'replay' mode a prompt
+    missing from the trace raises ReplayMiss, so a benchmark cannot silently diverge from the
+    recording; in 'mock' mode (trace optional) misses get `default` instead, or a valid
+    output for the response format when one is requested.
+    """
+    def __init__(self, trace_path: str | None = None, default: str | None = None):
+        """
+        :param trace_path: Recorded trace, or None for an empty one.
+        :param default: Response for prompts missing from the trace (None raises ReplayMiss).
+        """
+        self.trace_path = trace_path
+        self.default = default
+        self.responses = {}
+        if trace_path:
+            for record in iter_records(trace_path):
+                if "prompt" in record and "response" in record:
+                    self.responses[record["prompt"]] = record["response"]
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def respond(self, prompt: str, response_format: dict | None = None) -> str:
+        response = self.responses.get(prompt)
+        with self.lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if response is not None:
+            return response
+        if self.default is None:
+            raise ReplayMiss(f"Prompt not found in replay trace {self.trace_path}: {prompt[:80]!r}...")
+        return mock_response(response_format) if response_format else self.default
+
+    def usage(self, prompt: str, response: str) -> dict:
+        """
+        Approximate token usage of a replayed call, in the shape of a chat completion `usage`.
+        """
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        completion_tokens = len(response or "") // CHARS_PER_TOKEN
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.responses),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total * 100) if total > 0 else 0,
+            }
+
+
+# Process-wide registry, so the blocking and async models of a run load a trace only once.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_offline_client(model_type: str, trace_path: str | None = None) -> ReplayClient:
+    """
+    Return the shared ReplayClient for an offline model type and trace, creating it on first use.
+
+    :param model_type: 'replay' (trace required, misses raise) or 'mock' (misses get MOCK_RESPONSE).
+    :param trace_path: Recorded trace to serve responses from.
+    """
+    if model_type == "replay" and not trace_path:
+        raise ValueError("model_type 'replay' needs a recorded trace (--replay PATH)")
+    key = (model_type, trace_path)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ReplayClient(trace_path, default=MOCK_RESPONSE if model_type == "mock" else None)
+            _clients[key] = client
+        return client
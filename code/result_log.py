@@ -0,0 +1,220 @@
+import gzip
+import io
+import json
+import os
+import queue
+import threading
+import time
+
+
+def write_json_atomic(path: str, obj, indent: int | None = None) -> None:
+    """
+    Write a JSON file so readers only ever see the old or the new contents.
+
+    :param path: Destination file.
+    :param obj: JSON-serialisable value.
+    :param indent: Pretty-print with this indent (for files that are reviewed as diffs).
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_records(path: str, repair: bool = True) -> list:
+    """
+    Read a plain JSON-lines log written by ResultWriter.
+
+    :param path: Log file.
+    :param repair: Truncate a partial last line (from an interrupted write) off the file,
+                   so appending to the log continues on a clean line.
+    :return: The parsed records, skipping lines that are not valid JSON.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+    complete = data.rfind(b"\n") + 1
+    if complete < len(data):
+        print(f"Dropping a partially written line at the end of {path}")
+        if repair:
+            with open(path, "r+b") as f:
+                f.truncate(complete)
+    records = []
+    for line_number, line in enumerate(data[:complete].decode("utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            print(f"Skipping unreadable line {line_number} of {path}: {e}")
+    return records
+
+
+def open_sink(path: str):
+    """
+    Open a JSON-lines output file for appending, compressed according to its extension.
+
+    :param path: '*.gz' for gzip, '*.zst' for zstd (needs the zstandard package), anything else for plain text.
+    :return: (writable binary stream, underlying file object used for fsync).
+    """
+    raw = open(path, "ab")
+    if path.endswith(".gz"):
+        return gzip.GzipFile(fileobj=raw, mode="ab"), raw
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raw.close()
+            raise ImportError("Writing .zst output requires the zstandard package (pip install zstandard); use a .gz path instead.")
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=False), raw
+    return raw, raw
+
+
+def iter_records(path: str):
+    """
+    Stream the records of a JSON-lines file written by ResultWriter, compressed or not.
+
+    :param path: '*.gz', '*.zst' (needs the zstandard package) or plain JSON lines.
+    :return: Generator of parsed records, skipping lines that are not valid JSON.
+    """
+    if path.endswith(".gz"):
+        stream = gzip.open(path, "rb")
+    elif path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst files requires the zstandard package (pip install zstandard).")
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    else:
+        stream = open(path, "rb")
+    with stream, io.TextIOWrapper(stream, encoding="utf-8") as lines:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping unreadable line {line_number} of {path}: {e}")
+
+
+class ResultWriter:
+    """
+    Single writer thread that owns an output file.
+
+    Callers hand records to write(), which only enqueues them, so workers and coroutines
+    never contend on a lock or block on file I/O. The writer thread keeps one handle open,
+    writes records as they arrive and flushes (and fsyncs) every `flush_interval` seconds,
+    so a crash loses at most the last interval of records. Plain logs stay readable by
+    read_records; compressed sinks are meant for verbose traces. A record that cannot be
+    serialised or written is reported and skipped without stopping the thread, and close()
+    raises if any record was lost.
+    """
+    _CLOSE = object()
+
+    def __init__(self, path: str, flush_interval: float = 1.0, fsync: bool = True):
+        """
+        :param path: Output file, appended to (see open_sink for compression).
+        :param flush_interval: Maximum number of seconds a record stays buffered.
+        :param fsync: Also fsync on every flush.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.stream, self.raw = open_sink(path)
+        self.queue = queue.Queue()
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=f"ResultWriter({path})", daemon=True)
+        self.thread.start()
+
+    def write(self, record) -> None:
+        """
+        Queue a JSON-serialisable record to be written as one line.
+        """
+        self.queue.put(record)
+
+    def run(self) -> None:
+        last_flush = time.monotonic()
+        dirty = False
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            if record is self._CLOSE:
+                break
+            if record is not None:
+                lines = [record]
+                while True:
+                    try:
+                        record = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is self._CLOSE:
+                        self.queue.put(record)
+                        break
+                    lines.append(record)
+                encoded = []
+                for line in lines:
+                    try:
+                        encoded.append(json.dumps(line) + "\n")
+                    except (TypeError, ValueError) as e:
+                        self.drop(1, e)
+                try:
+                    self.stream.write("".join(encoded).encode("utf-8"))
+                    self.written += len(encoded)
+                except OSError as e:
+                    self.drop(len(encoded), e)
+                dirty = True
+            if dirty and time.monotonic() - last_flush >= self.flush_interval:
+                self.safe_flush()
+                dirty = False
+                last_flush = time.monotonic()
+        self.safe_flush()
+
+    def drop(self, count: int, error: Exception) -> None:
+        print(f"Could not write {count} record(s) to {self.path}: {error!r}")
+        self.dropped += count
+        if self.error is None:
+            self.error = error
+
+    def safe_flush(self) -> None:
+        try:
+            self.flush()
+        except OSError as e:
+            self.drop(0, e)
+
+    def flush(self) -> None:
+        self.stream.flush()
+        if self.raw is not self.stream:
+            self.raw.flush()
+        if self.fsync:
+            os.fsync(self.raw.fileno())
+
+    def close(self) -> None:
+        """
+        Write everything still queued and close the file.
+
+        :raises RuntimeError: If any record could not be serialised or written (chained to the first error).
+        """
+        self.queue.put(self._CLOSE)
+        self.thread.join()
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+        if self.error is not None:
+            raise RuntimeError(f"{self.dropped} record(s) could not be written to {self.path}") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -77,14 +77,14 @@ class Agent:
         """
         prompt = self.evalPrompt.format(perspective=self.perspective, disamb =disamb,name=self.name, question=question)
         # print(prompt)
-        choice = self.llm.get_output(prompt)
+        choice = self.llm.get_output(prompt, stage="simtom_simulate")
         self.wasAsked, self.replied = prompt, choice
         return choice, self.perspective # Return perspective for debugging purposes
 
 class World:
     """World class that keeps track of true world state.
     """
-    def __init__(self, llm, context:dict, debug=False, simModel=None):
+    def __init__(self, llm, context:dict, debug=False, simModel=None, parserModel=None):
         self.llm = llm
         self.agentNames = []
         self.agents:Dict[str, Agent] = {}                 # Note this is a dictioary for maybe future multi-agent simulations
@@ -93,7 +93,8 @@ class World:
         self.perspectives : Dict[str, str] = {}           # Perspectives (Dict for same reason as above)
         self.debug = debug                                # This is verbose
         self.simModel = simModel
-        self.disamb = TheoryOfMindSystem(mode="hitom").disambiguate_story(self.story)
+        self.parserModel = parserModel                    # Shared model for character parsing (defaults to gpt-4o-mini)
+        self.disamb = TheoryOfMindSystem.disambiguate_story(self.story)
 
         if self.simModel == None:
             self.simModel = self.llm
@@ -104,8 +105,10 @@ class World:
         {self.story}
         What are the characters in this story?
         Output only the character names, separated by commas. Don't output anything else\n Character Names: """
-        gpt = LanguageModel("gpt-4o-mini")
-        self.agentNames = gpt.get_output(prompt).replace(" ", "").split(",")
+        gpt = self.parserModel
+        if gpt is None:
+            gpt = LanguageModel("gpt-4o-mini")
+        self.agentNames = gpt.get_output(prompt, stage="simtom_characters").replace(" ", "").split(",")
         if self.debug:
             print("Agent names:", self.agentNames)
 
@@ -114,7 +117,7 @@ class World:
         # Here is the perspective-taking.
         prompt = PERSPECTIVE_PROMPT
         # Take perspective for given character.
-        self.perspectives[characterName] = self.llm.get_output(prompt.format(story=self.story, disamb =self.disamb, character=characterName))
+        self.perspectives[characterName] = self.llm.get_output(prompt.format(story=self.story, disamb =self.disamb, character=characterName), stage="simtom_perspective")
         if self.debug:
             print(f"Perspective of {characterName}:", self.perspectives[characterName])
         
@@ -133,18 +136,18 @@ class World:
         if agentName is None:
             # This is a question about the truth.
             # For truth questions, there's really no point of simulation/perspective taking, so we just ask the LLM the question (same as baseline).
-            return self.llm.get_output(f"{self.story}\nBased on the above information, answer the following question:\n{question}"), "Truth Question"
+            return self.llm.get_output(f"{self.story}\nBased on the above information, answer the following question:\n{question}", stage="simtom_reality"), "Truth Question"
         else:
             # Here we ask the agent to simulate.
             return self.agents[agentName].evalQuestion(question = question, disamb = self.disamb)
         
 
 # Evaluation function
-def evalQuestion(llm:LanguageModel, context:dict, question:str, debug=False, simModel=None) -> Tuple[str, str]:
+def evalQuestion(llm:LanguageModel, context:dict, question:str, debug=False, simModel=None, parserModel=None) -> Tuple[str, str]:
     """End to end function for Tomi evaluation.
     """
     # Create world for perspective taking
-    world = World(llm, context, debug=debug, simModel=simModel)
+    world = World(llm, context, debug=debug, simModel=simModel, parserModel=parserModel)
     
     # What's the subject of the question (who's perspective do we have to take?)
     questionSubject = question.split(" ")[3]
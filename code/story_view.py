@@ -0,0 +1,40 @@
+import itertools
+
+# Stands in for the statements left out of a windowed decision prompt; the world state passed
+# with the decision already accounts for them.
+ELIDED = "(statements omitted: {count}; the world state reflects them)"
+
+
+class StoryView:
+    """
+    The statements of a story held once, as one string plus the offset at which each statement starts.
+
+    The story before a statement is a slice of that string, so all decisions on a story share
+    one copy of its text instead of a separately built (and ever longer) prefix per statement.
+    With a window, each slice is limited to the last `window` statements, which keeps decision
+    prompts a bounded size on long conversations.
+    """
+    __slots__ = ("text", "offsets", "window")
+
+    def __init__(self, parts: list, joiner: str, window: int | None = None):
+        """
+        :param parts: Statements of the story.
+        :param joiner: Separator placed before every statement.
+        :param window: Number of preceding statements to include, or None for all of them.
+        """
+        chunks = [joiner + part for part in parts]
+        self.text = "".join(chunks)
+        self.offsets = list(itertools.accumulate((len(chunk) for chunk in chunks), initial=0))
+        self.window = window
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        """
+        :param index: 0-based number of a statement.
+        :return: The story before that statement, limited to the window.
+        """
+        start = 0 if self.window is None else max(0, index - self.window)
+        prefix = self.text[self.offsets[start]:self.offsets[index]]
+        return ELIDED.format(count=start) + prefix if start else prefix
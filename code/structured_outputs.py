@@ -0,0 +1,74 @@
+import json
+
+
+def json_schema_format(name: str, properties: dict) -> dict:
+    """
+    Build a strict `response_format` for the chat completions API (also understood by sglang and
+    vLLM, which enforce it with constrained decoding).
+
+    :param name: Name of the schema.
+    :param properties: JSON schema of each (required) field, in the order the model should write them.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+# Knowledge decisions: brief reasoning first, as the decision prompts ask, then the yes/no answer.
+DECISION_FORMAT = json_schema_format("decision", {
+    "reasoning": {"type": "string"},
+    "answer": {"type": "string", "enum": ["yes", "no"]},
+})
+
+
+def choice_format(labels: list) -> dict:
+    """
+    :param labels: The options the answer must pick from, exactly as they should be returned.
+    """
+    return json_schema_format("choice", {
+        "reasoning": {"type": "string"},
+        "choice": {"type": "string", "enum": list(labels)},
+    })
+
+
+def parse_field(output: str | None, field: str, allowed: list) -> str | None:
+    """
+    Read one field of a structured output.
+
+    :param allowed: Accepted values of the field, or None to accept any string.
+    :return: The value, or None if the output is not a JSON object with an accepted value in `field`
+             (e.g. a backend that ignored the response format), so the caller can fall back.
+    """
+    try:
+        value = json.loads(output).get(field)
+    except (TypeError, ValueError, AttributeError):
+        return None
+    if not isinstance(value, str):
+        return None
+    return value if allowed is None or value in allowed else None
+
+
+def conforms(output: str | None, response_format: dict) -> bool:
+    """
+    :return: Whether the output is a JSON object with every field of the response format (and allowed enum values).
+    """
+    properties = response_format["json_schema"]["schema"]["properties"]
+    return all(parse_field(output, name, field.get("enum")) is not None for name, field in properties.items())
+
+
+def mock_response(response_format: dict) -> str:
+    """
+    A valid output for a response format: the first enum value (or an empty string) for each field.
+    """
+    schema = response_format["json_schema"]["schema"]
+    return json.dumps({name: field.get("enum", [""])[0] for name, field in schema["properties"].items()})
@@ -0,0 +1,295 @@
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from replay import ReplayClient
+from structured_outputs import conforms, mock_response
+
+DEFAULT_PORT = 30000
+LATENCY_DISTRIBUTIONS = ["fixed", "uniform", "exponential", "lognormal"]
+
+
+def make_latency(distribution: str = "fixed", mean: float = 0.0, spread: float = 0.0, rng: random.Random | None = None):
+    """
+    Build a sampler of per-request latencies.
+
+    :param distribution: 'fixed', 'uniform' (mean +/- spread), 'exponential' or 'lognormal'
+                         (spread is the sigma of the underlying normal; heavy tail for large values).
+    :param mean: Mean latency in seconds.
+    :param spread: Half-width (uniform, seconds) or shape (lognormal) of the distribution.
+    :param rng: Random number generator, for reproducible runs.
+    :return: Function returning a latency in seconds.
+    """
+    rng = rng or random.Random()
+    if mean <= 0:
+        return lambda: 0.0
+    if distribution == "fixed":
+        return lambda: mean
+    if distribution == "uniform":
+        return lambda: max(0.0, rng.uniform(mean - spread, mean + spread))
+    if distribution == "exponential":
+        return lambda: rng.expovariate(1 / mean)
+    if distribution == "lognormal":
+        mu = math.log(mean) - spread ** 2 / 2
+        return lambda: rng.lognormvariate(mu, spread)
+    raise ValueError(f"Unknown latency distribution {distribution!r}; use one of {LATENCY_DISTRIBUTIONS}")
+
+
+class StubBackend:
+    """
+    In-memory stand-in for the OpenAI chat completions, files and batches endpoints.
+
+    Every prompt is answered by `responder(prompt)`. Batches are processed in a background
+    thread after `batch_delay` seconds, so clients see them move from "in_progress" to
+    "completed" the same way they would against the real API. Chat requests can be delayed
+    by `latency()` seconds and fail with a 429 or 500 at the given rates, to load-test the
+    client's concurrency, rate limiting and retries. Like a server with constrained decoding,
+    a request with a `response_format` always gets an output that follows it.
+    """
+    def __init__(self, responder=None, batch_delay: float = 0.0, latency=None, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int | None = None):
+        """
+        :param responder: Function mapping a prompt to the response text.
+        :param batch_delay: Seconds before a submitted batch completes.
+        :param latency: Function returning the delay of a chat request in seconds (see make_latency).
+        :param error_rate: Fraction of chat requests answered with a 500 error.
+        :param rate_limit_rate: Fraction of chat requests answered with a 429 error.
+        :param seed: Seed for the fault injection.
+        """
+        self.responder = responder or (lambda prompt: "Answer: yes")
+        self.batch_delay = batch_delay
+        self.latency = latency or (lambda: 0.0)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.errors = 0
+        self.files = {}
+        self.batches = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.chat_requests = 0
+        self.batch_requests = 0
+
+    def new_id(self, prefix: str) -> str:
+        with self.lock:
+            return f"{prefix}-{next(self.ids)}"
+
+    def sample_fault(self) -> int | None:
+        """
+        :return: HTTP status of an injected failure for the next chat request, or None.
+        """
+        with self.lock:
+            draw = self.rng.random()
+            if draw < self.rate_limit_rate:
+                status = 429
+            elif draw < self.rate_limit_rate + self.error_rate:
+                status = 500
+            else:
+                return None
+            self.errors += 1
+            return status
+
+    def chat(self, body: dict) -> dict:
+        prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+        content = self.responder(prompt)
+        response_format = body.get("response_format")
+        if response_format and not conforms(content, response_format):
+            content = mock_response(response_format)
+        with self.lock:
+            self.chat_requests += 1
+        return {
+            "id": self.new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+        }
+
+    def add_file(self, filename: str, content: bytes, purpose: str) -> dict:
+        file_id = self.new_id("file")
+        record = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self.lock:
+            self.files[file_id] = (record, content)
+        return record
+
+    def create_batch(self, body: dict) -> dict:
+        batch_id = self.new_id("batch")
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body.get("input_file_id"),
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Timer(self.batch_delay, self.run_batch, args=(batch_id,)).start()
+        return batch
+
+    def run_batch(self, batch_id: str) -> None:
+        with self.lock:
+            batch = self.batches[batch_id]
+            _, content = self.files[batch["input_file_id"]]
+        lines = []
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            response = {"status_code": 200, "request_id": self.new_id("req"), "body": self.chat(request["body"])}
+            lines.append(json.dumps({"id": self.new_id("batch_req"), "custom_id": request["custom_id"], "response": response, "error": None}))
+        output = self.add_file(f"{batch_id}_output.jsonl", ("\n".join(lines) + "\n").encode("utf-8"), "batch_output")
+        with self.lock:
+            self.batch_requests += len(lines)
+            batch["output_file_id"] = output["id"]
+            batch["request_counts"] = {"total": len(lines), "completed": len(lines), "failed": 0}
+            batch["status"] = "completed"
+
+    def get_batch(self, batch_id: str) -> dict | None:
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            return dict(batch) if batch else None
+
+    def get_file(self, file_id: str):
+        with self.lock:
+            return self.files.get(file_id)
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict:
+    """
+    :return: Mapping of form field name to (filename, payload bytes).
+    """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+def make_handler(backend: StubBackend):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, payload: dict, status: int = 200, headers: dict | None = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def not_found(self) -> None:
+            self.send_json({"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}}, status=404)
+
+        def read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            body = self.read_body()
+            if self.path == "/v1/chat/completions":
+                time.sleep(backend.latency())
+                status = backend.sample_fault()
+                if status == 429:
+                    self.send_json({"error": {"message": "Rate limit reached (injected by stub server)", "type": "requests", "code": "rate_limit_exceeded"}}, status=429, headers={"retry-after-ms": "100"})
+                elif status is not None:
+                    self.send_json({"error": {"message": "Internal server error (injected by stub server)", "type": "server_error"}}, status=status)
+                else:
+                    self.send_json(backend.chat(json.loads(body)))
+            elif self.path == "/v1/files":
+                fields = parse_multipart(self.headers["Content-Type"], body)
+                filename, content = fields["file"]
+                purpose = fields.get("purpose", (None, b"batch"))[1].decode("utf-8")
+                self.send_json(backend.add_file(filename or "upload.jsonl", content, purpose))
+            elif self.path == "/v1/batches":
+                self.send_json(backend.create_batch(json.loads(body)))
+            else:
+                self.not_found()
+
+        def do_GET(self):
+            match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+            if match:
+                batch = backend.get_batch(match.group(1))
+                return self.send_json(batch) if batch else self.not_found()
+            match = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+            if match:
+                stored = backend.get_file(match.group(1))
+                if stored is None:
+                    return self.not_found()
+                content = stored[1]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+                return
+            self.not_found()
+
+    return StubHandler
+
+
+def serve(backend: StubBackend, host: str = "localhost", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """
+    Start the stub server in a background thread.
+
+    :return: The running server; call shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the chat completions and Batch API endpoints.")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--response", type=str, default="Answer: yes", help="Text returned for every prompt.")
+    parser.add_argument("--replay", type=str, default=None, metavar="TRACE", help="Answer prompts recorded in a --trace file with their recorded response (others get --response).")
+    parser.add_argument("--batch_delay", type=float, default=1.0, help="Seconds before a submitted batch completes.")
+    parser.add_argument("--latency_ms", type=float, default=0.0, help="Mean latency of a chat request in milliseconds.")
+    parser.add_argument("--latency_dist", type=str, choices=LATENCY_DISTRIBUTIONS, default="fixed", help="Distribution of chat request latencies.")
+    parser.add_argument("--latency_spread", type=float, default=0.0, help="Half-width in milliseconds for 'uniform', sigma for 'lognormal'.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of chat requests that fail with a 500 error.")
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="Fraction of chat requests that fail with a 429 error.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latencies and injected errors.")
+    args = parser.parse_args()
+
+    responder = lambda prompt: args.response
+    if args.replay:
+        responder = ReplayClient(args.replay, default=args.response).respond
+    spread = args.latency_spread / 1000 if args.latency_dist == "uniform" else args.latency_spread
+    latency = make_latency(args.latency_dist, args.latency_ms / 1000, spread, random.Random(args.seed))
+    backend = StubBackend(responder=responder, batch_delay=args.batch_delay, latency=latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    print(f"Stub server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
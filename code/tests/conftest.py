@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of code/ import each other as top-level modules, as when a script is run from code/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import pytest
+from stub_server import StubBackend, serve
+
+pytest.importorskip("openai")
+from batching import BatchLanguageModel, BatchRequestError, PromptCollector, WavefrontLanguageModel
+
+
+class FailingBackend(StubBackend):
+    """
+    Stub whose batches fail every request with "fail" in its prompt.
+    """
+    def run_batch(self, batch_id: str) -> None:
+        super().run_batch(batch_id)
+        with self.lock:
+            batch = self.batches[batch_id]
+            record, content = self.files[batch["output_file_id"]]
+            lines = []
+            for line in content.decode("utf-8").splitlines():
+                result = json.loads(line)
+                if "fail" in result["response"]["body"]["choices"][0]["message"]["content"]:
+                    result["response"] = {"status_code": 500, "body": {}}
+                lines.append(json.dumps(result))
+            self.files[batch["output_file_id"]] = (record, ("\n".join(lines) + "\n").encode("utf-8"))
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(backend):
+        server = serve(backend, port=0)
+        servers.append(server)
+        return f"http://localhost:{server.server_address[1]}/v1"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def make_model(base_url, batch_dir, **kwargs):
+    return BatchLanguageModel("gpt-4o", model_type="local", base_url=base_url, batch_dir=str(batch_dir), poll_interval=0.01, idle_window=0.01, **kwargs)
+
+
+def test_collector_is_abstract():
+    with pytest.raises(TypeError):
+        PromptCollector("gpt-4o")
+
+
+def test_concurrent_prompts_go_out_as_one_batch(stub, tmp_path):
+    backend = StubBackend(responder=lambda prompt: f"echo {prompt}")
+    model = make_model(stub(backend), tmp_path)
+
+    async def run():
+        return await asyncio.gather(*[model.get_output(prompt) for prompt in ["a", "b", "a", "c"]])
+
+    assert asyncio.run(run()) == ["echo a", "echo b", "echo a", "echo c"]
+    assert model.stats()["waves"] == 1
+    assert len(backend.batches) == 1
+    # Duplicate prompts of a wave are sent once.
+    assert backend.batch_requests == 3
+    assert backend.chat_requests == 3
+
+
+def test_restarted_run_reattaches_to_submitted_batches(stub, tmp_path):
+    backend = StubBackend()
+    base_url = stub(backend)
+    asyncio.run(make_model(base_url, tmp_path).get_output("a"))
+    with open(tmp_path / "manifest.json", encoding="utf-8") as f:
+        assert len(json.load(f)) == 1
+    assert asyncio.run(make_model(base_url, tmp_path).get_output("a")) == "Answer: yes"
+    assert len(backend.batches) == 1
+
+
+def test_requests_that_keep_failing_raise_batch_request_error(stub, tmp_path):
+    backend = FailingBackend(responder=lambda prompt: prompt)
+    model = make_model(stub(backend), tmp_path, max_batch_retries=1)
+
+    async def run():
+        return await asyncio.gather(model.get_output("fine"), model.get_output("fail"), return_exceptions=True)
+
+    good, bad = asyncio.run(run())
+    assert good == "fine"
+    assert isinstance(bad, BatchRequestError)
+    # The failed request was resubmitted once, alone.
+    assert len(backend.batches) == 2
+
+
+class RecordingModel:
+    """
+    Async model that answers every prompt with itself and records the order prompts were sent in.
+    """
+    model_name = "gpt-4o"
+    model_type = "local"
+    temperature = 0.0
+
+    def __init__(self):
+        self.sent = []
+
+    async def get_output(self, prompt, retry_count=10, stage=None, response_format=None):
+        self.sent.append(prompt)
+        await asyncio.sleep(0)
+        if prompt == "error":
+            raise ValueError("bad request")
+        return prompt.upper()
+
+
+def test_wavefront_advances_problems_one_stage_at_a_time():
+    model = RecordingModel()
+    wavefront = WavefrontLanguageModel(model)
+
+    async def problem(name):
+        first = await wavefront.get_output(f"{name} step 1")
+        second = await wavefront.get_output(f"{name} step 2")
+        return first, second
+
+    async def run():
+        return await asyncio.gather(*[problem(name) for name in ["c", "a", "b"]])
+
+    assert asyncio.run(run()) == [(f"{name.upper()} STEP 1", f"{name.upper()} STEP 2") for name in ["c", "a", "b"]]
+    assert wavefront.stats()["waves"] == 2
+    # Each wave is sent in sorted order, so prompts with a shared prefix are adjacent.
+    assert model.sent == ["a step 1", "b step 1", "c step 1", "a step 2", "b step 2", "c step 2"]
+
+
+def test_wavefront_fails_only_the_prompt_that_failed():
+    wavefront = WavefrontLanguageModel(RecordingModel())
+
+    async def run():
+        return await asyncio.gather(wavefront.get_output("ok"), wavefront.get_output("error"), return_exceptions=True)
+
+    ok, error = asyncio.run(run())
+    assert ok == "OK"
+    assert isinstance(error, ValueError)
@@ -0,0 +1,41 @@
+import argparse
+import json
+import os
+
+import pytest
+
+pytest.importorskip("openai")
+import benchmark
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_percentile_is_nearest_rank():
+    assert benchmark.percentile([], 50) == 0.0
+    assert benchmark.percentile([3, 1, 2, 4], 50) == 2
+    assert benchmark.percentile([3, 1, 2, 4], 95) == 4
+    assert benchmark.percentile([5], 1) == 5
+
+
+def summary(calls, stage_calls):
+    counts = lambda n: {"calls": n, "prompt_tokens": 10 * n, "completion_tokens": n}
+    return {"total": counts(calls), "stages": {"decide": counts(stage_calls)}, "buckets": {}}
+
+
+def test_compare_reports_counts_above_the_tolerance():
+    baseline = summary(100, 50)
+    assert benchmark.compare(summary(100, 50), baseline, 0.0) == []
+    assert benchmark.compare(summary(104, 50), baseline, 0.05) == []
+    assert benchmark.compare(summary(90, 60), baseline, 0.0) == [
+        "stage decide: calls 50 -> 60", "stage decide: prompt_tokens 500 -> 600", "stage decide: completion_tokens 50 -> 60"]
+    # Stages the baseline never saw count as growth from zero.
+    assert benchmark.compare({"total": baseline["total"], "stages": {"new": summary(1, 1)["total"]}, "buckets": {}}, baseline, 0.0)
+
+
+def test_mock_run_matches_the_checked_in_baseline(monkeypatch):
+    monkeypatch.chdir(CODE_DIR)
+    with open("benchmark_baseline.json", encoding="utf-8") as f:
+        baseline = json.load(f)
+    result = benchmark.run_benchmark(argparse.Namespace(**baseline["config"]))
+    assert benchmark.compare(result, baseline, 0.0) == []
+    assert result["total"]["calls"] == baseline["total"]["calls"]
@@ -0,0 +1,15 @@
+import pytest
+
+pytest.importorskip("openai")
+from llm_utils import get_client
+
+BASE_URL = "http://localhost:8000/v1"
+
+
+def test_clients_are_shared_per_endpoint():
+    client = get_client("key", BASE_URL)
+    assert get_client("key", BASE_URL) is client
+    assert get_client("key", "http://localhost:8001/v1") is not client
+    assert get_client("key", BASE_URL, use_async=True) is not client
+    assert get_client("key", BASE_URL, max_connections=4) is not client
+
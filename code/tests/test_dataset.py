@@ -0,0 +1,137 @@
+import asyncio
+import concurrent.futures
+import json
+import random
+import threading
+
+import pytest
+from dataset_utils import HitomDataset, JsonlIndex, run_bounded, run_bounded_async, stratified_sample
+
+
+def write_split(path, descriptors):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, (order, length) in enumerate(descriptors):
+            f.write(json.dumps({"question": f"q{i}", "descriptor": {"order": order, "length": length}}) + "\n")
+        f.write("not json\n")
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    descriptors = [(order, length) for order in range(3) for length in (1, 2) for _ in range(4)]
+    splits = {}
+    for split in ("tell", "no_tell"):
+        splits[split] = str(tmp_path / f"{split}.jsonl")
+        write_split(splits[split], descriptors)
+    return HitomDataset(splits)
+
+
+def test_entries_are_partitioned_by_order_length_and_split(dataset):
+    assert sorted(dataset.partitions) == sorted((order, length, split) for order in (1, 2) for length in (1, 2) for split in ("tell", "no_tell"))
+    assert all(len(keys) == 4 for keys in dataset.partitions.values())
+    assert dataset.partitions[(1, 1, "tell")] == [("tell", i) for i in range(9, 13)]
+
+
+def test_keys_read_back_their_entries(dataset):
+    entry = dataset.get(("no_tell", 9))
+    assert (entry["split"], entry["id"], entry["question"]) == ("no_tell", 9, "q8")
+    assert dataset.get(("no_tell", 1000)) is None
+    assert dataset.get(("other", 1)) is None
+
+
+def test_sample_is_stratified(dataset):
+    keys = dataset.sample(16, random.Random(0))
+    assert len(keys) == 16
+    for partition, partition_keys in dataset.partitions.items():
+        assert len([key for key in keys if key in partition_keys]) == 2
+
+
+def test_sample_is_deterministic_for_a_seed(dataset):
+    assert dataset.sample(8, random.Random(7)) == dataset.sample(8, random.Random(7))
+    assert len({tuple(dataset.sample(8, random.Random(seed))) for seed in range(5)}) > 1
+
+
+def test_non_positive_sample_selects_everything(dataset):
+    assert len(dataset.sample(0)) == 32
+
+
+def test_small_partitions_contribute_all_their_entries():
+    selected = stratified_sample({"a": [1], "b": [2, 3, 4]}, 4, random.Random(0))
+    assert len(selected) == 3
+    assert selected[0] == 1
+
+
+def test_jsonl_index_reads_lines_by_offset(tmp_path):
+    path = str(tmp_path / "data.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"a": "\u00e9"}\n{"a": 2}\n{"a": 3}')
+    index = JsonlIndex(path, "tell")
+    assert len(index) == 3
+    assert index[0] == {"a": "\u00e9", "id": 1, "split": "tell"}
+    assert index[2] == {"a": 3, "id": 3, "split": "tell"}
+    index.close()
+
+
+def test_empty_jsonl_index(tmp_path):
+    path = tmp_path / "empty.jsonl"
+    path.write_text("")
+    assert len(JsonlIndex(str(path))) == 0
+
+
+def test_run_bounded_keeps_at_most_max_pending_items_in_flight():
+    lock = threading.Lock()
+    running, peak = 0, 0
+    pulled = []
+
+    def work(item):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        threading.Event().wait(0.005)
+        with lock:
+            running -= 1
+        return item * 2
+
+    def items():
+        for i in range(20):
+            pulled.append(i)
+            yield i
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = []
+        for future in run_bounded(executor, work, items(), 3):
+            results.append(future.result())
+            # Items are only pulled as earlier ones complete.
+            assert len(pulled) <= len(results) + 3
+    assert sorted(results) == [i * 2 for i in range(20)]
+    assert peak <= 3
+
+
+def test_run_bounded_async_keeps_at_most_max_pending_tasks():
+    running, peak = 0, 0
+
+    async def work(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return item
+
+    async def run():
+        return [task.result() async for task in run_bounded_async(work, range(20), 4)]
+
+    assert sorted(asyncio.run(run())) == list(range(20))
+    assert peak == 4
+
+
+def test_run_bounded_surfaces_worker_errors():
+    def work(item):
+        if item == 2:
+            raise ValueError("bad entry")
+        return item
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        with pytest.raises(ValueError):
+            for future in run_bounded(executor, work, range(5), 2):
+                future.result()
@@ -0,0 +1,60 @@
+import pytest
+from decision_rules import DecisionRules, FantomDecisionRules, HitomDecisionRules, format_decision_rules, get_decision_rules
+
+STORY = [
+    "1 Mia, Owen and Ava entered the kitchen.",
+    "2 The onion is in the red_box.",
+    "3 Mia moved the onion to the green_box.",
+    "4 Owen exited the kitchen.",
+    "5 Ava privately told Mia that the onion is in the blue_bucket now.",
+    "6 Owen publicly claimed that onion is in the red_box now.",
+]
+
+
+@pytest.mark.parametrize("part, agent, expected", [
+    (STORY[0], "owen", (True, "own_action")),
+    (STORY[0], "liam", None),
+    (STORY[3], "owen", (True, "own_action")),
+    (STORY[3], "mia", (True, "exit")),
+    (STORY[4], "mia", (True, "private_communication")),
+    (STORY[4], "owen", (False, "private_communication")),
+    (STORY[5], "liam", (True, "public_communication")),
+    (STORY[2], "mia", (True, "own_action")),
+    (STORY[2], "owen", None),
+])
+def test_hitom_rules(part, agent, expected):
+    rules = HitomDecisionRules()
+    assert rules.classify(part, agent, rules.story_agents(STORY)) == expected
+
+
+def test_hitom_subject_must_be_a_story_agent():
+    rules = HitomDecisionRules()
+    assert rules.story_agents(STORY) == {"mia", "owen", "ava"}
+    assert rules.classify("2 The onion is in the red_box.", "the", rules.story_agents(STORY)) is None
+    # Without the story's agents, statement subjects are left to the model.
+    assert rules.classify(STORY[2], "mia") is None
+
+
+def test_fantom_rules():
+    rules = get_decision_rules("fantom")
+    assert isinstance(rules, FantomDecisionRules)
+    assert rules.classify("Anna: Hi Bob.", "anna") == (True, "own_dialogue")
+    assert rules.classify("Anna: Hi Bob.", "bob") is None
+    assert rules.story_agents(["Anna: Hi Bob."]) is None
+    assert get_decision_rules(None) is None
+
+
+def test_rules_are_abstract():
+    with pytest.raises(TypeError):
+        DecisionRules()
+
+
+def test_decide_counts_outcomes():
+    rules = HitomDecisionRules()
+    agents = rules.story_agents(STORY)
+    for part in STORY:
+        rules.decide(f"  {part}  ", "mia", agents)
+    stats = rules.stats()
+    assert (stats["resolved"], stats["delegated"], stats["calls_avoided"]) == (5, 1, 5)
+    assert stats["rules"] == {"own_action": 2, "exit": 1, "private_communication": 1, "public_communication": 1}
+    assert format_decision_rules(stats).startswith("Knowledge decisions resolved by rules: 5 of 6 (83.33%, 5 calls avoided): own_action 2")
@@ -0,0 +1,38 @@
+import pytest
+from perspective import NARRATOR, PerspectiveChain, parse_hitom_question
+
+
+def test_reality_question_has_no_agents():
+    chain = parse_hitom_question("Question: Where is the plum really?")
+    assert chain.agents == ()
+    assert chain.questions == ("Question: Where is the plum really?",)
+    assert chain.first_agent == NARRATOR
+
+
+def test_first_order_question():
+    chain = parse_hitom_question("Where does Oliver really think the plum is?")
+    assert chain.agents == ("oliver",)
+    assert chain.questions[-1] == "Where is the plum?"
+
+
+@pytest.mark.parametrize("names", [["Oliver", "Aria"], ["Oliver", "Aria", "Mia"], ["Oliver", "Aria", "Mia", "Owen"]])
+def test_nested_questions(names):
+    question = f"Question: Where does {names[0]} think {''.join(f'{name} thinks ' for name in names[1:])}the plum is?"
+    chain = parse_hitom_question(question)
+    assert chain.agents == tuple(name.lower() for name in names)
+    assert chain.depth == len(names)
+    assert chain.questions[0] == question
+    for level in range(1, len(names)):
+        nested = "".join(f"{name} thinks " for name in names[level + 1:])
+        assert chain.questions[level] == f"Where does {names[level]} think {nested}the plum is?"
+    assert chain.questions[-1] == "Where is the plum?"
+
+
+@pytest.mark.parametrize("question", ["Where did Oliver put the plum?", "What does Oliver think of the plum?", ""])
+def test_other_questions_are_not_parsed(question):
+    assert parse_hitom_question(question) is None
+
+
+def test_chain_needs_one_question_per_agent_plus_final():
+    with pytest.raises(ValueError):
+        PerspectiveChain(("oliver",), ("Where is the plum?",))
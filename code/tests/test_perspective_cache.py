@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from cache_utils import PerspectiveCache
+
+
+def test_concurrent_requests_compute_once():
+    cache = PerspectiveCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.02)
+        return "filtered"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ["filtered"] * 8
+    assert cache.key_locks == {}
+
+
+def test_concurrent_coroutines_compute_once():
+    cache = PerspectiveCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "filtered"
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_compute_async("k", compute) for _ in range(8)])
+
+    assert asyncio.run(run()) == ["filtered"] * 8
+    assert calls == [1]
+    assert cache.async_key_locks == {}
+
+
+def test_failed_compute_releases_its_lock_and_is_retried():
+    cache = PerspectiveCache()
+
+    def fail():
+        raise RuntimeError("model unavailable")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", fail)
+    assert cache.key_locks == {}
+    assert cache.get_or_compute("k", lambda: "filtered") == "filtered"
+
+    async def fail_async():
+        raise RuntimeError("model unavailable")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_compute_async("a", fail_async))
+    assert cache.async_key_locks == {}
+
+
+def test_keys_depend_on_chain_and_config():
+    cache = PerspectiveCache()
+    base = cache.key("story", ("oliver",), "hitom", "gpt-4o", config={"prompt_layout": "default"})
+    assert base == cache.key("story", ["oliver"], "hitom", "gpt-4o", config={"prompt_layout": "default"})
+    assert base != cache.key("story", ("oliver", "aria"), "hitom", "gpt-4o", config={"prompt_layout": "default"})
+    assert base != cache.key("story", ("oliver",), "hitom", "gpt-4o", config={"prompt_layout": "prefix_cache"})
+
+
+def test_persisted_entries_are_reused(tmp_path):
+    path = str(tmp_path / "perspectives.db")
+    PerspectiveCache(path).get_or_compute("k", lambda: "filtered")
+    cache = PerspectiveCache(path)
+    assert cache.get_or_compute("k", lambda: pytest.fail("recomputed")) == "filtered"
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+from llm_utils import AsyncLanguageModel, LanguageModel
+from new_decompose import TheoryOfMindSystem
+from usage_utils import TokenUsage
+
+STORY = "\n".join([
+    "1 Oliver, Aria and Lucas entered the living_room.",
+    "2 The plum is in the blue_pantry.",
+    "3 Oliver exited the living_room.",
+    "4 Aria moved the plum to the blue_crate.",
+    "5 Aria exited the living_room.",
+    "6 Aria privately told Lucas that the plum is in the red_pantry now.",
+])
+QUESTION = "Question: Where does Aria think Oliver thinks the plum is?"
+CHOICES = ["Choices: A. blue_pantry", "B. blue_crate", "C. red_pantry"]
+
+
+def make_system(usage, **kwargs):
+    language_model = LanguageModel("gpt-4o", model_type="mock", usage=usage)
+    async_model = AsyncLanguageModel("gpt-4o", model_type="mock", usage=usage)
+    return TheoryOfMindSystem(mode="hitom", language_model=language_model, async_model=async_model, **kwargs)
+
+
+def stage_calls(usage):
+    return {stage: row["requests"] for stage, row in usage.stats()["stages"].items()}
+
+
+def test_async_pipeline_matches_the_blocking_one():
+    sync_usage, async_usage = TokenUsage(), TokenUsage()
+    expected = make_system(sync_usage).start_task(STORY, QUESTION, CHOICES, "")
+    assert asyncio.run(make_system(async_usage).start_task_async(STORY, QUESTION, CHOICES, "")) == expected
+    assert stage_calls(async_usage) == stage_calls(sync_usage)
+    assert stage_calls(sync_usage)["decide"] > 0
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+pytest.importorskip("openai")
+from llm_utils import LanguageModel
+from new_decompose import TheoryOfMindSystem
+
+STORY = " ".join([
+    "1 Oliver, Aria and Lucas entered the living_room.",
+    "2 The plum is in the blue_pantry.",
+    "3 Oliver exited the living_room.",
+    "4 Aria moved the plum to the blue_crate.",
+    "5 Aria exited the living_room.",
+])
+
+
+class RecordingModel(LanguageModel):
+    """
+    Mock model that records the prompts of the knowledge decisions.
+    """
+    def __init__(self):
+        super().__init__("gpt-4o", model_type="mock")
+        self.decisions = []
+
+    def get_output(self, prompt, retry_count=10, stage=None, response_format=None):
+        if stage == "decide":
+            self.decisions.append(prompt)
+        return super().get_output(prompt, retry_count, stage, response_format)
+
+
+def decision_prompts(layout):
+    model = RecordingModel()
+    system = TheoryOfMindSystem(mode="hitom", language_model=model, rule_based_world=True, prompt_layout=layout)
+    return system.data(STORY, "aria", ""), model.decisions
+
+
+def test_prefix_cache_prompts_share_the_story_prefix():
+    _, prompts = decision_prompts("prefix_cache")
+    assert len(prompts) == 5
+    prefix = os.path.commonprefix(prompts)
+    assert "[5] 5 Aria exited the living_room" in prefix
+    # Everything that differs between statements comes after the shared story.
+    assert all(len(prompt) - len(prefix) < len(prefix) for prompt in prompts)
+
+
+def test_default_prompts_grow_with_the_story():
+    _, prompts = decision_prompts("default")
+    assert len(prompts) == 5
+    assert "Aria exited" not in os.path.commonprefix(prompts)
+
+
+def test_layouts_make_the_same_decisions():
+    assert decision_prompts("prefix_cache")[0] == decision_prompts("default")[0]
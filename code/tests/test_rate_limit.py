@@ -0,0 +1,92 @@
+import types
+
+import pytest
+from rate_limit import RateLimiter, TokenBucket, backoff_delay, retry_after, retry_delay
+
+
+def test_bucket_allows_a_full_minute_up_front():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60, bucket.updated) == 0.0
+    # The next token is one second of refill away.
+    assert bucket.reserve(1, bucket.updated) == pytest.approx(1.0)
+
+
+def test_bucket_refills_over_time_up_to_capacity():
+    bucket = TokenBucket(60)
+    start = bucket.updated
+    bucket.reserve(60, start)
+    bucket.refill(start + 30)
+    assert bucket.tokens == pytest.approx(30)
+    bucket.refill(start + 600)
+    assert bucket.tokens == pytest.approx(60)
+
+
+def test_reservations_queue_behind_each_other():
+    bucket = TokenBucket(60)
+    start = bucket.updated
+    bucket.reserve(60, start)
+    assert bucket.reserve(1, start) == pytest.approx(1.0)
+    assert bucket.reserve(1, start) == pytest.approx(2.0)
+    assert bucket.reserve(1, start + 2) == pytest.approx(1.0)
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(None)
+    assert bucket.reserve(10 ** 9, bucket.updated) == 0.0
+
+
+def test_limiter_waits_for_the_slower_bucket_and_counts_throttling():
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+    assert limiter.reserve(600) == 0.0
+    assert limiter.reserve(60) == pytest.approx(6.0, abs=0.1)
+    assert limiter.throttled == 1
+
+
+def test_settle_returns_overestimated_tokens():
+    limiter = RateLimiter(tokens_per_minute=600)
+    limiter.reserve(600)
+    limiter.settle(600, 100)
+    assert limiter.reserve(500) == 0.0
+
+
+def test_limits_are_read_from_headers():
+    limiter = RateLimiter()
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "120", "x-ratelimit-remaining-requests": "1",
+                                 "x-ratelimit-limit-tokens": "bad"})
+    assert limiter.requests.capacity == 120
+    assert limiter.requests.tokens == 1
+    assert limiter.tokens.capacity is None
+
+
+def error_with_headers(headers):
+    return Exception() if headers is None else types.SimpleNamespace(response=types.SimpleNamespace(headers=headers))
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, None),
+    ({}, None),
+    (None, None),
+])
+def test_retry_after(headers, expected):
+    assert retry_after(error_with_headers(headers)) == expected
+
+
+def test_retry_delay_prefers_the_server_delay():
+    assert retry_delay(error_with_headers({"retry-after": "7"}), attempt=5) == 7.0
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [backoff_delay(3, base=1.0, cap=60.0) for _ in range(200)]
+    assert all(0 <= delay <= 8 for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(backoff_delay(20, cap=5.0) <= 5.0 for _ in range(50))
+
+
+def test_sdk_retries_are_disabled():
+    # Retries go through the limiter; the SDK retrying on its own would bypass it.
+    pytest.importorskip("openai")
+    from llm_utils import get_client
+    assert get_client("key", "http://localhost:8000/v1").max_retries == 0
+    assert get_client("key", "http://localhost:8000/v1", use_async=True).max_retries == 0
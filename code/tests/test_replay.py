@@ -0,0 +1,99 @@
+import json
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+from replay import MOCK_RESPONSE, ReplayClient, ReplayMiss, get_offline_client
+from result_log import ResultWriter
+from structured_outputs import DECISION_FORMAT, conforms
+from stub_server import StubBackend, make_latency, serve
+
+
+@pytest.fixture
+def trace(tmp_path):
+    path = str(tmp_path / "trace.jsonl.gz")
+    with ResultWriter(path) as writer:
+        writer.write({"prompt": "p1", "response": "first"})
+        writer.write({"prompt": "p1", "response": "last"})
+        writer.write({"prompt": "p2", "response": "r2"})
+        writer.write({"usage": {}})
+    return path
+
+
+def test_replay_serves_the_last_recorded_response(trace):
+    client = ReplayClient(trace)
+    assert client.respond("p1") == "last"
+    assert client.respond("p2") == "r2"
+    with pytest.raises(ReplayMiss):
+        client.respond("unrecorded")
+    assert client.stats() == {"entries": 2, "hits": 2, "misses": 1, "hit_rate": pytest.approx(200 / 3)}
+
+
+def test_mock_answers_misses_with_the_default_or_a_valid_structured_output(trace):
+    client = get_offline_client("mock", trace)
+    assert client is get_offline_client("mock", trace)
+    assert client.respond("p2") == "r2"
+    assert client.respond("unrecorded") == MOCK_RESPONSE
+    assert conforms(client.respond("unrecorded", DECISION_FORMAT), DECISION_FORMAT)
+
+
+def test_replay_needs_a_trace():
+    with pytest.raises(ValueError):
+        get_offline_client("replay")
+
+
+def test_usage_is_estimated_from_the_text():
+    usage = ReplayClient().usage("x" * 400, "y" * 40)
+    assert usage == {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}
+
+
+@pytest.mark.parametrize("distribution", ["fixed", "uniform", "exponential", "lognormal"])
+def test_latency_samplers_have_the_requested_mean(distribution):
+    sample = make_latency(distribution, mean=0.2, spread=0.1, rng=random.Random(0))
+    delays = [sample() for _ in range(5000)]
+    assert min(delays) >= 0
+    assert sum(delays) / len(delays) == pytest.approx(0.2, rel=0.1)
+
+
+def test_unknown_latency_distribution_is_rejected():
+    with pytest.raises(ValueError):
+        make_latency("pareto", mean=1.0)
+    assert make_latency("pareto")() == 0.0
+
+
+def test_fault_injection_rates_are_reproducible():
+    backend = StubBackend(error_rate=0.2, rate_limit_rate=0.1, seed=3)
+    faults = [backend.sample_fault() for _ in range(5000)]
+    assert faults.count(429) / len(faults) == pytest.approx(0.1, abs=0.02)
+    assert faults.count(500) / len(faults) == pytest.approx(0.2, abs=0.02)
+    assert backend.errors == faults.count(429) + faults.count(500)
+    replayed = StubBackend(error_rate=0.2, rate_limit_rate=0.1, seed=3)
+    assert faults == [replayed.sample_fault() for _ in range(5000)]
+
+
+def post_chat(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), method="POST", headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_stub_server_answers_and_injects_rate_limits():
+    server = serve(StubBackend(responder=lambda prompt: f"echo {prompt}"), port=0)
+    url = f"http://localhost:{server.server_address[1]}/v1/chat/completions"
+    try:
+        body = {"model": "gpt-4o", "messages": [{"role": "system", "content": "hi"}]}
+        assert post_chat(url, body)["choices"][0]["message"]["content"] == "echo hi"
+        structured = post_chat(url, dict(body, response_format=DECISION_FORMAT))
+        assert conforms(structured["choices"][0]["message"]["content"], DECISION_FORMAT)
+    finally:
+        server.shutdown()
+    server = serve(StubBackend(rate_limit_rate=1.0), port=0)
+    url = f"http://localhost:{server.server_address[1]}/v1/chat/completions"
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_chat(url, body)
+        assert error.value.code == 429
+        assert error.value.headers["retry-after-ms"] == "100"
+    finally:
+        server.shutdown()
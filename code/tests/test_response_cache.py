@@ -0,0 +1,69 @@
+import time
+
+from cache_utils import ResponseCache, request_key
+
+
+def test_request_key_is_order_insensitive_for_dicts():
+    assert request_key("m", {"a": 1, "b": 2}) == request_key("m", {"b": 2, "a": 1})
+    assert request_key("m", "prompt") != request_key("m", "other prompt")
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    assert cache.get("k") is None
+    cache.put("k", "v")
+    cache.put("none", None)
+    assert cache.get("k") == "v"
+    assert cache.get("none") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "nested" / "cache.db")
+    cache = ResponseCache(path)
+    cache.put("k", "v")
+    cache.close()
+    assert ResponseCache(path).get("k") == "v"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put("a", "1")
+    time.sleep(0.01)
+    cache.put("b", "2")
+    time.sleep(0.01)
+    assert cache.get("a") == "1"  # now more recently used than b
+    time.sleep(0.01)
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path, max_age=0.05)
+    cache.put("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    cache.put("old", "v")
+    cache.close()
+    time.sleep(0.1)
+    # Expired entries are also removed when a cache is opened.
+    assert ResponseCache(path, max_age=0.05).stats()["entries"] == 0
+
+
+def test_opening_trims_to_max_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path)
+    for i in range(5):
+        cache.put(str(i), "v")
+        time.sleep(0.005)
+    cache.close()
+    cache = ResponseCache(path, max_entries=3)
+    assert cache.stats()["entries"] == 3
+    assert cache.get("0") is None
+    assert cache.get("4") == "v"
@@ -0,0 +1,45 @@
+import gzip
+import json
+
+import pytest
+from result_log import ResultWriter, iter_records, read_records
+
+
+def test_records_are_written_in_order(tmp_path):
+    path = str(tmp_path / "results" / "log.json")
+    with ResultWriter(path, flush_interval=0.01) as writer:
+        for i in range(100):
+            writer.write({"id": i})
+    assert read_records(path) == [{"id": i} for i in range(100)]
+    assert writer.written == 100
+
+
+def test_writer_appends_to_an_existing_log(tmp_path):
+    path = str(tmp_path / "log.json")
+    with ResultWriter(path) as writer:
+        writer.write({"id": 1})
+    with ResultWriter(path) as writer:
+        writer.write({"id": 2})
+    assert read_records(path) == [{"id": 1}, {"id": 2}]
+
+
+def test_gzip_sink_round_trips(tmp_path):
+    path = str(tmp_path / "trace.jsonl.gz")
+    with ResultWriter(path) as writer:
+        writer.write({"prompt": "p", "output": "o"})
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline()) == {"prompt": "p", "output": "o"}
+    assert list(iter_records(path)) == [{"prompt": "p", "output": "o"}]
+
+
+def test_unserialisable_record_is_dropped_and_reported_on_close(tmp_path):
+    path = str(tmp_path / "log.json")
+    writer = ResultWriter(path)
+    writer.write({"id": 1})
+    writer.write({"id": 2, "answer": object()})
+    writer.write({"id": 3})
+    with pytest.raises(RuntimeError, match="1 record"):
+        writer.close()
+    # The thread kept going: the records around the bad one are in the log.
+    assert read_records(path) == [{"id": 1}, {"id": 3}]
+    assert writer.dropped == 1
@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+from result_log import read_records, write_json_atomic
+
+
+def write_lines(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_partial_last_line_is_dropped_and_truncated(tmp_path):
+    path = str(tmp_path / "log.json")
+    write_lines(path, '{"id": 1}\n{"id": 2}\n{"id": 3, "que')
+    assert read_records(path) == [{"id": 1}, {"id": 2}]
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == '{"id": 1}\n{"id": 2}\n'
+
+
+def test_partial_last_line_is_kept_without_repair(tmp_path):
+    path = str(tmp_path / "log.json")
+    write_lines(path, '{"id": 1}\n{"id": 2')
+    assert read_records(path, repair=False) == [{"id": 1}]
+    assert os.path.getsize(path) == len('{"id": 1}\n{"id": 2')
+
+
+def test_unreadable_and_blank_lines_are_skipped(tmp_path):
+    path = str(tmp_path / "log.json")
+    write_lines(path, '{"id": 1}\n\nnot json\n{"usage": {}}\n')
+    assert read_records(path) == [{"id": 1}, {"usage": {}}]
+
+
+def test_missing_log_has_no_records(tmp_path):
+    assert read_records(str(tmp_path / "missing.json")) == []
+
+
+def test_write_json_atomic_replaces_the_file(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    write_json_atomic(path, {"a": 1})
+    write_json_atomic(path, {"a": 2}, indent=2)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == {"a": 2}
+    assert os.listdir(tmp_path) == ["baseline.json"]
+
+
+def test_resumed_fantom_run_skips_logged_problems(tmp_path, monkeypatch):
+    pytest.importorskip("openai")
+    import evaluate_fantom
+
+    data = str(tmp_path / "fantom.jsonl")
+    with open(data, "w", encoding="utf-8") as f:
+        for i in range(4):
+            f.write(json.dumps({"short_context": f"Anna: Hi {i}.", "full_context": "", "question": f"Question {i}?",
+                                "correct_answer": "yes", "wrong_answer": "no"}) + "\n")
+    work = tmp_path / "code"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    log = str(tmp_path / "log.json")
+
+    def run(num_problems):
+        evaluate_fantom.evaluate_dataset(data, "baseline", num_problems, "short", False, 1, "gpt-4o", "mock", resume=log)
+
+    run(2)
+    # An interrupted write leaves a partial line, which the resumed run drops before appending.
+    with open(log, "a", encoding="utf-8") as f:
+        f.write('{"id": 3, "question"')
+    run(4)
+    ids = [record["id"] for record in read_records(log) if "id" in record]
+    assert ids == [1, 2, 3, 4]
+    assert sum("usage" in record for record in read_records(log)) == 2
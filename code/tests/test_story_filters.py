@@ -0,0 +1,93 @@
+import asyncio
+import zlib
+
+import pytest
+from cache_utils import VisibilityCache
+from decision_rules import DecisionRules
+
+pytest.importorskip("openai")
+from new_decompose import TheoryOfMindSystem
+
+STORY = " ".join([
+    "1 Oliver, Aria and Lucas entered the living_room.",
+    "2 The plum is in the blue_pantry.",
+    "3 Oliver exited the living_room.",
+    "4 Aria moved the plum to the blue_crate.",
+    "5 Aria exited the living_room.",
+    "6 Lucas moved the plum to the red_pantry.",
+    "7 Lucas exited the living_room.",
+    "8 Oliver, Aria and Lucas entered the waiting_room.",
+    "9 Lucas publicly claimed that plum is in the red_pantry now.",
+    "10 Aria privately told Oliver that the plum is in the blue_crate now.",
+    "11 Oliver likes the red_pantry.",
+    "12 Lucas saw a cat.",
+])
+CHAIN = ("lucas", "aria", "oliver")
+
+
+class HashedRules(DecisionRules):
+    """
+    Decides every statement without the model, knowing about two thirds of them per agent.
+    """
+    def classify(self, part, agent, agents=None):
+        return zlib.crc32(f"{agent}|{part}".encode()) % 3 != 0, "hashed"
+
+
+def make_system(**kwargs):
+    kwargs.setdefault("decision_rules", HashedRules())
+    kwargs.setdefault("rule_based_world", True)
+    return TheoryOfMindSystem(mode="hitom", model_type="mock", **kwargs)
+
+
+def nested_filter(chain):
+    system = make_system()
+    story = STORY
+    for agent in chain:
+        story = system.data(story, agent, "")
+    return story
+
+
+def test_single_pass_matches_filtering_level_by_level():
+    for depth in range(1, len(CHAIN) + 1):
+        single_pass = make_system().data_chain(STORY, CHAIN[:depth], "")
+        assert single_pass == nested_filter(CHAIN[:depth])
+    assert 0 < len(single_pass) < len(STORY)
+
+
+def test_single_pass_async_matches_blocking():
+    system = make_system(parallel_decisions=True)
+    assert asyncio.run(system.data_chain_async(STORY, CHAIN, "")) == make_system().data_chain(STORY, CHAIN, "")
+
+
+def test_anded_visibility_rows_match_the_chain_filter():
+    cache = VisibilityCache()
+    for depth in range(1, len(CHAIN) + 1):
+        chain = CHAIN[:depth]
+        assert make_system(visibility_cache=cache).filter_visible(STORY, chain, "", chain) == make_system().data_chain(STORY, chain, "")
+    # One row per agent, each decided once, and one world trajectory for the story.
+    assert cache.stats()["misses"] == len(CHAIN)
+    assert cache.stats()["entries"] == len(CHAIN)
+    assert cache.trajectories.stats()["entries"] == 1
+
+
+def test_visibility_rows_are_shared_across_chains_and_execution_modes():
+    cache = VisibilityCache()
+    rules = HashedRules()
+    system = make_system(visibility_cache=cache, decision_rules=rules)
+    reversed_chain = tuple(reversed(CHAIN))
+    assert asyncio.run(system.filter_visible_async(STORY, reversed_chain, "", reversed_chain)) == make_system().data_chain(STORY, reversed_chain, "")
+    # Any other chain over the same agents is answered from the stored rows.
+    decided = rules.stats()["resolved"]
+    assert decided == 3 * 12
+    assert make_system(visibility_cache=cache, decision_rules=rules).filter_visible(STORY, CHAIN[:2], "", CHAIN[:2]) == make_system().data_chain(STORY, CHAIN[:2], "")
+    assert rules.stats()["resolved"] == decided
+    assert cache.stats()["hits"] == 2
+
+
+@pytest.mark.parametrize("rule_based_world", [True, False])
+def test_parallel_decisions_match_sequential_ones(rule_based_world):
+    for agent in CHAIN:
+        expected = make_system(rule_based_world=rule_based_world).data(STORY, agent, "")
+        system = make_system(rule_based_world=rule_based_world, parallel_decisions=True, decision_workers=4)
+        assert system.data(STORY, agent, "") == expected
+        assert asyncio.run(system.data_async(STORY, agent, "")) == expected
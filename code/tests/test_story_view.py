@@ -0,0 +1,31 @@
+import pytest
+from story_view import ELIDED, StoryView
+
+PARTS = ["Mia entered the kitchen.", "Owen entered the kitchen.", "Mia exited the kitchen.", "Owen moved the onion."]
+
+
+def test_slices_match_the_joined_prefixes():
+    view = StoryView(PARTS, "\n")
+    assert len(view) == len(PARTS)
+    for index in range(len(PARTS)):
+        assert view[index] == "".join("\n" + part for part in PARTS[:index])
+
+
+def test_window_keeps_the_last_statements_and_marks_the_rest():
+    view = StoryView(PARTS, " ", window=2)
+    assert view[0] == ""
+    assert view[2] == " " + PARTS[0] + " " + PARTS[1]
+    assert view[3] == ELIDED.format(count=1) + " " + PARTS[1] + " " + PARTS[2]
+
+
+@pytest.mark.parametrize("window", [0, 1, 10])
+def test_window_sizes(window):
+    view = StoryView(PARTS, "\n", window=window)
+    prefix = view[3]
+    kept = min(window, 3)
+    assert prefix.endswith("".join("\n" + part for part in PARTS[3 - kept:3]))
+    assert prefix.startswith(ELIDED.format(count=3 - kept)) == (kept < 3)
+
+
+def test_empty_story():
+    assert len(StoryView([], "\n")) == 0
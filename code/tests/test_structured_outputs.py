@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from structured_outputs import DECISION_FORMAT, choice_format, conforms, mock_response, parse_field
+
+
+@pytest.mark.parametrize("output, expected", [
+    ('{"reasoning": "saw it", "answer": "yes"}', "yes"),
+    ('{"reasoning": "", "answer": "maybe"}', None),
+    ('{"reasoning": "", "answer": true}', None),
+    ('{"reasoning": "no answer"}', None),
+    ("Answer: yes", None),
+    ('["yes"]', None),
+    (None, None),
+])
+def test_parse_field(output, expected):
+    assert parse_field(output, "answer", ["yes", "no"]) == expected
+
+
+def test_parse_field_without_allowed_values():
+    assert parse_field('{"reasoning": "anything"}', "reasoning", None) == "anything"
+
+
+def test_schema_fields_are_required_in_order():
+    schema = choice_format(["A: red_box", "B: green_box"])["json_schema"]
+    assert schema["strict"] is True
+    assert schema["schema"]["required"] == ["reasoning", "choice"]
+    assert schema["schema"]["properties"]["choice"]["enum"] == ["A: red_box", "B: green_box"]
+
+
+def test_mock_response_conforms():
+    for response_format in (DECISION_FORMAT, choice_format(["a", "b"])):
+        assert conforms(mock_response(response_format), response_format)
+    assert json.loads(mock_response(DECISION_FORMAT)) == {"reasoning": "", "answer": "yes"}
+    assert not conforms('{"reasoning": "", "choice": "c"}', choice_format(["a", "b"]))
+
+
+class ScriptedModel:
+    """
+    Language model that answers each stage with a fixed output, recording the stages it was asked for.
+    """
+    model_name = "gpt-4o"
+    model_type = "mock"
+    temperature = 0.0
+    cache = None
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.stages = []
+
+    def get_output(self, prompt, retry_count=10, stage=None, response_format=None):
+        self.stages.append(stage)
+        return self.outputs[stage]
+
+
+def make_system(outputs):
+    pytest.importorskip("openai")
+    from new_decompose import TheoryOfMindSystem
+    model = ScriptedModel(outputs)
+    return TheoryOfMindSystem(mode="hitom", language_model=model, structured_outputs=True), model
+
+
+CHOICES = ["Choices: A. red_box", "B. green_box"]
+
+
+def test_structured_answer_needs_no_follow_up():
+    system, model = make_system({"answer": '{"reasoning": "", "choice": "B: green_box"}'})
+    assert system.answer("story", "oliver", "", "Where is the plum?", CHOICES, "") == "b: green_box"
+    assert model.stages == ["answer"]
+
+
+def test_unstructured_answer_falls_back_to_extraction():
+    system, model = make_system({"answer": "The plum is in the green_box.", "extract_choice": "B: green_box."})
+    assert system.answer("story", "oliver", "", "Where is the plum?", CHOICES, "") == "b: green_box"
+    assert model.stages == ["answer", "extract_choice"]
+
+
+@pytest.mark.parametrize("decision, stages, known", [
+    ('{"reasoning": "", "answer": "no"}', ["decide"], False),
+    ("Oliver was there. Answer: yes", ["decide"], True),
+    ("Oliver was probably there.", ["decide", "decide_yes_no"], False),
+])
+def test_decisions_fall_back_to_text_parsing_and_follow_ups(decision, stages, known):
+    system, model = make_system({"decide": decision, "decide_yes_no": "no"})
+    assert system.decide_knowledge("story", "Oliver exited the kitchen", "oliver", "kitchen: [Oliver]", "", 1) == known
+    assert model.stages == stages
@@ -0,0 +1,90 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+from result_log import ResultWriter
+from tracing import Tracer, annotate, critical_path, detach, in_current_context, load_trees
+
+
+class Spans:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+    def named(self, name):
+        return next(record for record in self.records if record["name"] == name)
+
+
+def test_spans_nest_and_collect_annotations():
+    spans = Spans()
+    tracer = Tracer(spans)
+    with tracer.span("task", question="q") as task:
+        with tracer.span("decide", agent="oliver"):
+            annotate(prompt_tokens=12)
+        annotate(cache_hit=True)
+    annotate(ignored=True)
+    decide, task_record = spans.named("decide"), spans.named("task")
+    assert decide["parentSpanId"] == task.span_id == task_record["spanId"]
+    assert decide["traceId"] == task_record["traceId"]
+    assert task_record["parentSpanId"] is None
+    assert decide["attributes"] == {"agent": "oliver", "prompt_tokens": 12}
+    assert task_record["attributes"] == {"question": "q", "cache_hit": True}
+    assert task_record["startTimeUnixNano"] <= decide["startTimeUnixNano"] <= decide["endTimeUnixNano"] <= task_record["endTimeUnixNano"]
+
+
+def test_failed_span_records_the_error():
+    spans = Spans()
+    with pytest.raises(ValueError):
+        with Tracer(spans).span("answer"):
+            raise ValueError("unparsable")
+    assert spans.records[0]["status"] == {"code": "ERROR", "message": "ValueError('unparsable')"}
+
+
+def test_spans_nest_across_tasks_and_thread_pools():
+    spans = Spans()
+    tracer = Tracer(spans)
+
+    def work(name):
+        with tracer.span(name):
+            pass
+
+    async def child(name):
+        await asyncio.sleep(0)
+        work(name)
+
+    async def detached():
+        detach()
+        work("flush")
+
+    async def run():
+        with tracer.span("problem"):
+            await asyncio.gather(child("a"), child("b"))
+            await asyncio.create_task(detached())
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(in_current_context(work), ["c", "d"]))
+
+    asyncio.run(run())
+    problem = spans.named("problem")["spanId"]
+    assert [spans.named(name)["parentSpanId"] for name in "abcd"] == [problem] * 4
+    assert spans.named("flush")["parentSpanId"] is None
+
+
+def span(span_id, parent, start, end):
+    return {"spanId": span_id, "parentSpanId": parent, "name": span_id, "attributes": {},
+            "startTimeUnixNano": int(start * 1e9), "endTimeUnixNano": int(end * 1e9)}
+
+
+def test_critical_path_follows_the_chain_that_finished_last(tmp_path):
+    path = str(tmp_path / "spans.jsonl")
+    with ResultWriter(path) as writer:
+        for record in [span("root", None, 0, 10), span("a", "root", 0, 4), span("b", "root", 1, 3),
+                       span("c", "root", 4, 9), span("c1", "c", 4, 6)]:
+            writer.write(record)
+    roots, children = load_trees(path)
+    assert [root["spanId"] for root in roots] == ["root"]
+    steps = critical_path(roots[0], children)
+    # b ran alongside the longer a, so it is not on the critical path.
+    assert [(depth, record["spanId"]) for depth, record, _ in steps] == [(0, "root"), (1, "a"), (1, "c"), (2, "c1")]
+    assert [self_s for _, _, self_s in steps] == pytest.approx([1.0, 4.0, 3.0, 2.0])
@@ -0,0 +1,69 @@
+import types
+
+import pytest
+from usage_utils import BATCH_DISCOUNT, LatencyHistogram, TokenUsage, format_usage, model_price
+
+
+def test_dated_snapshots_use_the_longest_matching_family_price():
+    assert model_price("gpt-4o-2024-08-06") == model_price("gpt-4o")
+    assert model_price("gpt-4o-mini-2024-07-18") == model_price("gpt-4o-mini") != model_price("gpt-4o")
+    assert model_price("llama-3-70b") is None
+    assert model_price(None) is None
+
+
+def usage(prompt, completion, cached=0):
+    return types.SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion,
+                                 prompt_tokens_details=types.SimpleNamespace(cached_tokens=cached))
+
+
+def test_usage_is_counted_per_stage_and_model():
+    tokens = TokenUsage()
+    tokens.record(usage(100, 10, cached=40), stage="decide", seconds=0.2, model="gpt-4o")
+    tokens.record({"prompt_tokens": 50, "completion_tokens": 5}, stage="answer", model="gpt-4o", batch=True)
+    tokens.record(usage(10, 1), model="gpt-4o")
+    tokens.record(None, stage="decide")
+    stats = tokens.stats()
+    assert (stats["requests"], stats["prompt_tokens"], stats["cached_tokens"], stats["completion_tokens"]) == (3, 160, 40, 16)
+    assert sorted(stats["stages"]) == ["answer", "decide", "other"]
+    assert stats["stages"]["decide"]["cached_rate"] == 40
+    assert stats["models"]["gpt-4o"]["requests"] == 2
+    assert stats["models"]["gpt-4o (batch)"]["requests"] == 1
+
+
+def test_cost_uses_cached_price_and_batch_discount():
+    prompt, cached, completion = model_price("gpt-4o")
+    tokens = TokenUsage()
+    tokens.record(usage(1_000_000, 1_000_000, cached=400_000), model="gpt-4o")
+    tokens.record({"prompt_tokens": 1_000_000, "completion_tokens": 0}, model="gpt-4o", batch=True)
+    assert tokens.cost() == pytest.approx(0.6 * prompt + 0.4 * cached + completion + BATCH_DISCOUNT * prompt)
+
+
+def test_unpriced_and_unbilled_requests_have_no_cost():
+    tokens = TokenUsage()
+    tokens.record(usage(1000, 10), model="llama-3-70b")
+    tokens.record(usage(1000, 10), model="gpt-4o", billed=False)
+    assert tokens.cost() is None
+    assert "Estimated cost" not in format_usage(tokens.stats())
+    tokens.record(usage(1000, 10), model="gpt-4o")
+    assert tokens.cost() > 0
+    assert "Estimated cost" in format_usage(tokens.stats())
+
+
+def test_follow_up_calls_per_parsed_stage():
+    tokens = TokenUsage()
+    for stage in ["decide"] * 4 + ["decide_yes_no", "decide_ambiguous", "answer"]:
+        tokens.record(usage(1, 1), stage=stage)
+    follow_ups = tokens.stats()["follow_ups"]
+    assert follow_ups["decide"] == {"requests": 4, "follow_ups": 2, "follow_up_rate": 50.0}
+    assert follow_ups["answer"]["follow_ups"] == 0
+
+
+def test_latency_percentiles_are_bucket_upper_bounds():
+    histogram = LatencyHistogram(bounds=(0.1, 1.0))
+    for seconds in [0.05] * 10 + [0.5] * 9 + [5.0]:
+        histogram.record(seconds)
+    assert histogram.percentile(50) == 0.1
+    assert histogram.percentile(95) == 1.0
+    assert histogram.percentile(100) == 5.0
+    assert histogram.stats()["buckets"] == {"<=0.1s": 10, "<=1.0s": 9, ">1.0s": 1}
+    assert LatencyHistogram().percentile(50) == 0.0
@@ -0,0 +1,114 @@
+import pytest
+from world_tracker import CHECKPOINT_INTERVAL, PLACEHOLDER, ConversationState, WorldState, WorldTrajectory
+
+
+def test_render_and_parse_round_trip():
+    state = WorldState(["garden", "kitchen"], {"Mia": "garden", "Owen": "kitchen", "Ava": "garden"})
+    world = state.render()
+    assert world == "garden: [Mia, Ava], kitchen: [Owen], Unknown: []"
+    assert WorldState.parse(world).render() == world
+
+
+def test_setup_world_shows_placeholders():
+    assert WorldState(["garden"]).render() == f"garden: [{PLACEHOLDER}], Unknown: [{PLACEHOLDER}]"
+
+
+def test_conversation_world_has_no_unknown_location():
+    state = ConversationState(["in_conversation", "out_of_conversation"], {"Alice": "in_conversation"})
+    world = state.render()
+    assert world == f"in_conversation: [Alice], out_of_conversation: [{PLACEHOLDER}]"
+    assert ConversationState.parse(world).render() == world
+
+
+def test_clean_update_is_not_repaired():
+    before = WorldState(["garden", "kitchen"], {"Mia": "garden", "Owen": "garden"})
+    after, repaired = before.repaired("garden: [Owen], kitchen: [Mia], Unknown: []")
+    assert not repaired
+    assert after.locations == {"Mia": "kitchen", "Owen": "garden"}
+
+
+def test_missing_agent_stays_in_place():
+    before = WorldState(["garden", "kitchen"], {"Mia": "garden", "Owen": "garden"})
+    after, repaired = before.repaired("garden: [], kitchen: [Mia], Unknown: []")
+    assert repaired
+    assert after.locations == {"Mia": "kitchen", "Owen": "garden"}
+
+
+def test_duplicated_agent_takes_the_move():
+    before = WorldState(["garden", "kitchen"], {"Mia": "garden"})
+    after, repaired = before.repaired("garden: [Mia], kitchen: [Mia], Unknown: []")
+    assert repaired
+    assert after.locations == {"Mia": "kitchen"}
+
+
+def test_output_without_entries_keeps_the_state():
+    before = WorldState(["garden"], {"Mia": "garden"})
+    after, repaired = before.repaired("The world does not change.")
+    assert repaired
+    assert after.render() == before.render()
+    assert after is not before
+
+
+def test_agent_names_with_separators_are_dropped():
+    before = WorldState(["garden"], {"Mia": "garden"})
+    after, repaired = before.repaired("garden: [Mia, Owen: left], Unknown: []")
+    assert repaired
+    assert after.locations == {"Mia": "garden"}
+
+
+def test_entries_without_a_location_are_dropped():
+    before = WorldState(["kitchen"], {"A": "kitchen", "B": "kitchen"})
+    after, repaired = before.repaired("kitchen: [A], : [B]")
+    assert repaired
+    assert after.rooms == ["kitchen"]
+    assert after.locations == {"A": "kitchen", "B": "kitchen"}
+
+
+@pytest.mark.parametrize("name", ["kitchen: left", "red,box", "[garden]", ""])
+def test_names_that_break_the_format_are_rejected(name):
+    with pytest.raises(ValueError):
+        WorldState([name])
+    with pytest.raises(ValueError):
+        WorldState(["garden"]).move(name or "", "garden")
+
+
+def test_clean_name():
+    assert WorldState.clean_name("Locations: kitchen") == "Locations kitchen"
+    assert WorldState.clean_name("[garden]") == "garden"
+
+
+def test_diff_and_apply_diff():
+    before = WorldState(["garden"], {"Mia": "garden", "Owen": "garden"})
+    after = WorldState(["garden", "kitchen"], {"Mia": "kitchen", "Owen": "garden"})
+    diff = before.diff(after)
+    assert diff == (("kitchen",), (("Mia", "kitchen"),))
+    state = before.copy()
+    state.apply_diff(diff)
+    assert state.render() == after.render()
+
+
+def test_trajectory_reconstructs_every_state_past_checkpoints():
+    rooms = ["garden", "kitchen", "hall"]
+    state = WorldState(rooms, {"Mia": "garden", "Owen": "garden"})
+    trajectory, expected = WorldTrajectory(), []
+    for i in range(3 * CHECKPOINT_INTERVAL + 5):
+        trajectory.record(state)
+        expected.append(state.render())
+        if i % 3 == 0:
+            state = state.copy()
+            state.move("Mia", rooms[i % len(rooms)])
+        if i % 7 == 0:
+            state = state.copy()
+            state.move(f"Agent{i}", rooms[(i + 1) % len(rooms)])
+    assert len(trajectory) == len(expected)
+    assert len(trajectory.checkpoints) == 4
+    assert [trajectory[i] for i in range(len(trajectory))] == expected
+
+
+def test_trajectory_records_unchanged_statements_as_empty_diffs():
+    state = WorldState(["garden"], {"Mia": "garden"})
+    trajectory = WorldTrajectory()
+    for _ in range(3):
+        trajectory.record(state)
+    assert trajectory.changes() == 0
+    assert trajectory.diffs[1:] == [((), ()), ((), ())]
@@ -0,0 +1,63 @@
+from world_tracker import UNKNOWN, HitomWorldTracker
+
+
+def track(sentences):
+    tracker = HitomWorldTracker()
+    understood = [tracker.apply(sentence) for sentence in sentences]
+    return tracker, understood
+
+
+def test_enter_places_every_listed_agent():
+    tracker, understood = track(["Mia, Owen and Ava entered the garden."])
+    assert understood == [True]
+    assert tracker.locations == {"Mia": "garden", "Owen": "garden", "Ava": "garden"}
+    assert tracker.rooms == ["garden"]
+
+
+def test_exit_moves_agent_to_unknown():
+    tracker, _ = track(["Mia and Owen entered the garden.", "Mia exited the garden."])
+    assert tracker.locations == {"Mia": UNKNOWN, "Owen": "garden"}
+    assert tracker.render() == "garden: [Owen], Unknown: [Mia]"
+
+
+def test_reentering_moves_agent():
+    tracker, _ = track(["Mia entered the garden.", "Mia exited the garden.", "Mia entered the kitchen."])
+    assert tracker.locations == {"Mia": "kitchen"}
+    assert tracker.rooms == ["garden", "kitchen"]
+
+
+def test_static_templates_leave_locations_unchanged():
+    static = [
+        "The onion is in the red_box.",
+        "Mia moved the onion to the blue_box.",
+        "Mia made no movements and stayed in the garden for 1 minute.",
+        "Owen likes the blue_box.",
+        "Ava saw a cat.",
+        "Ava lost her watch.",
+        "Mia privately told Owen that the onion is in the red_box now.",
+        "Owen publicly claimed that onion is in the blue_box now.",
+    ]
+    tracker, understood = track(["Mia and Owen entered the garden."] + static)
+    assert all(understood)
+    assert all(tracker.matches(sentence) for sentence in static)
+    assert tracker.locations == {"Mia": "garden", "Owen": "garden"}
+
+
+def test_numbered_sentences_are_understood():
+    tracker, understood = track(["1 Mia entered the garden.", "2 Mia exited the garden."])
+    assert understood == [True, True]
+    assert tracker.locations == {"Mia": UNKNOWN}
+
+
+def test_unknown_sentence_is_reported():
+    tracker, understood = track(["Mia entered the garden.", "Mia climbed onto the roof."])
+    assert understood == [True, False]
+    assert not tracker.matches("Mia climbed onto the roof.")
+    assert tracker.locations == {"Mia": "garden"}
+
+
+def test_load_replaces_locations_from_an_update():
+    tracker, _ = track(["Mia and Owen entered the garden."])
+    repaired = tracker.load("garden: [Owen], kitchen: [Mia], Unknown: []")
+    assert not repaired
+    assert tracker.locations == {"Mia": "kitchen", "Owen": "garden"}
@@ -0,0 +1,193 @@
+import argparse
+import collections
+import contextlib
+import contextvars
+import hashlib
+import os
+import time
+from result_log import iter_records
+
+# Span of the code currently running, per thread and per asyncio task.
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed step of a problem, nested under the span that was current when it started.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_record(self) -> dict:
+        """
+        :return: The span in the field layout of OTLP/JSON spans (attributes as a plain mapping).
+        """
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+class Tracer:
+    """
+    Records nested spans and hands each finished span to an exporter.
+
+    The exporter is anything with a write(record) method, normally a ResultWriter, so spans
+    are written by a single background thread as JSON lines (gzip/zstd for .gz/.zst paths).
+    Spans nest through a context variable: across awaits, asyncio tasks created inside a span
+    and (with in_current_context) thread pool workers.
+    """
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self.exporter.write(span.to_record())
+
+
+def annotate(**attributes) -> None:
+    """
+    Add attributes to the current span, if any (e.g. token counts from the model layer).
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def detach() -> None:
+    """
+    Stop attributing work in the current thread or task to the span it inherited.
+
+    Used by shared background tasks (such as a wave flusher) that are started from inside one
+    problem's span but work for many problems.
+    """
+    _current_span.set(None)
+
+
+def in_current_context(fn):
+    """
+    Wrap fn so thread pool workers run it under the caller's current span.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+# ---------------------- Span-Tree Profiler ----------------------
+
+def duration_s(span: dict) -> float:
+    return (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e9
+
+
+def load_trees(path: str):
+    """
+    :param path: Span file written by a Tracer.
+    :return: (root spans, mapping of span id to its children sorted by start time).
+    """
+    roots, children = [], collections.defaultdict(list)
+    for span in iter_records(path):
+        if span.get("parentSpanId"):
+            children[span["parentSpanId"]].append(span)
+        else:
+            roots.append(span)
+    for spans in children.values():
+        spans.sort(key=lambda span: span["startTimeUnixNano"])
+    return roots, children
+
+
+def critical_path(span: dict, children: dict, depth: int = 0) -> list:
+    """
+    Walk back from the end of a span: the child that finished last, then the child that finished
+    last before that one started, and so on, recursing into each. Children running alongside a
+    longer sibling drop out, so for a sequential problem this is every step and for a concurrent
+    one the chain of steps that determined when it could finish.
+
+    :return: (depth, span, self seconds) for the spans on the critical path in start order, where
+             self seconds is the part of the span not covered by its critical children.
+    """
+    chain, cursor = [], span["endTimeUnixNano"]
+    for child in sorted(children.get(span["spanId"], []), key=lambda child: child["endTimeUnixNano"], reverse=True):
+        if child["endTimeUnixNano"] <= cursor:
+            chain.append(child)
+            cursor = child["startTimeUnixNano"]
+    chain.reverse()
+    path = [(depth, span, duration_s(span) - sum(duration_s(child) for child in chain))]
+    for child in chain:
+        path.extend(critical_path(child, children, depth + 1))
+    return path
+
+
+def describe(span: dict) -> str:
+    shown = {key: value for key, value in span["attributes"].items() if key not in ["prompt_hash", "question"]}
+    return f"{span['name']}({', '.join(f'{key}={value}' for key, value in shown.items())})"
+
+
+def profile(path: str, top: int = 5, max_lines: int = 40) -> None:
+    """
+    Print where critical-path time goes by span name, and the slowest problems with their critical paths.
+
+    :param max_lines: Spans of each problem's critical path to print.
+    """
+    roots, children = load_trees(path)
+    if not roots:
+        print(f"No spans in {path}")
+        return
+    on_path = collections.Counter()
+    for root in roots:
+        for _, span, seconds in critical_path(root, children):
+            on_path[span["name"]] += seconds
+    total = sum(duration_s(root) for root in roots)
+    print(f"{len(roots)} problems, {total:.2f}s in total")
+    print("\nCritical-path time by step:")
+    for name, seconds in on_path.most_common():
+        print(f"  {name:20} {seconds:10.2f}s {seconds / total * 100 if total else 0:6.1f}%")
+    print(f"\nSlowest {min(top, len(roots))} problems:")
+    for root in sorted(roots, key=duration_s, reverse=True)[:top]:
+        calls = [span for spans in children.values() for span in spans if span["traceId"] == root["traceId"] and span["name"] == "get_response"]
+        busy = sum(duration_s(span) for span in calls)
+        print(f"\n{duration_s(root):.2f}s, {len(calls)} calls, {busy / duration_s(root) if duration_s(root) else 0:.1f} calls in flight on average: {root['attributes'].get('question', '')}")
+        for depth, span, _ in critical_path(root, children)[:max_lines]:
+            print(f"  {'  ' * depth}{duration_s(span):8.3f}s  {describe(span)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Critical-path profile of a span file written with --spans.")
+    parser.add_argument("path", type=str, help="Span file (JSON lines, optionally .gz/.zst).")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest problems to show.")
+    parser.add_argument("--max_lines", type=int, default=40, help="Critical-path spans to print per problem.")
+    args = parser.parse_args()
+    profile(args.path, args.top, args.max_lines)
+
+if __name__ == "__main__":
+    main()
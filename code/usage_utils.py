@@ -0,0 +1,225 @@
+import threading
+from tracing import annotate
+
+# Upper bounds (seconds) of the latency histogram buckets; slower requests go to an overflow bucket.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# USD per million tokens: (prompt, cached prompt, completion). Models are matched by the longest
+# prefix of their name, so dated snapshots (e.g. gpt-4o-2024-08-06) use their family's price.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "o3-mini": (1.10, 0.55, 4.40),
+}
+# The Batch API bills half the chat completions price.
+BATCH_DISCOUNT = 0.5
+
+# Stages whose output is parsed, and the follow-up stages that re-ask the model when parsing fails.
+FOLLOW_UP_STAGES = {
+    "decide": ("decide_yes_no", "decide_ambiguous"),
+    "answer": ("extract_choice",),
+}
+
+
+def usage_field(usage, name: str):
+    """
+    Read a field from a usage record, which is an SDK object or (in batch results) a plain dict.
+    """
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get(name)
+    return getattr(usage, name, None)
+
+
+def model_price(model_name: str | None):
+    """
+    :return: (prompt, cached prompt, completion) USD per million tokens, or None for unpriced (e.g. local) models.
+    """
+    if not model_name:
+        return None
+    matches = [name for name in MODEL_PRICES if model_name.startswith(name)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+class LatencyHistogram:
+    """
+    Request latencies counted in fixed buckets, so memory stays constant however long the run.
+    """
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        index = next((i for i, bound in enumerate(self.bounds) if seconds <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """
+        :param q: Percentile between 0 and 100.
+        :return: Upper bound of the bucket holding the percentile (the maximum for the overflow bucket).
+        """
+        if self.total == 0:
+            return 0.0
+        rank = q / 100 * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def stats(self) -> dict:
+        labels = [f"<={bound}s" for bound in self.bounds] + [f">{self.bounds[-1]}s"]
+        return {
+            "count": self.total,
+            "mean_s": (self.sum / self.total) if self.total else 0,
+            "p50_s": self.percentile(50),
+            "p95_s": self.percentile(95),
+            "max_s": self.max,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class UsageCounter:
+    """
+    Token, request and latency totals of one slice of a run (a stage, a model or the whole run).
+    """
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latency = LatencyHistogram()
+
+    def add(self, prompt_tokens: int, cached_tokens: int, completion_tokens: int, seconds: float | None) -> None:
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += completion_tokens
+        if seconds is not None:
+            self.latency.record(seconds)
+
+    def cost(self, price) -> float:
+        prompt, cached, completion = price
+        return ((self.prompt_tokens - self.cached_tokens) * prompt + self.cached_tokens * cached + self.completion_tokens * completion) / 1e6
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_rate": (self.cached_tokens / self.prompt_tokens * 100) if self.prompt_tokens > 0 else 0,
+            "latency": self.latency.stats(),
+        }
+
+
+class TokenUsage:
+    """
+    Thread-safe counters of the tokens reported in the `usage` field of chat completions.
+
+    Share one instance between the models of a run to get totals for the whole run. Every
+    request is also counted under the pipeline stage that issued it (e.g. "decide", "answer",
+    "simtom_perspective") and under its model, with a latency histogram per slice, so usage
+    and cost can be attributed. Cached tokens are the prompt tokens served from the provider's
+    (or local server's) prompt cache, as reported in usage.prompt_tokens_details.cached_tokens.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = UsageCounter()
+        self.stages = {}
+        self.models = {}
+        # The same slices, counting only billed requests (local and offline backends cost nothing).
+        self.billed = {}
+
+    def record(self, usage, stage: str | None = None, seconds: float | None = None, model: str | None = None, batch: bool = False, billed: bool = True) -> None:
+        """
+        :param usage: The `usage` of a chat completion response (ignored if None).
+        :param stage: Pipeline stage that issued the request ("other" if not given).
+        :param seconds: Latency of the request, if measured.
+        :param model: Model that served the request, for per-model counts and cost.
+        :param batch: The request went through the Batch API (billed at BATCH_DISCOUNT).
+        :param billed: False for requests served by a local server or an offline backend (replay, mock),
+                       which are left out of the cost even if the model name has a price.
+        """
+        if usage is None:
+            return
+        prompt_tokens = usage_field(usage, "prompt_tokens") or 0
+        cached_tokens = usage_field(usage_field(usage, "prompt_tokens_details"), "cached_tokens") or 0
+        completion_tokens = usage_field(usage, "completion_tokens") or 0
+        annotate(prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, completion_tokens=completion_tokens)
+        with self.lock:
+            stage_counter = self.stages.setdefault(stage or "other", UsageCounter())
+            model_counter = self.models.setdefault((model, batch), UsageCounter())
+            counters = [self.total, stage_counter, model_counter]
+            if billed:
+                counters.append(self.billed.setdefault((model, batch), UsageCounter()))
+            for counter in counters:
+                counter.add(prompt_tokens, cached_tokens, completion_tokens, seconds)
+
+    def cost(self) -> float | None:
+        """
+        :return: Estimated USD cost of the billed requests to priced models, or None if there are none.
+        """
+        with self.lock:
+            total = None
+            for (model, batch), counter in self.billed.items():
+                price = model_price(model)
+                if price is None:
+                    continue
+                total = (total or 0.0) + counter.cost(price) * (BATCH_DISCOUNT if batch else 1)
+            return total
+
+    def stats(self) -> dict:
+        cost = self.cost()
+        with self.lock:
+            stats = self.total.stats()
+            stats["cost_usd"] = cost
+            stats["stages"] = {stage: counter.stats() for stage, counter in sorted(self.stages.items())}
+            stats["models"] = {f"{model}{' (batch)' if batch else ''}": counter.stats() for (model, batch), counter in self.models.items()}
+            stats["follow_ups"] = follow_ups(stats["stages"])
+            return stats
+
+
+def follow_ups(stages: dict) -> dict:
+    """
+    :param stages: Per-stage stats of TokenUsage.stats().
+    :return: For each parsed stage that issued requests, its requests, the follow-up requests they needed
+             and the follow-ups per request in percent (0 when every output parsed, as with structured outputs).
+    """
+    rows = {}
+    for stage, follow_up_stages in FOLLOW_UP_STAGES.items():
+        requests = stages.get(stage, {}).get("requests", 0)
+        if not requests:
+            continue
+        extra = sum(stages.get(name, {}).get("requests", 0) for name in follow_up_stages)
+        rows[stage] = {"requests": requests, "follow_ups": extra, "follow_up_rate": extra / requests * 100}
+    return rows
+
+
+def format_usage(stats: dict) -> str:
+    """
+    Render TokenUsage.stats() as the end-of-run usage report.
+    """
+    lines = [f"Tokens: {stats['prompt_tokens']} prompt ({stats['cached_rate']:.2f}% cached), {stats['completion_tokens']} completion over {stats['requests']} requests"]
+    if stats.get("cost_usd") is not None:
+        lines.append(f"Estimated cost: ${stats['cost_usd']:.4f}")
+    lines.append(f"{'Stage':22} {'requests':>9} {'prompt':>10} {'cached':>10} {'completion':>11} {'p50 s':>7} {'p95 s':>7}")
+    for stage, row in stats.get("stages", {}).items():
+        latency = row["latency"]
+        # Batch API requests have no per-request latency.
+        p50, p95 = (f"{latency['p50_s']:.2f}", f"{latency['p95_s']:.2f}") if latency["count"] else ("-", "-")
+        lines.append(f"{stage:22} {row['requests']:>9} {row['prompt_tokens']:>10} {row['cached_tokens']:>10} {row['completion_tokens']:>11} {p50:>7} {p95:>7}")
+    if stats.get("follow_ups"):
+        lines.append("Follow-up calls: " + ", ".join(f"{stage} {row['follow_ups']} for {row['requests']} requests ({row['follow_up_rate']:.2f}%)" for stage, row in stats["follow_ups"].items()))
+    return "\n".join(lines)
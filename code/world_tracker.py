@@ -0,0 +1,271 @@
+import re
+
+NAME = r"[A-Z][\w]*"
+PREFIX = r"^(?:\d+ )?"
+SUFFIX = r"\.?$"
+
+# Templates that move agents between locations.
+ENTER_PATTERN = re.compile(PREFIX + rf"(?P<agents>{NAME}(?:, {NAME})*(?: and {NAME})?) entered the (?P<location>[\w]+)" + SUFFIX)
+EXIT_PATTERN = re.compile(PREFIX + rf"(?P<agent>{NAME}) exited the (?P<location>[\w]+)" + SUFFIX)
+
+# Templates that never change where agents are.
+STATIC_PATTERNS = [
+    re.compile(PREFIX + r"The [\w]+ is in the [\w]+" + SUFFIX),
+    re.compile(PREFIX + rf"{NAME} moved the [\w]+ to the [\w]+" + SUFFIX),
+    re.compile(PREFIX + rf"{NAME} made no movements and stayed in the [\w]+ for \d+ minutes?" + SUFFIX),
+    re.compile(PREFIX + rf"{NAME} (?:likes|dislikes) the [\w]+" + SUFFIX),
+    re.compile(PREFIX + rf"{NAME} saw an? [\w]+" + SUFFIX),
+    re.compile(PREFIX + rf"{NAME} lost (?:his|her|their) [\w]+" + SUFFIX),
+    re.compile(PREFIX + rf"{NAME} privately told {NAME} that the [\w]+ is in the [\w]+ now" + SUFFIX),
+    re.compile(PREFIX + rf"{NAME} publicly claimed that (?:the )?[\w]+ is in the [\w]+ now" + SUFFIX),
+]
+
+WORLD_ENTRY_PATTERN = re.compile(r"([^,:\[\]]+?)\s*:\s*\[([^\]]*)\]")
+# Characters that delimit the prompt format, so they cannot appear in location or agent names.
+SEPARATORS = re.compile(r"[,:\[\]]")
+UNKNOWN = "Unknown"
+# Shown for empty locations while no agent has been placed yet, as in the world set up from a story.
+PLACEHOLDER = "insert agents"
+# Every CHECKPOINT_INTERVAL statements a trajectory keeps a full copy of the state, so rendering
+# the world before any statement replays at most that many diffs.
+CHECKPOINT_INTERVAL = 32
+
+
+class WorldState:
+    """
+    Where each agent is: an ordered list of locations and a mapping of agent -> location.
+
+    Renders to the prompt format "Location 1: [Agent 1, Agent 2], ..., Unknown: [...]" and parses
+    LLM updates in that format back, repairing them against the previous state (see repaired).
+    Names must not contain the format's separators (see clean_name).
+    """
+    __slots__ = ("rooms", "locations")
+    # Whether the Unknown location is always rendered, or only while an agent is in it.
+    SHOW_UNKNOWN = True
+
+    def __init__(self, rooms=(), locations: dict | None = None):
+        self.rooms = []
+        self.locations = {}
+        for room in rooms:
+            self.add_room(room)
+        for agent, location in (locations or {}).items():
+            self.move(agent, location)
+
+    @classmethod
+    def parse(cls, world: str) -> "WorldState":
+        """
+        :param world: World state in the prompt format.
+        """
+        return cls().repaired(world)[0]
+
+    def copy(self) -> "WorldState":
+        state = type(self)()
+        state.rooms = list(self.rooms)
+        state.locations = dict(self.locations)
+        return state
+
+    @staticmethod
+    def clean_name(name: str) -> str:
+        """
+        :return: The name with the format's separators replaced by spaces, so it renders and parses back unchanged.
+        """
+        return " ".join(SEPARATORS.sub(" ", name).split())
+
+    @staticmethod
+    def check_name(name: str) -> str:
+        if not name or SEPARATORS.search(name):
+            raise ValueError(f"World state names must be non-empty and free of ',', ':', '[' and ']': {name!r}")
+        return name
+
+    def add_room(self, location: str) -> str:
+        self.check_name(location)
+        if location != UNKNOWN and location not in self.rooms:
+            self.rooms.append(location)
+        return location
+
+    def move(self, agent: str, location: str) -> None:
+        self.locations[self.check_name(agent)] = self.add_room(location)
+
+    def empty_text(self) -> str:
+        """
+        :return: What an empty location shows: the placeholder until the first agent is placed.
+        """
+        return PLACEHOLDER if not self.locations else ""
+
+    def render(self) -> str:
+        """
+        :return: The world state in the prompt format, with Unknown last.
+        """
+        occupants = {room: [] for room in self.rooms + ([UNKNOWN] if self.SHOW_UNKNOWN else [])}
+        for agent, location in self.locations.items():
+            occupants.setdefault(location, []).append(agent)
+        empty = self.empty_text()
+        return ", ".join(f"{room}: [{', '.join(agents) or empty}]" for room, agents in occupants.items())
+
+    @staticmethod
+    def parse_entries(world: str) -> list:
+        """
+        :return: (location, agents) pairs found in a world state string, placeholders dropped.
+        """
+        entries = []
+        for location, agents in WORLD_ENTRY_PATTERN.findall(world):
+            names = [agent.strip() for agent in agents.split(",")]
+            entries.append((location.strip(), [name for name in names if name and name != PLACEHOLDER]))
+        return entries
+
+    def repaired(self, world: str) -> tuple["WorldState", bool]:
+        """
+        Read a world state written by the LLM as an update of this state.
+
+        Output without any "Location: [...]" entry leaves the state unchanged. Agents the output
+        leaves out stay where they were, and an agent listed in several locations goes to one it
+        was not in before (the move the update describes). Agent names containing separators
+        (e.g. "Mia: moved") cannot be told apart from the format and are dropped, as are entries
+        without a location name (e.g. ": [Mia]").
+
+        :param world: The LLM's world state string.
+        :return: The new state, and whether the output needed repair.
+        """
+        entries = self.parse_entries(world)
+        if not entries:
+            return self.copy(), True
+        state = self.copy()
+        candidates = {}
+        repaired = False
+        for location, agents in entries:
+            location = self.clean_name(location)
+            if not location:
+                repaired = True
+                continue
+            state.add_room(location)
+            for agent in agents:
+                candidates.setdefault(agent, []).append(location)
+        for agent in [agent for agent in candidates if SEPARATORS.search(agent)]:
+            del candidates[agent]
+            repaired = True
+        for agent, locations in candidates.items():
+            moved = [location for location in locations if location != self.locations.get(agent)]
+            state.move(agent, moved[-1] if moved else locations[-1])
+            repaired = repaired or len(set(locations)) > 1
+        repaired = repaired or any(agent not in candidates for agent in self.locations)
+        return state, repaired
+
+    def diff(self, after: "WorldState") -> tuple:
+        """
+        :return: (rooms added, (agent, location) moves) that turn this state into `after`.
+        """
+        added = tuple(room for room in after.rooms if room not in self.rooms)
+        moves = tuple((agent, location) for agent, location in after.locations.items() if self.locations.get(agent) != location)
+        return added, moves
+
+    def apply_diff(self, diff: tuple) -> None:
+        added, moves = diff
+        for room in added:
+            self.add_room(room)
+        for agent, location in moves:
+            self.move(agent, location)
+
+
+class ConversationState(WorldState):
+    """
+    FanToM world: who is in and out of the conversation. As in the prompts it was designed with,
+    it has no Unknown location, and empty sides show the placeholder.
+    """
+    __slots__ = ()
+    SHOW_UNKNOWN = False
+
+    def empty_text(self) -> str:
+        return PLACEHOLDER
+
+
+class WorldTrajectory:
+    """
+    The world state before each statement of a story, stored as diffs rather than snapshots.
+
+    Indexing renders the world before a statement in the prompt format, so a trajectory can
+    stand in for a list of world strings. Statements that change nothing store an empty diff.
+    """
+    __slots__ = ("diffs", "checkpoints", "last")
+
+    def __init__(self):
+        self.diffs = []
+        self.checkpoints = []
+        self.last = None
+
+    def record(self, state: WorldState) -> None:
+        """
+        Append the world state before the next statement.
+        """
+        self.diffs.append(((), ()) if self.last is None else self.last.diff(state))
+        if (len(self.diffs) - 1) % CHECKPOINT_INTERVAL == 0:
+            self.checkpoints.append(state.copy())
+        self.last = state.copy()
+
+    def changes(self) -> int:
+        """
+        :return: Number of statements after which the world changed.
+        """
+        return sum(1 for added, moves in self.diffs if added or moves)
+
+    def state(self, index: int) -> WorldState:
+        state = self.checkpoints[index // CHECKPOINT_INTERVAL].copy()
+        for diff in self.diffs[index - index % CHECKPOINT_INTERVAL + 1:index + 1]:
+            state.apply_diff(diff)
+        return state
+
+    def __len__(self) -> int:
+        return len(self.diffs)
+
+    def __getitem__(self, index: int) -> str:
+        return self.state(index).render()
+
+
+class HitomWorldTracker(WorldState):
+    """
+    Deterministic world-state tracker for HiToM stories.
+
+    Agent locations are updated from the fixed HiToM sentence templates. Sentences that
+    match no template are reported to the caller so it can fall back to the LLM.
+    """
+    __slots__ = ()
+
+    def matches(self, sentence: str) -> bool:
+        """
+        :param sentence: A single story statement.
+        :return: Whether the statement follows a known HiToM template.
+        """
+        sentence = sentence.strip()
+        if ENTER_PATTERN.match(sentence) or EXIT_PATTERN.match(sentence):
+            return True
+        return any(pattern.match(sentence) for pattern in STATIC_PATTERNS)
+
+    def apply(self, sentence: str) -> bool:
+        """
+        Update agent locations after a statement.
+
+        :param sentence: A single story statement.
+        :return: True if the statement was understood (whether or not anyone moved), False otherwise.
+        """
+        sentence = sentence.strip()
+        match = ENTER_PATTERN.match(sentence)
+        if match:
+            for agent in re.split(r", | and ", match.group("agents")):
+                self.move(agent, match.group("location"))
+            return True
+        match = EXIT_PATTERN.match(sentence)
+        if match:
+            self.add_room(match.group("location"))
+            self.locations[match.group("agent")] = UNKNOWN
+            return True
+        return any(pattern.match(sentence) for pattern in STATIC_PATTERNS)
+
+    def load(self, world: str) -> bool:
+        """
+        Replace agent locations with those in a world state string (e.g. an LLM update), repaired as in WorldState.repaired.
+
+        :param world: World state in the prompt format.
+        :return: Whether the string needed repair.
+        """
+        state, repaired = self.repaired(world)
+        self.rooms, self.locations = state.rooms, state.locations
+        return repaired